@@ -0,0 +1,354 @@
+"""
+Reproducible performance benchmarks for the SmartCity System.
+
+Every run builds cities of the requested sizes from one seed, measures tick,
+status, report and grid load-shedding latency plus memory, measures road network queries and
+a burst through the security incident pipeline, cold start in fresh
+interpreters, writes the results as JSON (to the temp directory unless --output
+is given) and compares them against a stored baseline. Timings are compared
+relative to a fixed calibration workload timed in the same run, so machine
+speed and load cancel out. The exit code is 1 if any metric regressed by more
+than the tolerance.
+
+    python3 benchmark.py                              # default scales, compare with baseline
+    python3 benchmark.py --scales 10,1000 --repeat 3
+    python3 benchmark.py --save-baseline              # record the current numbers as the baseline
+    python3 benchmark.py --scales 10 --no-startup --no-network --no-incidents   # city scales only
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Add the project root to the path to allow for relative imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from core.controller import SmartCityController
+from core.simulation.scheduler import VirtualClock
+from core.rng.streams import RandomStreams
+from modules.transport.manager import TransportManager
+from modules.lighting.manager import LightingManager
+from modules.security.manager import SecurityManager
+from modules.energy.manager import EnergyManager, meters_for
+from modules.transport.network import RoadNetwork
+from modules.security.incidents import IncidentPipeline, event_stream
+
+DEFAULT_SCALES = (10, 1_000, 100_000, 1_000_000)
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(PROJECT_ROOT, "benchmark_baseline.json")
+# Results go outside the source tree by default.
+DEFAULT_OUTPUT = os.path.join(tempfile.gettempdir(), "smartcity_benchmark_results.json")
+# Metrics compared against the baseline; all of them are "lower is better".
+TIMED_METRICS = ("tick_s", "status_cold_s", "status_warm_s", "report_s", "grid_s")
+MEMORY_METRICS = ("build_peak_bytes", "fleet_bytes")
+STARTUP_METRICS = ("import_s", "first_status_s", "modules_loaded")
+NETWORK_METRICS = ("build_s", "index_s", "query_s", "corridor_s")
+INCIDENT_METRICS = ("ingest_s", "peak_bytes")
+# Run in a fresh interpreter under -X importtime: a CLI call that needs one subsystem.
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+from core.controller import get_controller
+get_controller().get_subsystem_status("transport")
+print(time.perf_counter() - start, len(sys.modules))
+"""
+
+def build_city(components, seed):
+    """
+    Builds a fresh set of subsystem managers (outside the controller Singleton)
+    holding 'components' traffic and street lights in total, split evenly.
+    """
+    streams = RandomStreams(seed)
+    traffic_count = components // 2
+    city = {
+        "transport": TransportManager(fleet_size=traffic_count, rng=streams.stream("transport")),
+        "lighting": LightingManager(streams.stream("lighting"), fleet_size=components - traffic_count),
+        "security": SecurityManager(streams.stream("security")),
+        "energy": EnergyManager(streams.stream("energy"), VirtualClock()),
+    }
+    for meter in meters_for(city["transport"], city["lighting"], city["security"]):
+        city["energy"].add_meter(meter)
+    return city
+
+def tick(city):
+    """One simulation cycle, as SmartCityController.run_simulation() performs it."""
+    for name, action in SmartCityController.SIMULATION_ACTIONS:
+        city[name].operate(action, detail=False)
+
+def all_status(city):
+    return {name: manager.get_status() for name, manager in city.items()}
+
+def measure(fn, repeat, setup=None):
+    """Median wall time of 'repeat' calls of fn() in seconds; setup() runs untimed before each call."""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+def calibrate(repeat=5, size=100_000):
+    """
+    Times a fixed pure-Python workload (a dict build and a sort of 'size'
+    seeded values) at least three times. 'reference_s' is the median, 'spread'
+    the range of the samples relative to it: compare() scales the baseline's
+    timings by the ratio of the two runs' 'reference_s' and widens the
+    tolerance by their 'spread'.
+    """
+    values = [random.Random(0).random() for _ in range(size)]
+    samples = []
+    for _ in range(max(repeat, 3)):
+        start = time.perf_counter()
+        index = {value: position for position, value in enumerate(values)}
+        sorted(index)
+        samples.append(time.perf_counter() - start)
+    reference = statistics.median(samples)
+    return {"reference_s": reference, "spread": (max(samples) - min(samples)) / reference}
+
+def bench_scale(components, repeat=5, seed=0):
+    tracemalloc.start()
+    city = build_city(components, seed)
+    build_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    fleets = (city["transport"].components, city["lighting"].lights)
+
+    def invalidate():
+        for fleet in fleets:
+            fleet.mark_all_dirty()
+
+    def next_report_window():
+        tick(city)
+        city["energy"].clock.advance(900)
+
+    def balance_grid():
+        city["energy"].observe_load()
+        city["energy"].plan_load_shedding()
+
+    all_status(city)
+    return {
+        "components": sum(len(fleet) for fleet in fleets),
+        "tick_s": measure(lambda: tick(city), repeat),
+        "status_cold_s": measure(lambda: all_status(city), repeat, setup=invalidate),
+        "status_warm_s": measure(lambda: all_status(city), repeat),
+        "report_s": measure(lambda: city["energy"].operate("report_consumption"), repeat, setup=next_report_window),
+        "grid_s": measure(balance_grid, repeat, setup=lambda: tick(city)),
+        "build_peak_bytes": build_peak,
+        "fleet_bytes": sum(fleet.nbytes for fleet in fleets),
+    }
+
+def bench_network(intersections=50_000, radius=500.0, queries=1000, seed=0):
+    """
+    Road network costs on a square grid of about 'intersections' nodes 200 m
+    apart: CSR build time, spatial index build time, mean time of a 'radius'
+    query at random points, and one corner-to-corner shortest path.
+    """
+    side = math.isqrt(intersections)
+    start = time.perf_counter()
+    network = RoadNetwork.grid(side, side)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    network.index
+    index = time.perf_counter() - start
+    rng = random.Random(seed)
+    extent = (side - 1) * 200.0
+    points = [(rng.uniform(0, extent), rng.uniform(0, extent)) for _ in range(queries)]
+    start = time.perf_counter()
+    for x, y in points:
+        network.within(x, y, radius)
+    query = (time.perf_counter() - start) / queries
+    start = time.perf_counter()
+    network.shortest_path(0, len(network) - 1)
+    return {
+        "intersections": len(network),
+        "build_s": build,
+        "index_s": index,
+        "query_s": query,
+        "corridor_s": time.perf_counter() - start,
+        "network_bytes": network.nbytes,
+    }
+
+def bench_incidents(events_per_second=50_000, seconds=1.0, zones=1000, seed=0):
+    """
+    A burst of 'events_per_second' camera/sensor events for 'seconds' through an
+    IncidentPipeline: 'ingest_s' is the wall time of generating and processing
+    it, 'peak_bytes' the peak traced memory of a second, identical run.
+    """
+    def burst():
+        pipeline = IncidentPipeline(zones)
+        pipeline.ingest(event_stream(random.Random(seed), zones, events_per_second, seconds))
+        return pipeline
+
+    start = time.perf_counter()
+    pipeline = burst()
+    ingest = time.perf_counter() - start
+    tracemalloc.start()
+    burst()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    metrics = pipeline.metrics()
+    return {
+        "events": metrics["events"],
+        "incidents": metrics["incidents"],
+        "shed_high": metrics["shed"]["high"] + metrics["shed"]["critical"],
+        "ingest_s": ingest,
+        "peak_bytes": peak,
+    }
+
+def import_time(stderr, module="core.controller"):
+    """Cumulative import time of 'module' in seconds, parsed from -X importtime output."""
+    for line in stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6
+    raise ValueError(f"No -X importtime entry for {module}.")
+
+def bench_startup(repeat=5):
+    """
+    Cold start in fresh interpreters (median of 'repeat' runs): 'import_s' is the
+    cumulative import time of core.controller, 'first_status_s' the wall time of
+    importing it and fetching one subsystem's status, 'modules_loaded' the size
+    of sys.modules afterwards.
+    """
+    imports, firsts, modules = [], [], []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT],
+                                 cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+        first, loaded = process.stdout.splitlines()[-1].split()
+        imports.append(import_time(process.stderr))
+        firsts.append(float(first))
+        modules.append(int(loaded))
+    return {
+        "import_s": statistics.median(imports),
+        "first_status_s": statistics.median(firsts),
+        "modules_loaded": max(modules),
+    }
+
+def run_benchmarks(scales=DEFAULT_SCALES, repeat=5, seed=0, startup=True, network=True, incidents=True):
+    """Runs every scale (plus the network, incident and cold start runs) and returns the machine-readable result document."""
+    results = {
+        "seed": seed,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "calibration": calibrate(repeat),
+        "results": {str(scale): bench_scale(scale, repeat, seed) for scale in scales},
+    }
+    if network:
+        results["network"] = bench_network(seed=seed)
+    if incidents:
+        results["incidents"] = bench_incidents(seed=seed)
+    if startup:
+        results["startup"] = bench_startup(repeat)
+    return results
+
+def _regressions(label, metrics, reference, names, tolerance, noise_floor, speed=1.0, spread=0.0):
+    regressions = []
+    for metric in names:
+        if metric not in reference or metric not in metrics:
+            continue
+        limit = reference[metric] * (1 + tolerance)
+        if metric.endswith("_s"):
+            expected = reference[metric] * speed
+            limit = max(expected * (1 + tolerance + spread), expected + noise_floor)
+        if metrics[metric] > limit:
+            regressions.append(f"{label}: {metric} {metrics[metric]:.6g} > {limit:.6g} (baseline {reference[metric]:.6g})")
+    return regressions
+
+def compare(results, baseline, tolerance=0.5, noise_floor=1e-3):
+    """
+    Returns a list of regression messages: metrics that exceed the baseline value
+    by more than 'tolerance' (a fraction). When both documents carry a
+    'calibration', baseline timings are first scaled by the ratio of the two
+    runs' calibration times (so only slowdowns relative to the machine count)
+    and the tolerance grows by the larger calibration 'spread'. Timings must
+    also be at least 'noise_floor' seconds worse, so microsecond jitter at small
+    scales is ignored. Scales (or network/incident/startup results) missing
+    from either side are skipped.
+    """
+    speed, spread = 1.0, 0.0
+    if "calibration" in results and "calibration" in baseline:
+        current, reference = results["calibration"], baseline["calibration"]
+        speed = current["reference_s"] / reference["reference_s"]
+        spread = max(current["spread"], reference["spread"])
+    regressions = []
+    for scale, metrics in results["results"].items():
+        reference = baseline.get("results", {}).get(scale)
+        if reference is not None:
+            regressions += _regressions(f"{scale} components", metrics, reference,
+                                        TIMED_METRICS + MEMORY_METRICS, tolerance, noise_floor, speed, spread)
+    for section, names in (("network", NETWORK_METRICS), ("incidents", INCIDENT_METRICS), ("startup", STARTUP_METRICS)):
+        if section in results and section in baseline:
+            regressions += _regressions(section, results[section], baseline[section], names, tolerance, noise_floor,
+                                        speed, spread)
+    return regressions
+
+def print_table(results):
+    header = ("components",) + TIMED_METRICS + MEMORY_METRICS
+    print(" ".join(f"{column:>16}" for column in header))
+    for metrics in results["results"].values():
+        row = [f"{metrics['components']:>16}"]
+        row += [f"{metrics[m] * 1000:>14.3f}ms" for m in TIMED_METRICS]
+        row += [f"{metrics[m]:>16}" for m in MEMORY_METRICS]
+        print(" ".join(row))
+    network = results.get("network")
+    if network is not None:
+        print(f"network: {network['intersections']} intersections, build {network['build_s'] * 1000:.1f}ms, "
+              f"index {network['index_s'] * 1000:.1f}ms, 500 m query {network['query_s'] * 1e6:.1f}us, "
+              f"corridor {network['corridor_s'] * 1000:.1f}ms")
+    incidents = results.get("incidents")
+    if incidents is not None:
+        print(f"incidents: {incidents['events']} events in {incidents['ingest_s'] * 1000:.1f}ms, "
+              f"{incidents['incidents']} incidents, peak {incidents['peak_bytes']} bytes")
+    startup = results.get("startup")
+    if startup is not None:
+        print(f"startup: import {startup['import_s'] * 1000:.1f}ms, first status {startup['first_status_s'] * 1000:.1f}ms, "
+              f"{startup['modules_loaded']} modules loaded")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SmartCity System benchmarks")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)), help="comma-separated component counts")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to write the results (default: the temp directory)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--no-startup", action="store_true", help="skip the cold start measurements")
+    parser.add_argument("--no-network", action="store_true", help="skip the road network measurements")
+    parser.add_argument("--no-incidents", action="store_true", help="skip the incident pipeline burst")
+    args = parser.parse_args(argv)
+
+    scales = [int(scale) for scale in args.scales.split(",")]
+    results = run_benchmarks(scales, args.repeat, args.seed, startup=not args.no_startup,
+                             network=not args.no_network, incidents=not args.no_incidents)
+    print_table(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for message in regressions:
+        print(f"REGRESSION: {message}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import asyncio
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+def _timeout_for(name, timeout):
+    """'timeout' is either one value for every task or a {name: seconds} mapping."""
+    if isinstance(timeout, dict):
+        return timeout.get(name)
+    return timeout
+
+def timed_out_result(name):
+    return f"Error: Subsystem '{name}' timed out."
+
+def failed_result(name, exc):
+    return f"Error: Subsystem '{name}' failed: {exc}"
+
+def run_parallel(tasks, executor, timeout=None):
+    """
+    Runs every callable in 'tasks' ({name: callable}) on 'executor' concurrently.
+    Results are returned in the same order as 'tasks'. A task that misses its
+    timeout (measured from the start of the fan-out) or raises is reported as an
+    error string, so one stalled subsystem only costs its own timeout.
+    """
+    start = time.monotonic()
+    futures = {name: executor.submit(task) for name, task in tasks.items()}
+    results = {}
+    for name, future in futures.items():
+        limit = _timeout_for(name, timeout)
+        remaining = None if limit is None else max(0.0, start + limit - time.monotonic())
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError as exc:
+            # Before Python 3.11 this is not the builtin TimeoutError; a finished
+            # future raised it itself, which is a failure, not a timeout.
+            results[name] = failed_result(name, exc) if future.done() else timed_out_result(name)
+        except Exception as exc:
+            results[name] = failed_result(name, exc)
+    return results
+
+async def _run_one(name, task, timeout):
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(task), _timeout_for(name, timeout))
+    except asyncio.TimeoutError:
+        return timed_out_result(name)
+    except Exception as exc:
+        return failed_result(name, exc)
+
+async def arun_parallel(tasks, timeout=None):
+    """Asyncio counterpart of run_parallel(); blocking tasks run in worker threads."""
+    results = await asyncio.gather(*(_run_one(name, task, timeout) for name, task in tasks.items()))
+    return dict(zip(tasks, results))
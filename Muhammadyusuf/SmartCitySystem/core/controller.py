@@ -1,8 +1,36 @@
-from core.singleton.singleton import Singleton
-from modules.transport.manager import TransportManager
-from modules.lighting.manager import LightingManager
-from modules.security.manager import SecurityManager
-from modules.energy.manager import EnergyManager
+import threading
+from contextlib import ExitStack
+from functools import partial
+from core.singleton.singleton import Singleton, ConfigManager
+from core.simulation.scheduler import TickScheduler, WallClock
+from core.telemetry.store import TelemetryStore
+from core.events.feed import ChangeFeed, DROP_OLDEST
+from core.rng.streams import RandomStreams
+from core.instrumentation.metrics import MetricsRegistry, action_label
+from core.registry.subsystems import SubsystemRegistry
+# Thread/process pools, asyncio, mmap checkpoints and the subsystem modules are
+# imported on first use, so "import core.controller" stays cheap for short-lived
+# processes (see benchmark.py, "startup").
+
+# Fleet attribute of the subsystems with a columnar component fleet.
+FLEET_ATTRIBUTES = {"transport": "components", "lighting": "lights"}
+
+def _copy_status(value):
+    """Copies the dicts and lists of a status (tuples and scalars are immutable and shared)."""
+    if isinstance(value, dict):
+        return {key: _copy_status(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_status(item) for item in value]
+    return value
+
+def _legacy_states(metadata):
+    """Per-subsystem states (see checkpoint_state()) of a checkpoint written before they were kept per subsystem."""
+    return {
+        "transport": {"next_id": metadata["next_ids"]["transport"], "traffic": metadata.get("traffic")},
+        "lighting": {"light_class": metadata["light_class"], "next_id": metadata["next_ids"]["lighting"],
+                     "zones": metadata.get("lighting_zones")},
+        "security": metadata["security"],
+    }
 
 class SmartCityController(metaclass=Singleton):
     """
@@ -12,57 +40,408 @@ class SmartCityController(metaclass=Singleton):
     Design Pattern: Facade (Structural)
     Purpose: Provides a simplified interface to a complex subsystem (the entire SmartCity system).
     Usage: The main application interacts only with this controller, which manages all subsystems.
+
+    Subsystems live in a SubsystemRegistry and are built on first use, so e.g.
+    get_subsystem_status("transport") never imports the other subsystems.
+    'subsystems' ({name: "module:factory" or None}) adds, replaces or disables
+    subsystems; it defaults to ConfigManager's "subsystems" setting. Plugins
+    can also register through the "smartcity.subsystems" entry point group.
+
+    Thread safety: every manager serializes its own operate(), get_status() and
+    telemetry() with a per-manager lock, so concurrent operate_subsystem() calls
+    are safe; calls on different subsystems run concurrently, calls on the same
+    subsystem run one at a time. Checkpoints hold the locks of every manager
+    they touch. Component views mutated directly (e.g.
+    fleet[5].operate()) bypass these locks and are the caller's responsibility.
+
+    Several cities in one process: SmartCityController.detached(...) builds an
+    independent controller (see core.tenancy.host.CityHost). 'executor' lets
+    such controllers share one thread pool instead of each creating its own;
+    a shared pool is not shut down by close(). announce=False keeps the start-up banner off stdout.
+
+    Scenario sweeps (core.scenarios.runner) build one such controller per
+    scenario from a seed, fleet sizes and per-subsystem 'options'.
+
+    operate_subsystem() and get_subsystem_status() call the managers directly;
+    pipeline() wraps them in middleware (auth, metrics, rate limiting, caching,
+    coalescing of identical requests within a tick) returning Result objects.
     """
-    def __init__(self):
-        # Initialize all subsystem managers
-        # Note: These managers will be implemented in Phase 4.
-        # For now, we use placeholder classes to satisfy imports.
-        # The actual imports will be fixed when the managers are created.
-        # For now, I will assume the imports are correct and proceed.
-        self._transport_manager = TransportManager()
-        self._lighting_manager = LightingManager()
-        self._security_manager = SecurityManager()
-        self._energy_manager = EnergyManager()
-        self._subsystems = {
-            "transport": self._transport_manager,
-            "lighting": self._lighting_manager,
-            "security": self._security_manager,
-            "energy": self._energy_manager,
-        }
-        print("SmartCity System Controller Initialized.")
+    # The (subsystem, action) pairs performed by one simulation cycle, in order.
+    SIMULATION_ACTIONS = (
+        ("transport", "optimize_flow"),
+        ("lighting", "adjust_brightness"),
+        ("security", "run_patrol"),
+        ("energy", "report_consumption"),
+    )
+
+    def __init__(self, seed=None, fleet_sizes=None, subsystems=None, executor=None, announce=True, options=None):
+        # Every subsystem draws from its own seeded stream (see reseed()).
+        self._rng = RandomStreams(seed)
+        self._clock = WallClock()
+        self._feed = ChangeFeed()
+        # Optional {"transport": n, "lighting": n} overriding the default fleet sizes, and
+        # {subsystem: {option: value}} passed to the subsystem factories (e.g. lighting's "light_type").
+        options = {name: dict(values) for name, values in (options or {}).items()}
+        for name, size in (fleet_sizes or {}).items():
+            options.setdefault(name, {})["fleet_size"] = size
+        if subsystems is None:
+            subsystems = ConfigManager().get_setting("subsystems")
+        self._registry = SubsystemRegistry(subsystems, self._rng, options, self._clock, on_load=self._on_subsystem_load)
+        # Guards the lazily created thread pool and the snapshot cache.
+        self._lock = threading.Lock()
+        self._shared_executor = executor
+        self._executor = None
+        self._snapshot = {}
+        self._snapshot_versions = {}
+        self._metrics = MetricsRegistry()
+        self._telemetry = TelemetryStore()
+        if announce:
+            print("SmartCity System Controller Initialized.")
+
+    def _on_subsystem_load(self, name, manager):
+        change_sources = getattr(manager, "change_sources", None)
+        if change_sources is not None:
+            for source in change_sources():
+                self._feed.connect(name, source)
+
+    def _managers(self):
+        """Every subsystem's manager, building the ones not used yet."""
+        return self._registry.load_all()
+
+    def _get_executor(self):
+        """Thread pool used for concurrent fan-out: the shared one, or a private one created on first use."""
+        if self._shared_executor is not None:
+            return self._shared_executor
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=2 * len(self._registry.names()), thread_name_prefix="smartcity")
+        return self._executor
+
+    def _locked_subsystems(self):
+        """Context manager holding every manager's lock (always acquired in the same order)."""
+        stack = ExitStack()
+        for manager in self._managers().values():
+            stack.enter_context(manager.lock)
+        return stack
+
+    def close(self):
+        """Shuts down the thread pool; the controller stays usable and recreates it on demand."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    @property
+    def tick(self):
+        """Number of the current simulation cycle (see begin_cycle())."""
+        return self._feed.tick
+
+    def pipeline(self, *middleware):
+        """
+        A Pipeline sending operate and status requests through 'middleware'
+        stages (see core.middleware.pipeline) before they reach this facade.
+        Its batch() runs the requests of different subsystems on this
+        controller's thread pool.
+        """
+        from core.middleware.pipeline import Pipeline
+        return Pipeline(self, middleware, self._get_executor)
+
+    def reseed(self, seed):
+        """Re-seeds every subsystem's random stream, making later runs reproducible."""
+        self._rng.reseed(seed)
 
     def get_subsystem_names(self):
-        """Returns a list of available subsystem names."""
-        return list(self._subsystems.keys())
+        """Returns a list of available subsystem names (without building them)."""
+        return self._registry.names()
+
+    def loaded_subsystems(self):
+        """Names of the subsystems built so far."""
+        return list(self._registry.loaded())
+
+    def get_manager(self, subsystem_name):
+        """Returns the manager object behind a subsystem, building it on first use (None if unknown)."""
+        if subsystem_name in self._registry:
+            return self._registry.get(subsystem_name)
+        return None
 
     def get_subsystem_status(self, subsystem_name):
         """Facade method to get the status of a specific subsystem."""
-        if subsystem_name in self._subsystems:
-            return self._subsystems[subsystem_name].get_status()
+        manager = self.get_manager(subsystem_name)
+        if manager is not None:
+            if self._metrics.enabled:
+                return self._metrics.timed(subsystem_name, "get_status", manager.get_status)
+            return manager.get_status()
         return f"Error: Subsystem '{subsystem_name}' not found."
 
-    def operate_subsystem(self, subsystem_name, action=None):
-        """Facade method to perform an operation on a specific subsystem."""
-        if subsystem_name in self._subsystems:
-            return self._subsystems[subsystem_name].operate(action)
+    def operate_subsystem(self, subsystem_name, action=None, detail=True):
+        """
+        Facade method to perform an operation on a specific subsystem.
+        With detail=False managers skip building per-component change messages.
+        """
+        manager = self.get_manager(subsystem_name)
+        if manager is not None:
+            if self._metrics.enabled:
+                return self._metrics.timed(subsystem_name, action_label(manager, action), manager.operate, action, detail=detail)
+            return manager.operate(action, detail=detail)
         return f"Error: Subsystem '{subsystem_name}' not found."
 
-    def get_all_status(self):
-        """Facade method to get the status of all subsystems."""
+    def get_all_status(self, parallel=False, timeout=None):
+        """
+        Facade method to get the status of all subsystems.
+        With parallel=True (implied by a timeout) the subsystems are queried
+        concurrently; 'timeout' is seconds for every subsystem or a {name: seconds}
+        mapping, and a subsystem that misses it is reported as an error string.
+        """
+        if parallel or timeout is not None:
+            from core.concurrency.fanout import run_parallel
+            tasks = {name: manager.get_status for name, manager in self._managers().items()}
+            return run_parallel(tasks, self._get_executor(), timeout)
         all_status = {}
-        for name, manager in self._subsystems.items():
+        for name, manager in self._managers().items():
             all_status[name] = manager.get_status()
         return all_status
 
-    def run_simulation(self):
-        """A high-level operation to simulate a cycle of city management."""
-        print("\n--- Running SmartCity Simulation Cycle ---")
-        self.operate_subsystem("transport", "optimize_flow")
-        self.operate_subsystem("lighting", "adjust_brightness")
-        self.operate_subsystem("security", "run_patrol")
-        self.operate_subsystem("energy", "report_consumption")
+    def status_version(self):
+        """
+        A counter that grows whenever any subsystem's state changes.
+        Callers can compare it with a previous value for a cheap "has anything changed" check.
+
+        Contract: every manager's 'version' must grow whenever anything its
+        get_status() reports changes, including readings derived from other
+        subsystems (e.g. energy's consumption of the metered fleets). snapshot()
+        and the middleware caches rely on it.
+        """
+        return sum(manager.version for manager in self._registry.loaded().values())
+
+    def summary(self):
+        """Cheap overview for scripts: cycle tick, status version and fleet sizes (builds nothing)."""
+        return {"tick": self._feed.tick, "version": self.status_version(), "components": self._component_counts()}
+
+    def snapshot(self):
+        """
+        Cached variant of get_all_status(): a subsystem's status is only rebuilt
+        when its version changed since the previous snapshot, and fleet status
+        lists only re-render the components that changed. Simulated readings
+        (e.g. sensor values) are therefore as of the last state change. Callers
+        get copies of the cached dicts and lists (the component status tuples
+        are immutable and shared), so mutating a snapshot never alters the cache.
+        """
+        with self._lock:
+            for name, manager in self._managers().items():
+                version = manager.version
+                if self._snapshot_versions.get(name) != version or name not in self._snapshot:
+                    self._snapshot[name] = manager.get_status()
+                    self._snapshot_versions[name] = version
+            return {name: _copy_status(status) for name, status in self._snapshot.items()}
+
+    def enable_metrics(self, allocations=False):
+        """
+        Starts recording call counts and latency histograms for operate_subsystem()
+        and get_subsystem_status(). With allocations=True tracemalloc also records
+        the net bytes allocated per call (noticeably slower).
+        """
+        self._metrics.enable(allocations)
+
+    def disable_metrics(self):
+        self._metrics.disable()
+
+    def reset_metrics(self):
+        self._metrics.reset()
+
+    def _component_counts(self):
+        """Fleet sizes of the subsystems built so far (metrics never build a subsystem)."""
+        loaded = self._registry.loaded()
+        return {name: len(getattr(loaded[name], attribute)) for name, attribute in FLEET_ATTRIBUTES.items() if name in loaded}
+
+    def memory_usage(self):
+        """
+        Bytes held by each subsystem built so far: its 'nbytes' if the manager
+        reports one, otherwise the size of its component fleets.
+        """
+        usage = {}
+        for name, manager in self._registry.loaded().items():
+            nbytes = getattr(manager, "nbytes", None)
+            if nbytes is None:
+                sources = getattr(manager, "change_sources", tuple)()
+                nbytes = sum(getattr(source, "nbytes", 0) for source in sources)
+            usage[name] = nbytes
+        return usage
+
+    def metrics(self):
+        """
+        Returns the recorded metrics: per subsystem and action the call count,
+        mean/p50/p99 latency in seconds and allocated bytes, plus component counts.
+        """
+        return self._metrics.snapshot(self._component_counts())
+
+    def export_metrics(self, format="prometheus"):
+        """Renders metrics() as Prometheus text ('prometheus') or JSON ('json')."""
+        if format == "prometheus":
+            return self._metrics.to_prometheus(self._component_counts())
+        if format == "json":
+            return self._metrics.to_json(self._component_counts())
+        raise ValueError(f"Unknown metrics format '{format}'. Must be 'prometheus' or 'json'.")
+
+    def profile_cycle(self, sort="cumulative", limit=20, allocations=True, **kwargs):
+        """
+        Runs one run_simulation(**kwargs) under cProfile (and tracemalloc) and
+        returns a ProfileReport(result, stats, allocations).
+        """
+        from core.instrumentation.metrics import profile_call
+        return profile_call(partial(self.run_simulation, **kwargs), sort, limit, allocations)
+
+    def _checkpointed(self):
+        """The built subsystems that take part in checkpoints (managers with checkpoint_state())."""
+        return {name: manager for name, manager in self._managers().items() if hasattr(manager, "checkpoint_state")}
+
+    def _save_checkpoint(self, path, incremental):
+        from core.persistence.checkpoint import write_checkpoint
+        states, columns = {}, {}
+        for name, manager in self._checkpointed().items():
+            states[name], manager_columns = manager.checkpoint_state()
+            for column, values in manager_columns.items():
+                columns[f"{name}.{column}"] = values
+        metadata = {"tick": self._feed.tick, "subsystems": states, "rng": self._rng.getstate()}
+        return write_checkpoint(path, metadata, columns, incremental)
+
+    def save_checkpoint(self, path, incremental=True):
+        """
+        Saves the state of every built subsystem that has checkpoint_state()
+        (fleets, ID counters, traffic queues, lighting zones, patrol status,
+        incidents) plus the tick and RNG state to 'path' as page-aligned binary
+        columns and a JSON header. Re-saving to the same file only rewrites the
+        pages that changed (unless incremental=False). Returns write statistics.
+        """
+        with self._locked_subsystems():
+            return self._save_checkpoint(path, incremental)
+
+    def restore_checkpoint(self, path):
+        """
+        Restores the state saved by save_checkpoint() into the running managers
+        (each through its restore_state()); subsystems the checkpoint does not
+        hold keep their state.
+        """
+        with self._locked_subsystems():
+            self._restore_checkpoint(path)
+
+    def _restore_checkpoint(self, path):
+        from core.persistence.checkpoint import Checkpoint
+        with Checkpoint(path) as checkpoint:
+            metadata = checkpoint.metadata
+            states = metadata["subsystems"] if "subsystems" in metadata else _legacy_states(metadata)
+            for name, manager in self._checkpointed().items():
+                if name not in states:
+                    continue
+                prefix = f"{name}."
+                columns = {column[len(prefix):]: checkpoint.column(column)
+                           for column in checkpoint.layout if column.startswith(prefix)}
+                manager.restore_state(states[name], columns)
+        self._feed.tick = metadata["tick"]
+        self._rng.setstate(metadata["rng"])
+
+    def subscribe(self, maxsize=1024, policy=DROP_OLDEST, block_timeout=None):
+        """
+        Subscribes to the push-based change feed. The returned Subscription yields
+        ChangeEvent(subsystem, component_id, old, new, tick) tuples when iterated
+        (or async-iterated) and holds at most 'maxsize' pending events; 'policy'
+        ("drop_oldest", "drop_newest" or "block", which needs a finite
+        'block_timeout') handles a slow consumer.
+        Close it (or use it as a context manager) to stop receiving events.
+        """
+        return self._feed.subscribe(maxsize, policy, block_timeout)
+
+    def begin_cycle(self, announce=True):
+        """Starts a new simulation cycle; change events carry its tick number."""
+        self._feed.next_tick()
+        if announce:
+            print("\n--- Running SmartCity Simulation Cycle ---")
+
+    def set_clock(self, clock):
+        """Switches the clock used for telemetry timestamps and energy metering."""
+        self._clock = clock
+        self._registry.clock = clock
+        energy = self._registry.loaded().get("energy")
+        if energy is not None:
+            energy.set_clock(clock)
+
+    def scheduler(self, periods=None, clock=None, catch_up=False, telemetry_period=None):
+        """
+        Returns a TickScheduler running each subsystem at its own period
+        ({name: seconds}; see DEFAULT_PERIODS) on 'clock' (default: a VirtualClock,
+        so e.g. scheduler().run_for(86400) simulates a day as fast as possible).
+        With 'telemetry_period' it also calls record_telemetry() at that period.
+        The controller switches to the scheduler's clock.
+        """
+        scheduler = TickScheduler(self, periods, clock, catch_up, telemetry_period=telemetry_period)
+        self.set_clock(scheduler.clock)
+        return scheduler
+
+    def record_telemetry(self):
+        """Records the current readings of every subsystem in use as "<subsystem>.<metric>" series."""
+        now = self._clock.now()
+        for name, manager in self._registry.loaded().items():
+            self._telemetry.record_many(name, now, manager.telemetry())
+        return now
+
+    def query_telemetry(self, name, start, end, resolution=None):
+        """
+        Range query on a telemetry series. 'resolution' is "raw", "1m" or "1h";
+        by default the finest one still holding data back to 'start' is used.
+        """
+        return self._telemetry.query(name, start, end, resolution)
+
+    def telemetry_names(self):
+        return self._telemetry.names()
+
+    async def aget_all_status(self, timeout=None):
+        """Asyncio variant of get_all_status(parallel=True)."""
+        from core.concurrency.fanout import arun_parallel
+        tasks = {name: manager.get_status for name, manager in self._managers().items()}
+        return await arun_parallel(tasks, timeout)
+
+    def _simulation_actions(self):
+        """SIMULATION_ACTIONS of the subsystems that are not disabled."""
+        return [(name, action) for name, action in self.SIMULATION_ACTIONS if name in self._registry]
+
+    def _simulation_tasks(self):
+        return {name: partial(self.operate_subsystem, name, action, detail=False) for name, action in self._simulation_actions()}
+
+    def _run_cycle(self, parallel, timeout, announce):
+        self.begin_cycle(announce)
+        if parallel or timeout is not None:
+            from core.concurrency.fanout import run_parallel
+            run_parallel(self._simulation_tasks(), self._get_executor(), timeout)
+        else:
+            for name, action in self._simulation_actions():
+                self.operate_subsystem(name, action, detail=False)
+
+    def run_simulation(self, parallel=False, timeout=None):
+        """
+        A high-level operation to simulate a cycle of city management.
+        With parallel=True (implied by a timeout) the subsystems operate concurrently.
+        """
+        self._run_cycle(parallel, timeout, announce=True)
+        print("--- Simulation Cycle Complete ---")
+        return self.get_all_status(parallel, timeout)
+
+    def run_cycles(self, count, parallel=False):
+        """
+        Runs 'count' simulation cycles without printing or building statuses
+        (for batch runs and the service mode); returns the last cycle's tick.
+        """
+        for _ in range(count):
+            self._run_cycle(parallel, None, announce=False)
+        return self._feed.tick
+
+    async def arun_simulation(self, timeout=None):
+        """Asyncio variant of run_simulation(parallel=True)."""
+        from core.concurrency.fanout import arun_parallel
+        self.begin_cycle()
+        await arun_parallel(self._simulation_tasks(), timeout)
         print("--- Simulation Cycle Complete ---")
-        return self.get_all_status()
+        return await self.aget_all_status(timeout)
 
 # Helper function to get the controller instance
 def get_controller():
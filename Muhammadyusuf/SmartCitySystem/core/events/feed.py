@@ -0,0 +1,174 @@
+import threading
+from collections import deque, namedtuple
+from functools import partial
+
+# One component state change; 'tick' is the simulation cycle it happened in.
+ChangeEvent = namedtuple("ChangeEvent", ("subsystem", "component_id", "old", "new", "tick"))
+
+# What a full subscriber queue does with a new event.
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+# How long an async consumer's worker thread waits per get() before checking in again.
+ASYNC_POLL_SECONDS = 0.1
+
+class Subscription:
+    """
+    A bounded queue of ChangeEvents for one consumer.
+    Iterate it (blocking) or 'async for' over it; iteration ends once it is closed.
+    When the queue is full the 'policy' decides: drop the oldest queued event,
+    drop the new event, or block the publisher until there is room or until
+    'block_timeout' expires, after which the event is dropped. Dropped events
+    are counted in 'dropped'.
+
+    Events are published from inside operate(), while the subsystem's lock is
+    held, so BLOCK stalls that subsystem for up to 'block_timeout' seconds and
+    requires a finite one: a consumer that queried the same subsystem before
+    draining would otherwise deadlock with it.
+    """
+    def __init__(self, feed, maxsize=1024, policy=DROP_OLDEST, block_timeout=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy '{policy}'. Must be one of {POLICIES}.")
+        if policy == BLOCK and (block_timeout is None or block_timeout < 0):
+            raise ValueError("The 'block' policy needs a finite block_timeout (seconds).")
+        self._feed = feed
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.closed = False
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def put(self, event):
+        with self._cond:
+            if self.closed:
+                return
+            if len(self._queue) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                if self.policy == BLOCK:
+                    has_room = lambda: self.closed or len(self._queue) < self.maxsize
+                    if not self._cond.wait_for(has_room, self.block_timeout) or self.closed:
+                        self.dropped += 1
+                        return
+                else:
+                    self._queue.popleft()
+                    self.dropped += 1
+            self._queue.append(event)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Returns the next event, or None if the subscription is closed or 'timeout' expires."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._queue or self.closed, timeout) or not self._queue:
+                return None
+            event = self._queue.popleft()
+            self._cond.notify_all()
+            return event
+
+    def drain(self):
+        """Returns every queued event without blocking."""
+        with self._cond:
+            events = list(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+            return events
+
+    def stream(self, timeout=None):
+        """Yields events until closed, or until no event arrives for 'timeout' seconds."""
+        while True:
+            event = self.get(timeout)
+            if event is None:
+                return
+            yield event
+
+    def __iter__(self):
+        return self.stream()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = self.get(timeout=0)
+        if event is None and not self.closed:
+            # Only park a worker thread when there is nothing to hand out yet, and only
+            # briefly: a cancelled consumer leaves no thread blocked in get() behind.
+            # (asyncio is imported here: an async consumer has loaded it already.)
+            import asyncio
+            while event is None and not self.closed:
+                event = await asyncio.to_thread(self.get, ASYNC_POLL_SECONDS)
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    def __len__(self):
+        return len(self._queue)
+
+    def close(self):
+        """Stops the subscription; queued events can still be drained."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._feed.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ChangeFeed:
+    """
+    Design Pattern: Observer (Behavioral)
+    Purpose: Pushes component state changes to any number of subscribers.
+    Usage: Sources (fleets, the security system) expose a 'change_listener' slot.
+    The feed only fills those slots while it has subscribers, so an unobserved
+    city pays nothing for it.
+    """
+    def __init__(self):
+        self.tick = 0
+        self._sources = []
+        self._subscribers = ()
+        self._lock = threading.Lock()
+
+    def connect(self, subsystem, source):
+        """Registers an object with a 'change_listener' attribute as a source of 'subsystem' events."""
+        with self._lock:
+            self._sources.append((subsystem, source))
+            source.change_listener = partial(self.publish, subsystem) if self._subscribers else None
+
+    def next_tick(self):
+        self.tick += 1
+        return self.tick
+
+    def subscribe(self, maxsize=1024, policy=DROP_OLDEST, block_timeout=None):
+        subscription = Subscription(self, maxsize, policy, block_timeout)
+        with self._lock:
+            self._subscribers += (subscription,)
+            if len(self._subscribers) == 1:
+                self._set_listeners(True)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription not in self._subscribers:
+                return
+            self._subscribers = tuple(s for s in self._subscribers if s is not subscription)
+            if not self._subscribers:
+                self._set_listeners(False)
+
+    def _set_listeners(self, active):
+        for subsystem, source in self._sources:
+            source.change_listener = partial(self.publish, subsystem) if active else None
+
+    def publish(self, subsystem, component_id, old, new):
+        event = ChangeEvent(subsystem, component_id, old, new, self.tick)
+        for subscription in self._subscribers:
+            subscription.put(event)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
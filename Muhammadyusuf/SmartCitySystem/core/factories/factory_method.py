@@ -5,6 +5,8 @@ class SmartCityComponent(ABC):
     """
     Abstract base class for all SmartCity components (lights, vehicles, sensors, etc.).
     """
+    __slots__ = ()
+
     @abstractmethod
     def operate(self):
         pass
@@ -24,3 +26,10 @@ class ComponentFactory(ABC):
     def create_component(self) -> SmartCityComponent:
         """The Factory Method declaration."""
         pass
+
+    def create_many(self, count):
+        """
+        Creates 'count' components. Factories backed by a fleet override this to
+        allocate them in one step; the default falls back to create_component().
+        """
+        return [self.create_component() for _ in range(count)]
@@ -0,0 +1,184 @@
+from array import array
+from collections.abc import Sequence
+
+def uniform_bytes(rng, count, low, high):
+    """
+    Draws 'count' uniform integers in [low, high] (high <= 255) as a bytes object.
+    Random bytes are drawn in bulk and mapped through a translation table; bytes
+    that would bias the result are rejected, so usually a single draw suffices.
+    """
+    span = high - low + 1
+    limit = 256 - 256 % span
+    table = bytes(low + b % span for b in range(256))
+    reject = bytes(range(limit, 256))
+    out = b""
+    while len(out) < count:
+        missing = count - len(out)
+        raw = rng.randbytes(missing * 256 // limit + 16)
+        out += raw.translate(table, reject)
+    return out[:count]
+
+class ComponentFleet(Sequence):
+    """
+    Columnar store for a fleet of homogeneous SmartCity components.
+    Instead of one Python object (and one __dict__) per component, every component
+    is a row: its ID lives in a typed 'ids' column and its single small state value
+    (an enum code or a percentage) lives in a 'values' byte column.
+    Indexing the fleet returns a lightweight __slots__ view implementing the
+    SmartCityComponent API, so existing callers keep working unchanged.
+
+    The fleet tracks which rows changed since the status list was last rendered
+    ('version' grows on every change), so statuses() only re-renders dirty rows
+    and hands out the same immutable tuple while nothing changed.
+    While a ChangeFeed observes the fleet, 'change_listener' is called with
+    (component_id, old, new) for every row whose value actually changed.
+    """
+    view_class = None
+    default_value = 0
+
+    def __init__(self, view_class=None):
+        if view_class is not None:
+            self.view_class = view_class
+        self.ids = array("q")
+        self.values = bytearray()
+        self.version = 0
+        self._statuses = []
+        self._status_tuple = ()
+        self._dirty = set()
+        self._all_dirty = False
+        self.change_listener = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.view(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("fleet index out of range")
+        return self.view(index)
+
+    def view(self, index):
+        """Returns the component view for row 'index' (no bounds check)."""
+        return self.view_class.from_fleet(self, index)
+
+    def append(self, component_id, value=None):
+        """Adds one component and returns its row index."""
+        self.ids.append(component_id)
+        self.values.append(self.default_value if value is None else value)
+        self.version += 1
+        return len(self.ids) - 1
+
+    def extend(self, first_id, count, value=None):
+        """Adds 'count' components with contiguous IDs starting at 'first_id'."""
+        self.ids.extend(range(first_id, first_id + count))
+        self.values.extend(bytes((self.default_value if value is None else value,)) * count)
+        self.version += 1
+
+    def load_columns(self, ids, values):
+        """Replaces both columns (e.g. from a checkpoint) with one bulk copy each."""
+        self.ids = array("q")
+        self.ids.frombytes(ids)
+        self.values = bytearray(values)
+        self._statuses = []
+        self.mark_all_dirty()
+
+    def set_value(self, index, value):
+        """Sets one row's value and marks it dirty."""
+        old = self.values[index]
+        self.values[index] = value
+        self._dirty.add(index)
+        self.version += 1
+        if self.change_listener is not None and old != value:
+            decode = self.view_class.decode_value
+            self.change_listener(self.ids[index], decode(old), decode(value))
+
+    def fill(self, start, stop, value):
+        """Sets rows start..stop-1 to 'value' in one slice assignment and marks them dirty."""
+        listener = self.change_listener
+        old_values = bytes(self.values[start:stop]) if listener is not None else None
+        self.values[start:stop] = bytes((value,)) * (stop - start)
+        if not self._all_dirty:
+            self._dirty.update(range(start, stop))
+        self.version += 1
+        if listener is not None:
+            decode = self.view_class.decode_value
+            for component_id, old in zip(self.ids[start:stop], old_values):
+                if old != value:
+                    listener(component_id, decode(old), decode(value))
+
+    def load_values(self, buffer):
+        """Replaces the whole value column (e.g. from shared memory) and marks every row dirty."""
+        listener = self.change_listener
+        old_values = bytes(self.values) if listener is not None else None
+        self.values[:] = buffer
+        self.mark_all_dirty()
+        if listener is not None:
+            decode = self.view_class.decode_value
+            for component_id, old, new in zip(self.ids, old_values, self.values):
+                if old != new:
+                    listener(component_id, decode(old), decode(new))
+
+    def mark_all_dirty(self):
+        self._all_dirty = True
+        self._dirty.clear()
+        self.version += 1
+
+    def statuses(self):
+        """
+        Returns the get_status() string of every component as a tuple.
+        Only rows changed since the previous call (or new rows) are re-rendered,
+        and while nothing changed the previous tuple itself is returned (O(1)).
+        """
+        cache = self._statuses
+        if not self._all_dirty and not self._dirty and len(cache) == len(self.ids) == len(self._status_tuple):
+            return self._status_tuple
+        render = self.view_class.render_status
+        if self._all_dirty:
+            cache[:] = map(render, self.ids, self.values)
+        else:
+            ids, values = self.ids, self.values
+            for index in self._dirty:
+                if index < len(cache):
+                    cache[index] = render(ids[index], values[index])
+            if len(cache) < len(ids):
+                start = len(cache)
+                cache.extend(map(render, ids[start:], values[start:]))
+        self._dirty.clear()
+        self._all_dirty = False
+        self._status_tuple = tuple(cache)
+        return self._status_tuple
+
+    @property
+    def nbytes(self):
+        """Approximate memory used by the column data."""
+        return self.ids.itemsize * len(self.ids) + len(self.values)
+
+class FleetView:
+    """
+    Mixin for components stored in a ComponentFleet.
+    A view only holds a reference to its fleet and its row index.
+    """
+    __slots__ = ("_fleet", "_index")
+
+    @staticmethod
+    def decode_value(value):
+        """Maps a stored value to the state reported in change events."""
+        return value
+
+    @classmethod
+    def from_fleet(cls, fleet, index):
+        view = cls.__new__(cls)
+        view._fleet = fleet
+        view._index = index
+        return view
+
+    def __eq__(self, other):
+        if not isinstance(other, FleetView):
+            return NotImplemented
+        return self._fleet is other._fleet and self._index == other._index
+
+    def __hash__(self):
+        return hash((id(self._fleet), self._index))
@@ -0,0 +1,180 @@
+import json
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from collections import namedtuple
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style.
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ProfileReport = namedtuple("ProfileReport", ("result", "stats", "allocations"))
+
+# Label of actions a manager does not declare in its ACTIONS (and of unknown subsystems), so
+# client-supplied names cannot grow the number of series without bound.
+OTHER = "other"
+
+def action_label(manager, action):
+    """The metric label for 'action' on 'manager': the action if the manager declares it in ACTIONS, else OTHER."""
+    return action if action in getattr(manager, "ACTIONS", ()) else OTHER
+
+def _label_value(value):
+    """Escapes a Prometheus label value (backslash, double quote and newline)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; quantiles are estimated by interpolating within a bucket."""
+    __slots__ = ("counts", "count", "total", "alloc_bytes")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.alloc_bytes = 0
+
+    def observe(self, seconds, alloc_bytes=0):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.alloc_bytes += alloc_bytes
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and seen + bucket_count >= rank:
+                low = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                high = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1]
+                return low + (high - low) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return LATENCY_BUCKETS[-1]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_s": self.total / self.count if self.count else 0.0,
+            "p50_s": self.quantile(0.5),
+            "p99_s": self.quantile(0.99),
+            "alloc_bytes": self.alloc_bytes,
+        }
+
+class MetricsRegistry:
+    """
+    Per-(subsystem, action) call counts, latency histograms and allocation deltas.
+    Instrumented callers check 'enabled' before timing anything, so a disabled
+    registry costs one attribute lookup per call. Allocation deltas need
+    tracemalloc and are only collected with enable(allocations=True).
+    """
+    def __init__(self):
+        self.enabled = False
+        self.allocations = False
+        # True if enable() started tracemalloc; a session the caller started is never stopped here.
+        self._owns_tracing = False
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def enable(self, allocations=False):
+        self.allocations = allocations
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracing = True
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self._owns_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._owns_tracing = False
+        self.allocations = False
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def timed(self, subsystem, action, fn, *args, **kwargs):
+        """Calls fn(*args, **kwargs) and records its latency under (subsystem, action)."""
+        allocations = self.allocations and tracemalloc.is_tracing()
+        before = tracemalloc.get_traced_memory()[0] if allocations else 0
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            delta = tracemalloc.get_traced_memory()[0] - before if allocations else 0
+            self.observe(subsystem, action, elapsed, delta)
+
+    def observe(self, subsystem, action, seconds, alloc_bytes=0):
+        with self._lock:
+            histogram = self._histograms.get((subsystem, action))
+            if histogram is None:
+                histogram = self._histograms[(subsystem, action)] = LatencyHistogram()
+            histogram.observe(seconds, alloc_bytes)
+
+    def snapshot(self, gauges=None):
+        """Returns {"operations": {subsystem: {action: summary}}, "components": gauges}."""
+        operations = {}
+        with self._lock:
+            for (subsystem, action), histogram in self._histograms.items():
+                operations.setdefault(subsystem, {})[str(action)] = histogram.summary()
+        return {"enabled": self.enabled, "operations": operations, "components": dict(gauges or {})}
+
+    def to_json(self, gauges=None):
+        return json.dumps(self.snapshot(gauges), indent=2)
+
+    def to_prometheus(self, gauges=None, prefix="smartcity"):
+        """Renders the registry in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {prefix}_operation_seconds Latency of controller operations.",
+            f"# TYPE {prefix}_operation_seconds histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items(), key=lambda item: (item[0][0], str(item[0][1])))
+            for (subsystem, action), histogram in histograms:
+                labels = f'subsystem="{_label_value(subsystem)}",action="{_label_value(action)}"'
+                cumulative = 0
+                for bound, bucket_count in zip(LATENCY_BUCKETS, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{prefix}_operation_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_operation_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{prefix}_operation_seconds_sum{{{labels}}} {histogram.total}")
+                lines.append(f"{prefix}_operation_seconds_count{{{labels}}} {histogram.count}")
+            lines.append(f"# HELP {prefix}_allocated_bytes_total Net bytes allocated by controller operations.")
+            lines.append(f"# TYPE {prefix}_allocated_bytes_total counter")
+            for (subsystem, action), histogram in histograms:
+                labels = f'subsystem="{_label_value(subsystem)}",action="{_label_value(action)}"'
+                lines.append(f"{prefix}_allocated_bytes_total{{{labels}}} {histogram.alloc_bytes}")
+        lines.append(f"# HELP {prefix}_components Number of components per subsystem.")
+        lines.append(f"# TYPE {prefix}_components gauge")
+        for subsystem, count in (gauges or {}).items():
+            lines.append(f'{prefix}_components{{subsystem="{_label_value(subsystem)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+def profile_call(fn, sort="cumulative", limit=20, allocations=True):
+    """
+    Runs fn() under cProfile (and tracemalloc when 'allocations' is true).
+    Returns a ProfileReport with fn's result, the top 'limit' pstats lines and
+    the top 'limit' allocation sites as strings.
+    """
+    # The profiler modules are only needed here; importing them lazily keeps startup cheap.
+    import cProfile
+    import io
+    import pstats
+    started_tracing = allocations and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    before = tracemalloc.take_snapshot() if allocations else None
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(fn)
+        top_allocations = []
+        if allocations:
+            diff = tracemalloc.take_snapshot().compare_to(before, "lineno")
+            top_allocations = [str(stat) for stat in diff[:limit]]
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+    return ProfileReport(result, out.getvalue(), top_allocations)
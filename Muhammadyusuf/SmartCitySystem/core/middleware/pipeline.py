@@ -0,0 +1,333 @@
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from core.instrumentation.metrics import OTHER, MetricsRegistry, action_label
+
+# Request kinds.
+OPERATE, STATUS = "operate", "status"
+# Where a Result came from.
+EXECUTED, COALESCED, CACHED, DENIED, LIMITED, NOT_FOUND = "executed", "coalesced", "cached", "denied", "limited", "not_found"
+
+class Request:
+    """One operate or status call on a subsystem, as it travels through a Pipeline."""
+    __slots__ = ("kind", "subsystem", "action", "detail", "role")
+
+    def __init__(self, kind, subsystem, action=None, detail=False, role=None):
+        self.kind = kind
+        self.subsystem = subsystem
+        self.action = action
+        self.detail = detail
+        self.role = role
+
+    @property
+    def key(self):
+        """Identifies identical requests (the caller's role is not part of it)."""
+        return (self.kind, self.subsystem, self.action, self.detail)
+
+    @property
+    def permission(self):
+        """The AccessPolicy action checked for this request: "<subsystem>.<action>" or "<subsystem>.status"."""
+        return f"{self.subsystem}.{self.action if self.kind == OPERATE else STATUS}"
+
+    def __repr__(self):
+        return f"Request({self.kind!r}, {self.subsystem!r}, {self.action!r})"
+
+class Result:
+    """
+    The structured outcome of a Request: 'value' is what the manager returned
+    (an operate message or a status dict), 'tick' the simulation cycle it was
+    produced in and 'source' how it was obtained (EXECUTED, COALESCED, CACHED,
+    or DENIED / LIMITED / NOT_FOUND with 'error' set). The display string is
+    only built when 'text' is read.
+    """
+    __slots__ = ("request", "ok", "value", "error", "tick", "source")
+
+    def __init__(self, request, ok, value=None, error=None, tick=None, source=EXECUTED):
+        self.request = request
+        self.ok = ok
+        self.value = value
+        self.error = error
+        self.tick = tick
+        self.source = source
+
+    def reused(self, request, source):
+        """This result handed to another caller ('request') as COALESCED or CACHED."""
+        return Result(request, self.ok, self.value, self.error, self.tick, source)
+
+    @property
+    def text(self):
+        """The result as the facade would have reported it."""
+        if not self.ok:
+            return f"Error: {self.error}"
+        if self.request.kind == STATUS:
+            return f"[{self.request.subsystem.capitalize()}]: {self.value}"
+        return str(self.value)
+
+    def as_dict(self):
+        """JSON-serializable form (the line protocol's {"ok", "result" | "error"} plus provenance)."""
+        if self.ok:
+            return {"ok": True, "result": self.value, "tick": self.tick, "source": self.source}
+        return {"ok": False, "error": self.error, "tick": self.tick, "source": self.source}
+
+    def __repr__(self):
+        return f"Result({self.request!r}, ok={self.ok}, source={self.source!r}, tick={self.tick})"
+
+class Pipeline:
+    """
+    Design Pattern: Chain of Responsibility (Behavioral)
+    Purpose: Wraps the controller facade in composable middleware stages.
+    Usage: SmartCityController.pipeline(AuthMiddleware(...), MetricsMiddleware(), ...).
+
+    A middleware is any callable stage(request, call_next) returning a Result:
+    it may answer on its own (deny, rate-limit, serve from cache) or pass the
+    request on with call_next(request). Stages run in the order given; the last
+    one hands the request to the controller. The chain is composed once, so a
+    call costs one function call per stage.
+
+    batch() is the batching stage: it groups requests per subsystem and runs
+    each group as one task, in order, with the groups of different subsystems
+    running concurrently on the controller's thread pool. A group does not
+    hold its subsystem's lock in between requests: a coalesced request may
+    wait for an identical one running elsewhere, which needs that lock.
+    """
+    def __init__(self, controller, middleware=(), get_executor=None):
+        self.controller = controller
+        self.middleware = list(middleware)
+        # Returns the thread pool batch() runs subsystem groups on (None: run them in the calling thread).
+        self._get_executor = get_executor
+        handler = self._execute
+        for stage in reversed(self.middleware):
+            handler = partial(stage, call_next=handler)
+        self._handler = handler
+
+    def _execute(self, request):
+        controller = self.controller
+        manager = controller.get_manager(request.subsystem)
+        if manager is None:
+            return Result(request, False, error=f"Subsystem '{request.subsystem}' not found.", tick=controller.tick,
+                          source=NOT_FOUND)
+        if request.kind == OPERATE:
+            value = controller.operate_subsystem(request.subsystem, request.action, detail=request.detail)
+        else:
+            value = controller.get_subsystem_status(request.subsystem)
+        return Result(request, True, value, tick=controller.tick)
+
+    def handle(self, request):
+        """Runs one Request through the middleware chain."""
+        return self._handler(request)
+
+    def operate(self, subsystem, action=None, detail=False, role=None):
+        return self._handler(Request(OPERATE, subsystem, action, detail, role))
+
+    def status(self, subsystem, role=None):
+        return self._handler(Request(STATUS, subsystem, role=role))
+
+    def _run_group(self, requests):
+        return [self._handler(request) for request in requests]
+
+    def batch(self, requests, parallel=True):
+        """
+        Runs many requests, grouped per subsystem; returns their Results in the
+        order of 'requests'. Within a group the requests keep their order.
+        """
+        requests = list(requests)
+        groups = {}
+        for index, request in enumerate(requests):
+            groups.setdefault(request.subsystem, []).append(index)
+        tasks = []
+        for indices in groups.values():
+            tasks.append((indices, partial(self._run_group, [requests[i] for i in indices])))
+        results = [None] * len(requests)
+        executor = self._get_executor() if parallel and len(tasks) > 1 and self._get_executor is not None else None
+        if executor is None:
+            outputs = [task() for _, task in tasks]
+        else:
+            outputs = [future.result() for future in [executor.submit(task) for _, task in tasks]]
+        for (indices, _), output in zip(tasks, outputs):
+            for index, result in zip(indices, output):
+                results[index] = result
+        return results
+
+class AuthMiddleware:
+    """
+    Checks every request against an Authorizer (see core.proxy.access) before
+    it runs: the request's role must be allowed its 'permission'
+    ("<subsystem>.<action>" or "<subsystem>.status"). Requests without a role
+    use 'default_role'.
+    """
+    def __init__(self, authorizer, default_role="guest"):
+        self.authorizer = authorizer
+        self.default_role = default_role
+
+    def __call__(self, request, call_next):
+        role = request.role or self.default_role
+        if not self.authorizer.authorize(role, request.permission):
+            return Result(request, False, error=f"Role '{role}' may not perform '{request.permission}'.", source=DENIED)
+        return call_next(request)
+
+class MetricsMiddleware:
+    """
+    Records the latency callers see per (subsystem, action), in a
+    MetricsRegistry of its own unless one is given, and counts results per
+    source (executed, coalesced, cached, denied, ...).
+
+    Subsystem and action names come from clients, so only the actions a
+    manager declares in its ACTIONS get a label of their own; other actions
+    and unknown subsystems are recorded as "other".
+    """
+    def __init__(self, controller, registry=None):
+        if registry is None:
+            registry = MetricsRegistry()
+            registry.enable()
+        self.registry = registry
+        self.controller = controller
+        self.sources = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, request, call_next):
+        manager = self.controller.get_manager(request.subsystem)
+        subsystem = request.subsystem if manager is not None else OTHER
+        action = action_label(manager, request.action) if request.kind == OPERATE else "get_status"
+        start = time.perf_counter()
+        result = call_next(request)
+        self.registry.observe(subsystem, action, time.perf_counter() - start)
+        with self._lock:
+            self.sources[result.source] = self.sources.get(result.source, 0) + 1
+        return result
+
+    def snapshot(self):
+        return dict(self.registry.snapshot(), sources=dict(self.sources))
+
+class RateLimitMiddleware:
+    """
+    Token bucket per (role, subsystem): 'rate' requests per second on average,
+    bursts of up to 'burst'. Requests over the limit are answered as LIMITED
+    without reaching the subsystem.
+    """
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, request, call_next):
+        key = (request.role, request.subsystem)
+        now = self.clock()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        if not allowed:
+            return Result(request, False, error=f"Rate limit exceeded for '{request.subsystem}'.", source=LIMITED)
+        return call_next(request)
+
+class CacheMiddleware:
+    """
+    Serves status requests from cache while the subsystem's version is
+    unchanged (the manager's 'version' grows with every state change), across
+    ticks. Operate requests always pass through.
+    """
+    def __init__(self, controller, maxsize=256):
+        self.controller = controller
+        self.maxsize = maxsize
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, request, call_next):
+        manager = self.controller.get_manager(request.subsystem) if request.kind == STATUS else None
+        version = getattr(manager, "version", None)
+        if version is None:
+            return call_next(request)
+        with self._lock:
+            entry = self._entries.get(request.key)
+        if entry is not None and entry[0] == version:
+            return entry[1].reused(request, CACHED)
+        result = call_next(request)
+        if result.ok:
+            with self._lock:
+                if len(self._entries) >= self.maxsize and request.key not in self._entries:
+                    self._entries.pop(next(iter(self._entries)))
+                self._entries[request.key] = (version, result)
+        return result
+
+class CoalesceMiddleware:
+    """
+    Identical requests within one simulation tick share one execution.
+
+    The first of a set of identical requests (same kind, subsystem, action and
+    detail) runs; callers arriving while it runs wait for it, and callers
+    arriving later in the same tick get its Result without running anything
+    (source COALESCED). A new tick starts afresh. Status requests are also
+    keyed by the subsystem's version, so they never return a status older
+    than the latest change; only the newest version's result is kept.
+    Requests of different roles never share a result, and a failed result
+    (e.g. DENIED) is never handed to waiting callers.
+
+    Operate requests usually change state, and a caller handed a coalesced
+    result has not changed anything, so operates only coalesce for the
+    actions listed in 'actions' (default: none), e.g. {"report_consumption"},
+    where one report per tick serves every caller.
+    """
+    def __init__(self, controller, actions=None):
+        self.controller = controller
+        self.actions = frozenset(actions or ())
+        self.executions = 0
+        self.coalesced = 0
+        self._tick = None
+        self._results = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, request, call_next):
+        if request.kind == OPERATE:
+            if request.action not in self.actions:
+                return call_next(request)
+            version = None
+        else:
+            version = getattr(self.controller.get_manager(request.subsystem), "version", None)
+        # Callers of different roles never share results, whatever the order of the stages.
+        key = request.key + (request.role,)
+        flight = key + (version,)
+        tick = self.controller.tick
+        with self._lock:
+            if tick != self._tick:
+                self._tick = tick
+                self._results.clear()
+            entry = self._results.get(key)
+            result = entry[1] if entry is not None and entry[0] == version else None
+            future = self._inflight.get(flight) if result is None else None
+            owner = result is None and future is None
+            if owner:
+                future = self._inflight[flight] = Future()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if result is not None:
+            return result.reused(request, COALESCED)
+        if not owner:
+            shared = future.result()
+            if shared.ok:
+                return shared.reused(request, COALESCED)
+            # A failed execution (denied, limited, ...) is not passed on: this caller runs on its own.
+            with self._lock:
+                self.coalesced -= 1
+                self.executions += 1
+            return call_next(request)
+        try:
+            result = call_next(request)
+        except BaseException as exc:
+            with self._lock:
+                del self._inflight[flight]
+            future.set_exception(exc)
+            raise
+        with self._lock:
+            del self._inflight[flight]
+            # Only successful results of the current tick are shared with later callers, and only the
+            # newest version's per request: a service that never advances the tick keeps one entry each.
+            if result.ok and self._tick == tick:
+                self._results[key] = (version, result)
+        future.set_result(result)
+        return result
@@ -0,0 +1,128 @@
+import json
+import mmap
+import os
+import struct
+
+MAGIC = b"SCCKPT01"
+PAGE_SIZE = mmap.PAGESIZE
+# Magic, size of the header region, length of the JSON document inside it.
+_PREFIX = struct.Struct("<8sII")
+
+def _align(size):
+    return -(-size // PAGE_SIZE) * PAGE_SIZE
+
+def _layout(views, header_size):
+    """Page-aligned {name: [offset, nbytes]} for every column, plus the total file size."""
+    layout, offset = {}, header_size
+    for name, view in views.items():
+        layout[name] = [offset, view.nbytes]
+        offset = _align(offset + view.nbytes)
+    return layout, offset
+
+def _encode_header(metadata, layout, typecodes, header_size):
+    document = json.dumps({"metadata": metadata, "columns": layout, "typecodes": typecodes}, separators=(",", ":")).encode()
+    return _PREFIX.pack(MAGIC, header_size, len(document)) + document
+
+def _read_header(buffer):
+    magic, header_size, length = _PREFIX.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError("Not a SmartCity checkpoint file.")
+    document = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + length]))
+    return header_size, document
+
+def _existing_header(path):
+    try:
+        with open(path, "rb") as f:
+            prefix = f.read(_PREFIX.size)
+            _, header_size, _ = _PREFIX.unpack(prefix)
+            return _read_header(prefix + f.read(header_size - _PREFIX.size))
+    except (FileNotFoundError, ValueError, json.JSONDecodeError, struct.error):
+        return None
+
+def write_checkpoint(path, metadata, columns, incremental=True):
+    """
+    Writes 'metadata' (JSON-serializable) and 'columns' ({name: array or bytearray})
+    to 'path'. Every column starts on a page boundary. With incremental=True and
+    an existing checkpoint of the same layout, only the pages whose bytes changed
+    are rewritten in place through mmap; otherwise the file is rewritten.
+    Returns {"incremental", "pages_written", "pages_total", "bytes_written"}.
+    """
+    views = {name: memoryview(column).cast("B") for name, column in columns.items()}
+    try:
+        return _write(path, metadata, columns, views, incremental)
+    finally:
+        # A bytearray cannot be resized while a view of it is alive.
+        for view in views.values():
+            view.release()
+
+def _write(path, metadata, columns, views, incremental):
+    typecodes = {name: getattr(column, "typecode", "B") for name, column in columns.items()}
+    old = _existing_header(path) if incremental else None
+    header_size = old[0] if old is not None else PAGE_SIZE
+    # The header size determines the offsets, which are part of the header: grow until it fits.
+    while True:
+        layout, total = _layout(views, header_size)
+        header = _encode_header(metadata, layout, typecodes, header_size)
+        if len(header) <= header_size:
+            break
+        header_size = _align(len(header) + len(header) // 4)
+
+    if old is not None and old[0] == header_size and old[1]["columns"] == layout and os.path.getsize(path) == total:
+        return _patch_pages(path, header.ljust(header_size, b"\0"), layout, views, total)
+
+    with open(path, "wb") as f:
+        f.write(header.ljust(header_size, b"\0"))
+        for name, view in views.items():
+            f.seek(layout[name][0])
+            f.write(view)
+        f.truncate(total)
+    return {"incremental": False, "pages_written": total // PAGE_SIZE, "pages_total": total // PAGE_SIZE, "bytes_written": total}
+
+def _patch_pages(path, header, layout, views, total):
+    pages = 0
+    with open(path, "r+b") as f, mmap.mmap(f.fileno(), total) as mm:
+        regions = [(0, memoryview(header))] + [(layout[name][0], view) for name, view in views.items()]
+        for offset, view in regions:
+            for start in range(0, view.nbytes, PAGE_SIZE):
+                chunk = view[start:start + PAGE_SIZE]
+                if mm[offset + start:offset + start + len(chunk)] != chunk:
+                    mm[offset + start:offset + start + len(chunk)] = chunk
+                    pages += 1
+        mm.flush()
+    return {"incremental": True, "pages_written": pages, "pages_total": total // PAGE_SIZE, "bytes_written": pages * PAGE_SIZE}
+
+class Checkpoint:
+    """
+    A checkpoint file mapped read-only. column(name) returns a zero-copy
+    memoryview into the mapping; use it as a context manager so the views are
+    released before the mapping is closed.
+    """
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mm)
+        self._views = []
+        _, document = _read_header(self._mm)
+        self.metadata = document["metadata"]
+        self.layout = document["columns"]
+        self.typecodes = document["typecodes"]
+
+    def column(self, name):
+        offset, nbytes = self.layout[name]
+        view = self._buffer[offset:offset + nbytes]
+        self._views.append(view)
+        return view
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        self._buffer.release()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
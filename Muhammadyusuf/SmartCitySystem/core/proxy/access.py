@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+
+audit_log = logging.getLogger("smartcity.security.audit")
+
+class AccessPolicy:
+    """
+    A compiled role -> action permission table.
+    Every action gets one bit; every role is stored as the bitmask of the actions
+    it may perform, so a check is one dict lookup and one AND. Changing the
+    policy bumps 'version' and notifies listeners (e.g. decision caches).
+    """
+    def __init__(self, permissions=None):
+        self.version = 0
+        self._action_bits = {}
+        self._role_masks = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        for role, actions in (permissions or {}).items():
+            for action in actions:
+                self.grant(role, action)
+
+    def _bit(self, action):
+        if action not in self._action_bits:
+            self._action_bits[action] = 1 << len(self._action_bits)
+        return self._action_bits[action]
+
+    def allows(self, role, action):
+        bit = self._action_bits.get(action)
+        return bit is not None and bool(self._role_masks.get(role, 0) & bit)
+
+    def roles_for(self, action):
+        """Roles allowed to perform 'action', in the order they were granted."""
+        return [role for role in self._role_masks if self.allows(role, action)]
+
+    def permissions(self):
+        """The table as {role: frozenset(actions)}."""
+        return {role: frozenset(a for a, bit in self._action_bits.items() if mask & bit) for role, mask in self._role_masks.items()}
+
+    def grant(self, role, action):
+        with self._lock:
+            self._role_masks[role] = self._role_masks.get(role, 0) | self._bit(action)
+            self._changed()
+
+    def revoke(self, role, action):
+        with self._lock:
+            if action in self._action_bits and role in self._role_masks:
+                self._role_masks[role] &= ~self._action_bits[action]
+                self._changed()
+
+    def subscribe(self, listener):
+        """Calls listener() after every policy change."""
+        self._listeners.append(listener)
+
+    def _changed(self):
+        self.version += 1
+        for listener in self._listeners:
+            listener()
+
+class DecisionCache:
+    """
+    Bounded cache of authorization decisions with a time-to-live, for policies
+    whose allows() is expensive (an AccessPolicy check is cheaper than any
+    cache). Reads take no lock, so concurrent checks do not serialize; writes
+    evict the oldest entry once full. Entries are dropped wholesale by clear().
+    """
+    def __init__(self, maxsize=4096, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached decision, or None if absent or expired (hits/misses are approximate under threads)."""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < self.clock():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, decision):
+        with self._lock:
+            entries = self._entries
+            entries.pop(key, None)
+            entries[key] = (decision, self.clock() + self.ttl)
+            if len(entries) > self.maxsize:
+                del entries[next(iter(entries))]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class Authorizer:
+    """
+    Checks (role, action) against an AccessPolicy. The compiled bitmask is
+    checked directly; pass a DecisionCache only for a policy whose allows() is
+    expensive; it is cleared whenever the policy changes. Decisions go to the
+    "smartcity.security.audit" logger as structured records (denials at INFO,
+    grants at DEBUG); nothing is formatted unless that level is enabled.
+    """
+    def __init__(self, policy, cache=None):
+        self.policy = policy
+        self.cache = cache
+        if cache is not None:
+            policy.subscribe(cache.clear)
+
+    def authorize(self, role, action):
+        cache = self.cache
+        if cache is None:
+            allowed = self.policy.allows(role, action)
+        else:
+            # The policy version in the key keeps a decision computed during a change from outliving it.
+            key = (self.policy.version, role, action)
+            allowed = cache.get(key)
+            if allowed is None:
+                allowed = self.policy.allows(role, action)
+                cache.put(key, allowed)
+        level = logging.DEBUG if allowed else logging.INFO
+        if audit_log.isEnabledFor(level):
+            audit_log.log(level, "access %s: role=%s action=%s", "granted" if allowed else "denied", role, action,
+                          extra={"role": role, "action": action, "allowed": allowed})
+        return allowed
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from core.proxy.access import AccessPolicy, Authorizer
 
 class SubsystemInterface(ABC):
     """
@@ -21,9 +22,16 @@ class SubsystemProxy(SubsystemInterface):
     Purpose: Provides a surrogate or placeholder for another object to control access to it.
     Usage: Used to control access to the Security Subsystem based on user roles (e.g., only 'admin' can access certain features).
     """
-    def __init__(self, real_subsystem: RealSubsystem):
+    DEFAULT_PERMISSIONS = {"admin": {"request"}, "manager": {"request"}}
+
+    def __init__(self, real_subsystem: RealSubsystem, policy: AccessPolicy = None):
         self._real_subsystem = real_subsystem
-        self._allowed_roles = ["admin", "manager"]
+        self.policy = policy if policy is not None else AccessPolicy(self.DEFAULT_PERMISSIONS)
+        self._authorizer = Authorizer(self.policy)
+
+    @property
+    def _allowed_roles(self):
+        return self.policy.roles_for("request")
 
     def request(self, user_role: str):
         if self._check_access(user_role):
@@ -32,5 +40,4 @@ class SubsystemProxy(SubsystemInterface):
             return f"Proxy: Access denied for user role '{user_role}'. Must be one of {self._allowed_roles}."
 
     def _check_access(self, user_role: str) -> bool:
-        print(f"Proxy: Checking access for role '{user_role}'...")
-        return user_role in self._allowed_roles
+        return self._authorizer.authorize(user_role, "request")
@@ -0,0 +1,166 @@
+import importlib
+import importlib.util
+import threading
+
+# Entry point group scanned for third-party subsystems, e.g. in a plugin's pyproject.toml:
+#   [project.entry-points."smartcity.subsystems"]
+#   parking = "smartcity_parking.manager:create_manager"
+ENTRY_POINT_GROUP = "smartcity.subsystems"
+
+# Built-in subsystems in simulation order: name -> "module:factory".
+BUILTIN_SUBSYSTEMS = {
+    "transport": "modules.transport.manager:create_manager",
+    "lighting": "modules.lighting.manager:create_manager",
+    "security": "modules.security.manager:create_manager",
+    "energy": "modules.energy.manager:create_manager",
+}
+
+def check_spec(spec):
+    """
+    Validates a factory spec without building anything: a callable, an entry
+    point, or a "package.module:attribute" string naming an importable module
+    (found, not imported). Returns the module name for string specs; raises ValueError.
+    """
+    if callable(spec) or hasattr(spec, "load"):
+        return None
+    if not isinstance(spec, str):
+        raise ValueError(f"Invalid subsystem spec {spec!r}. Expected a factory or 'package.module:attribute'.")
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        raise ValueError(f"Invalid subsystem spec '{spec}'. Expected 'package.module:attribute'.")
+    try:
+        found = importlib.util.find_spec(module_name) is not None
+    except ImportError:
+        found = False
+    if not found:
+        raise ValueError(f"Invalid subsystem spec '{spec}': module '{module_name}' not found.")
+    return module_name
+
+def load_object(spec):
+    """Resolves a factory spec: a callable, an entry point, or a "package.module:attribute" string."""
+    if callable(spec):
+        return spec
+    if hasattr(spec, "load"):
+        return spec.load()
+    module_name = check_spec(spec)
+    attribute = spec.partition(":")[2]
+    obj = importlib.import_module(module_name)
+    for part in attribute.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+class SubsystemContext:
+    """
+    Everything a subsystem factory receives: the subsystem's name, its random
+    stream, its options (e.g. {"fleet_size": 1000}), the current clock, and
+    access to the other subsystems it depends on.
+    """
+    def __init__(self, registry, name, rng, options, clock):
+        self._registry = registry
+        self.name = name
+        self.rng = rng
+        self.options = options
+        self.clock = clock
+
+    def require(self, name):
+        """Returns another subsystem's manager, building it first if needed."""
+        return self._registry.get(name)
+
+    def optional(self, name):
+        """Like require(), but returns None if the subsystem is not registered."""
+        return self._registry.get(name) if name in self._registry else None
+
+class SubsystemRegistry:
+    """
+    Design Pattern: Registry with lazy initialization
+    Purpose: Knows which subsystems exist without importing or building them.
+    Usage: A manager is built by its factory on first get() (a subsystem
+    factory takes a SubsystemContext), so a process that only needs transport
+    never imports or builds the other subsystems.
+
+    Subsystems come from BUILTIN_SUBSYSTEMS, then 'specs' (name -> spec; None
+    disables a subsystem), then the ENTRY_POINT_GROUP entry points. Entry points
+    can only add new names, so they are scanned lazily: only when all names are
+    listed or an unknown name is requested. 'specs' are validated up front (see
+    check_spec()), so a typo fails when the registry is built, not on first use.
+    """
+    def __init__(self, specs=None, rng=None, options=None, clock=None, on_load=None, entry_points=True):
+        specs = specs or {}
+        self._specs = dict(BUILTIN_SUBSYSTEMS)
+        for name, spec in specs.items():
+            if spec is None:
+                self._specs.pop(name, None)
+            else:
+                check_spec(spec)
+                self._specs[name] = spec
+        self._declared = set(BUILTIN_SUBSYSTEMS) | set(specs)
+        self._scanned = not entry_points
+        self.rng = rng
+        self.options = options or {}
+        self.clock = clock
+        # Called as on_load(name, manager) after a manager is built.
+        self.on_load = on_load
+        self._managers = {}
+        self._building = set()
+        self._lock = threading.RLock()
+
+    def _scan_entry_points(self):
+        with self._lock:
+            if self._scanned:
+                return
+            from importlib.metadata import entry_points
+            for entry_point in sorted(entry_points(group=ENTRY_POINT_GROUP), key=lambda ep: ep.name):
+                if entry_point.name not in self._declared:
+                    self._specs[entry_point.name] = entry_point
+            self._scanned = True
+
+    def __contains__(self, name):
+        if name in self._specs:
+            return True
+        if name in self._declared:
+            return False
+        self._scan_entry_points()
+        return name in self._specs
+
+    def names(self):
+        """Every registered subsystem name, built or not."""
+        self._scan_entry_points()
+        return list(self._specs)
+
+    def get(self, name):
+        """Returns the manager for 'name', building it on first use. Raises KeyError if unknown."""
+        manager = self._managers.get(name)
+        if manager is not None:
+            return manager
+        if name not in self:
+            raise KeyError(name)
+        with self._lock:
+            if name in self._managers:
+                return self._managers[name]
+            if name in self._building:
+                raise RuntimeError(f"Circular dependency while building subsystem '{name}'.")
+            self._building.add(name)
+            try:
+                factory = load_object(self._specs[name])
+                rng = self.rng.stream(name) if self.rng is not None else None
+                context = SubsystemContext(self, name, rng, dict(self.options.get(name, {})), self.clock)
+                manager = factory(context)
+            finally:
+                self._building.discard(name)
+            # Finish wiring before publishing: get() reads _managers without the lock.
+            if self.on_load is not None:
+                self.on_load(name, manager)
+            self._managers[name] = manager
+            return manager
+
+    def is_loaded(self, name):
+        return name in self._managers
+
+    def loaded(self):
+        """The managers built so far, in registration order."""
+        managers = self._managers
+        return {name: managers[name] for name in self._specs if name in managers}
+
+    def load_all(self):
+        """Builds every registered subsystem and returns {name: manager} in registration order."""
+        return {name: self.get(name) for name in self.names()}
@@ -0,0 +1,41 @@
+import random
+
+class RandomStreams:
+    """
+    Named, independently seeded random.Random streams (one per subsystem).
+    Each stream is derived from the master seed and its own name, so drawing more
+    from one subsystem never shifts another subsystem's sequence.
+    With seed=None every stream is seeded from OS entropy, as the global RNG is.
+    """
+    def __init__(self, seed=None):
+        self.seed = seed
+        self._streams = {}
+
+    def _derive(self, name):
+        return None if self.seed is None else f"{self.seed}:{name}"
+
+    def stream(self, name):
+        """Returns the stream for 'name', creating it on first use."""
+        if name not in self._streams:
+            self._streams[name] = random.Random(self._derive(name))
+        return self._streams[name]
+
+    def reseed(self, seed):
+        """Re-seeds every stream in place, so holders of a stream see the new sequence."""
+        self.seed = seed
+        for name, rng in self._streams.items():
+            rng.seed(self._derive(name))
+
+    def getstate(self):
+        """JSON-serializable state of every stream (see setstate())."""
+        streams = {}
+        for name, rng in self._streams.items():
+            version, internal, gauss = rng.getstate()
+            streams[name] = [version, list(internal), gauss]
+        return {"seed": self.seed, "streams": streams}
+
+    def setstate(self, state):
+        """Restores the streams saved by getstate(), in place."""
+        self.seed = state["seed"]
+        for name, (version, internal, gauss) in state["streams"].items():
+            self.stream(name).setstate((version, tuple(internal), gauss))
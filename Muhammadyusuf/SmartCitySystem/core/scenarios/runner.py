@@ -0,0 +1,227 @@
+import itertools
+import math
+import os
+import time
+from array import array
+
+# Identifies a results file written by ScenarioResults.save().
+RESULTS_FORMAT = "smartcity-scenario-results"
+# Integer columns are stored as int64; integers beyond FLOAT_EXACT_MAX would be rounded in a float64 column.
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+FLOAT_EXACT_MAX = 2 ** 53
+# Simulated seconds per cycle in a scenario run (the lighting zones' default tick).
+DEFAULT_TICK_SECONDS = 60.0
+
+def read_command_log(path):
+    """
+    The commands recorded in a command log (see CommandProcessor's 'log'):
+    one line protocol command per line; blank lines and "#" comments are skipped.
+    """
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+def parse_value(text):
+    """A sweep value from the command line: int, then float, else the string itself."""
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+class Scenario:
+    """
+    One city configuration to simulate: a seed, per-subsystem 'options'
+    ({"lighting": {"fleet_size": 1000, "light_type": "halogen"}}), the number
+    of simulation cycles, and optionally recorded 'commands' replayed before
+    the cycles run. Scenarios are plain picklable objects, so they can be sent
+    to worker processes.
+    """
+    def __init__(self, name, seed=0, ticks=1, options=None, commands=(), subsystems=None,
+                 tick_seconds=DEFAULT_TICK_SECONDS):
+        self.name = name
+        self.seed = seed
+        self.ticks = ticks
+        self.options = {subsystem: dict(values) for subsystem, values in (options or {}).items()}
+        self.commands = list(commands)
+        self.subsystems = subsystems
+        self.tick_seconds = tick_seconds
+
+    def parameters(self):
+        """The scenario's settings as flat {"seed", "ticks", "<subsystem>.<option>"} columns."""
+        parameters = {"seed": self.seed, "ticks": self.ticks}
+        for subsystem, values in self.options.items():
+            for option, value in values.items():
+                parameters[f"{subsystem}.{option}"] = value
+        return parameters
+
+    def __repr__(self):
+        return f"Scenario({self.name!r}, {self.parameters()})"
+
+def parameter_grid(grid, seed=0, ticks=1, options=None, commands=(), subsystems=None):
+    """
+    One Scenario per combination of the values in 'grid', in itertools.product
+    order. Keys are "seed", "ticks" or "<subsystem>.<option>", e.g.
+    {"lighting.light_type": ["led", "halogen"], "lighting.fleet_size": [1000, 10000]}.
+    Settings not swept come from 'seed', 'ticks' and 'options'. Without a
+    "seed" key every scenario uses the same seed, so two scenarios only differ
+    in the swept parameters; sweep "seed" as well to get replicates.
+    """
+    keys = list(grid)
+    for key in keys:
+        if key not in ("seed", "ticks") and "." not in key:
+            raise ValueError(f"Invalid sweep parameter '{key}'. Expected 'seed', 'ticks' or '<subsystem>.<option>'.")
+    scenarios = []
+    for index, values in enumerate(itertools.product(*(grid[key] for key in keys))):
+        scenario = Scenario(f"scenario-{index + 1}", seed, ticks, options, commands, subsystems)
+        for key, value in zip(keys, values):
+            if key in ("seed", "ticks"):
+                setattr(scenario, key, value)
+            else:
+                subsystem, option = key.split(".", 1)
+                scenario.options.setdefault(subsystem, {})[option] = value
+        scenarios.append(scenario)
+    return scenarios
+
+def run_scenario(scenario):
+    """
+    Runs one scenario on a fresh detached controller (in the calling process)
+    and returns its result row: the scenario's name and parameters, the final
+    tick, CPU and wall time, memory, and every built subsystem's telemetry
+    readings as "<subsystem>.<metric>" columns.
+
+    The controller runs on a VirtualClock advanced 'tick_seconds' per cycle,
+    so a scenario's results depend only on its settings, never on timing.
+    """
+    from core.controller import SmartCityController
+    from core.service.line_protocol import CommandProcessor
+    from core.simulation.scheduler import VirtualClock
+    controller = SmartCityController.detached(scenario.seed, subsystems=scenario.subsystems, announce=False,
+                                              options=scenario.options)
+    clock = VirtualClock()
+    controller.set_clock(clock)
+    try:
+        started, cpu = time.perf_counter(), time.process_time()
+        failed = 0
+        if scenario.commands:
+            processor = CommandProcessor(controller)
+            for command in scenario.commands:
+                failed += not processor.execute(command)["ok"]
+        for _ in range(scenario.ticks):
+            clock.advance(scenario.tick_seconds)
+            controller.run_cycles(1)
+        cpu_s, elapsed_s = time.process_time() - cpu, time.perf_counter() - started
+        row = {"scenario": scenario.name}
+        row.update(scenario.parameters())
+        row.update(tick=controller.summary()["tick"], commands=len(scenario.commands), failed_commands=failed,
+                   cpu_s=cpu_s, elapsed_s=elapsed_s, memory_bytes=sum(controller.memory_usage().values()))
+        for name in controller.loaded_subsystems():
+            for metric, value in controller.get_manager(name).telemetry().items():
+                row[f"{name}.{metric}"] = value
+        return row
+    finally:
+        controller.close()
+
+class ScenarioResults:
+    """
+    Results of a sweep in columnar form: {column: [value per scenario]}, one
+    row per scenario in sweep order. Rows missing a column (e.g. a subsystem
+    another scenario disabled) hold None.
+
+    save() writes one results file: integer columns as int64 columns (with a
+    byte mask of the missing rows), other numeric columns as float64 columns
+    (missing rows as NaN) and the text columns (names, string parameters, and
+    numbers a 64-bit column cannot hold exactly) in the JSON header, in the
+    page-aligned checkpoint format (see core.persistence.checkpoint), so
+    load() maps the numbers back without parsing them.
+    """
+    def __init__(self, columns=None):
+        self.columns = {name: list(values) for name, values in (columns or {}).items()}
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = list(rows)
+        names = list(dict.fromkeys(name for row in rows for name in row))
+        return cls({name: [row.get(name) for row in rows] for name in names})
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def names(self):
+        return list(self.columns)
+
+    def rows(self):
+        """The results as one {column: value} dict per scenario."""
+        names = list(self.columns)
+        return [dict(zip(names, values)) for values in zip(*self.columns.values())]
+
+    def save(self, path):
+        from core.persistence.checkpoint import write_checkpoint
+        numeric, text, nulls = {}, {}, {}
+        for name, values in self.columns.items():
+            present = [value for value in values if value is not None]
+            if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in present):
+                text[name] = values
+            elif present and all(isinstance(value, int) and INT64_MIN <= value <= INT64_MAX for value in present):
+                numeric[name] = array("q", [0 if value is None else value for value in values])
+                if len(present) < len(values):
+                    nulls[name] = f"{name}:null"
+                    numeric[nulls[name]] = bytearray(value is None for value in values)
+            elif all(isinstance(value, float) or abs(value) <= FLOAT_EXACT_MAX for value in present):
+                numeric[name] = array("d", [math.nan if value is None else value for value in values])
+            else:
+                # Integers a double would round and an int64 cannot hold: kept exact in the header.
+                text[name] = values
+        metadata = {"format": RESULTS_FORMAT, "rows": len(self), "order": list(self.columns), "text": text,
+                    "nulls": nulls}
+        return write_checkpoint(path, metadata, numeric, incremental=False)
+
+    @classmethod
+    def load(cls, path):
+        from core.persistence.checkpoint import Checkpoint
+        with Checkpoint(path) as checkpoint:
+            metadata = checkpoint.metadata
+            if metadata.get("format") != RESULTS_FORMAT:
+                raise ValueError(f"'{path}' is not a scenario results file.")
+            # Files written before integer columns were stored as int64 flag them in "integer".
+            legacy_integer = set(metadata.get("integer", ()))
+            nulls = metadata.get("nulls", {})
+            columns = {}
+            for name in metadata["order"]:
+                if name in metadata["text"]:
+                    columns[name] = metadata["text"][name]
+                    continue
+                values = array(checkpoint.typecodes[name])
+                values.frombytes(checkpoint.column(name))
+                if values.typecode == "q":
+                    values = values.tolist()
+                    if name in nulls:
+                        missing = checkpoint.column(nulls[name])
+                        values = [None if missing[row] else value for row, value in enumerate(values)]
+                    columns[name] = values
+                else:
+                    columns[name] = [int(value) if name in legacy_integer else (None if math.isnan(value) else value)
+                                     for value in values]
+        return cls(columns)
+
+def run_sweep(scenarios, workers=None, chunksize=None):
+    """
+    Runs every scenario and returns their ScenarioResults, in scenario order.
+    With workers > 1 (default: one per CPU) the scenarios run in a pool of
+    worker processes, several per task ('chunksize', default: about four
+    tasks per worker) to keep the pickling overhead small; every scenario
+    builds its own seeded controller, so the results are the same as a serial
+    run's, whatever the number of workers.
+    """
+    scenarios = list(scenarios)
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(scenarios))
+    if workers <= 1:
+        return ScenarioResults.from_rows(run_scenario(scenario) for scenario in scenarios)
+    from concurrent.futures import ProcessPoolExecutor
+    chunksize = chunksize or max(1, len(scenarios) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return ScenarioResults.from_rows(pool.map(run_scenario, scenarios, chunksize=chunksize))
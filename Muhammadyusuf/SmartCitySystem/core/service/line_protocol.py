@@ -0,0 +1,189 @@
+import json
+import socketserver
+
+# Commands understood by CommandProcessor; one per line, or several separated by ";".
+HELP = (
+    "status [subsystem ...] | summary | operate <subsystem> <action> | run [cycles] | "
+    "version | names | ping | help | quit"
+)
+CHUNK_SIZE = 65536
+
+def dumps(value):
+    """Compact JSON, as every response is written."""
+    return json.dumps(value, separators=(",", ":"))
+
+class CommandProcessor:
+    """
+    Executes line protocol commands against a SmartCityController.
+    Each command line gets one compact JSON response line:
+    {"ok": true, "result": ...} or {"ok": false, "error": "..."}; a batch
+    ("cmd; cmd; ...") gets a JSON array of those responses.
+
+    With a 'log' (a text file), every state-changing command that actually
+    ran (operate, run) is appended to it as one line; replaying the log on a
+    city built with the same seed and options reproduces the run (see
+    core.scenarios.runner).
+
+    With a 'pipeline' (see SmartCityController.pipeline()), operate and
+    status commands go through its middleware, e.g. so identical requests of
+    many clients within one tick share one execution. An operate answered
+    without running (coalesced or cached) is not logged.
+    """
+    def __init__(self, controller, log=None, pipeline=None):
+        self.controller = controller
+        self.log = log
+        self.pipeline = pipeline
+        self.closed = False
+        self.commands = {
+            "status": self._status,
+            "summary": self._summary,
+            "operate": self._operate,
+            "run": self._run,
+            "version": lambda: self.controller.status_version(),
+            "names": lambda: self.controller.get_subsystem_names(),
+            "ping": lambda: "pong",
+            "help": lambda: HELP,
+            "quit": self._quit,
+        }
+
+    def _subsystem(self, name):
+        manager = self.controller.get_manager(name)
+        if manager is None:
+            raise ValueError(f"Subsystem '{name}' not found.")
+        return manager
+
+    def _through_pipeline(self, results):
+        for result in results:
+            if not result.ok:
+                raise ValueError(result.error)
+        return [result.value for result in results]
+
+    def _status(self, *names):
+        if self.pipeline is not None:
+            from core.middleware.pipeline import STATUS, Request
+            names = names or self.controller.get_subsystem_names()
+            values = self._through_pipeline(self.pipeline.batch([Request(STATUS, name) for name in names]))
+            return dict(zip(names, values))
+        if not names:
+            return self.controller.get_all_status()
+        for name in names:
+            self._subsystem(name)
+        return {name: self.controller.get_subsystem_status(name) for name in names}
+
+    def _summary(self):
+        return self.controller.summary()
+
+    def _record(self, *words):
+        if self.log is not None:
+            self.log.write(" ".join(words) + "\n")
+            self.log.flush()
+
+    def _operate(self, name, action):
+        if self.pipeline is not None:
+            from core.middleware.pipeline import EXECUTED
+            result = self.pipeline.operate(name, action)
+            value = self._through_pipeline([result])[0]
+            if result.source == EXECUTED:
+                self._record("operate", name, action)
+            return value
+        self._subsystem(name)
+        value = self.controller.operate_subsystem(name, action, detail=False)
+        self._record("operate", name, action)
+        return value
+
+    def _run(self, cycles="1"):
+        tick = self.controller.run_cycles(int(cycles))
+        self._record("run", cycles)
+        return {"tick": tick}
+
+    def _quit(self):
+        self.closed = True
+        return "bye"
+
+    def execute(self, command):
+        """Runs one command ("operate transport optimize_flow") and returns its response dict."""
+        words = command.split()
+        handler = self.commands.get(words[0]) if words else None
+        if handler is None:
+            return {"ok": False, "error": f"Unknown command '{command.strip()}'. Commands: {HELP}"}
+        try:
+            return {"ok": True, "result": handler(*words[1:])}
+        except (TypeError, ValueError) as exc:
+            return {"ok": False, "error": str(exc)}
+
+    def handle_line(self, line):
+        """Returns the response line for one request line."""
+        commands = [command for command in line.split(";") if command.strip()]
+        if len(commands) == 1:
+            return dumps(self.execute(commands[0]))
+        return dumps([self.execute(command) for command in commands])
+
+class LineProtocol:
+    """
+    Turns a byte stream of request lines into response bytes. Every chunk that
+    arrives is answered with a single write holding the responses to all the
+    complete lines in it, so pipelined clients get batched output while a
+    client waiting for each reply still gets it immediately.
+    """
+    def __init__(self, processor):
+        self.processor = processor
+        self._partial = b""
+
+    def feed(self, data):
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        responses = []
+        for line in lines:
+            if not line.strip():
+                continue
+            responses.append(self.processor.handle_line(line.decode()))
+            if self.processor.closed:
+                break
+        return "".join(response + "\n" for response in responses).encode()
+
+    def finish(self):
+        """Answers a last request line that had no trailing newline."""
+        data, self._partial = self._partial, b""
+        return self.feed(data + b"\n") if data.strip() else b""
+
+def serve(processor, read, write):
+    """
+    Serves one client: read(n) returns the next chunk (b"" at EOF), write(data)
+    sends responses. Returns when the client sends "quit" or closes its end.
+    """
+    protocol = LineProtocol(processor)
+    while not processor.closed:
+        data = read(CHUNK_SIZE)
+        if not data:
+            write(protocol.finish())
+            return
+        output = protocol.feed(data)
+        if output:
+            write(output)
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        serve(CommandProcessor(self.server.controller, pipeline=self.server.pipeline), self.request.recv, self.request.sendall)
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+def make_server(controller, port=None, path=None, pipeline=None):
+    """
+    A threading server for the line protocol on 127.0.0.1:'port' or on the Unix
+    socket 'path'. Each connection gets its own CommandProcessor; the controller
+    serializes concurrent operations per subsystem. A 'pipeline' is shared by
+    all connections, so its coalescing and caching work across clients.
+    """
+    if path is not None:
+        server = _UnixServer(path, _Handler)
+    else:
+        server = _TCPServer(("127.0.0.1", port or 0), _Handler)
+    server.controller = controller
+    server.pipeline = pipeline
+    return server
@@ -0,0 +1,116 @@
+import heapq
+import time
+
+# Default period (seconds of simulated time) between two runs of each subsystem.
+DEFAULT_PERIODS = {
+    "transport": 1.0,
+    "lighting": 60.0,
+    "security": 300.0,
+    "energy": 900.0,
+}
+# Job name of the periodic telemetry sample.
+TELEMETRY = "telemetry"
+
+class VirtualClock:
+    """Simulated time: sleeping jumps straight to the deadline, so runs go faster than real time."""
+    def __init__(self, start=0.0):
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def sleep_until(self, deadline):
+        if deadline > self._now:
+            self._now = deadline
+
+    def advance(self, seconds):
+        self._now += seconds
+
+    def format_time(self, seconds):
+        """A reading of this clock as simulated time since its start, e.g. "T+1:15:00"."""
+        minutes, second = divmod(round(seconds), 60)
+        hours, minute = divmod(minutes, 60)
+        return f"T+{hours}:{minute:02d}:{second:02d}"
+
+class WallClock:
+    """Real time in seconds since the clock was created, for live runs."""
+    def __init__(self):
+        self._origin = time.monotonic()
+        # Wall-clock time at the origin, to show readings as local timestamps.
+        self._epoch = time.time()
+
+    def now(self):
+        return time.monotonic() - self._origin
+
+    def format_time(self, seconds):
+        """A reading of this clock as a local timestamp, e.g. "2026-10-17 14:05:09"."""
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self._epoch + seconds))
+
+    def sleep_until(self, deadline):
+        delay = deadline - self.now()
+        if delay > 0:
+            time.sleep(delay)
+
+class TickScheduler:
+    """
+    Runs every subsystem's simulation action at its own period on a pluggable clock.
+    Runs due at the same instant share one change-feed tick. If a subsystem falls
+    behind by a whole period (the previous run overran), the scheduler skips the
+    runs it can no longer make and counts them as 'missed', unless catch_up=True,
+    in which case it runs them back to back. Runs that start more than 'tolerance'
+    seconds after their deadline are counted as 'late'. With 'telemetry_period'
+    the controller's record_telemetry() is scheduled like a subsystem.
+    """
+    def __init__(self, controller, periods=None, clock=None, catch_up=False, tolerance=0.05, telemetry_period=None):
+        self.controller = controller
+        self.clock = clock if clock is not None else VirtualClock()
+        self.periods = dict(DEFAULT_PERIODS if periods is None else periods)
+        if telemetry_period is not None:
+            self.periods[TELEMETRY] = telemetry_period
+        self.catch_up = catch_up
+        self.tolerance = tolerance
+        self.actions = dict(controller.SIMULATION_ACTIONS)
+        self.stats = {name: {"runs": 0, "late": 0, "missed": 0, "max_lateness_s": 0.0} for name in self.periods}
+        start = self.clock.now()
+        self._queue = []
+        for seq, name in enumerate(self.periods):
+            if name not in self.actions and name != TELEMETRY:
+                raise ValueError(f"No simulation action for subsystem '{name}'.")
+            heapq.heappush(self._queue, (start, seq, name))
+
+    def _run_one(self, due, seq, name):
+        stats = self.stats[name]
+        lateness = self.clock.now() - due
+        stats["runs"] += 1
+        if lateness > self.tolerance:
+            stats["late"] += 1
+        stats["max_lateness_s"] = max(stats["max_lateness_s"], lateness)
+        if name == TELEMETRY:
+            self.controller.record_telemetry()
+        else:
+            self.controller.operate_subsystem(name, self.actions[name], detail=False)
+
+        period = self.periods[name]
+        next_due = due + period
+        now = self.clock.now()
+        if not self.catch_up and next_due < now:
+            skipped = int((now - next_due) // period) + 1
+            stats["missed"] += skipped
+            next_due += skipped * period
+        heapq.heappush(self._queue, (next_due, seq, name))
+
+    def run_until(self, end):
+        """Runs every job due up to and including time 'end'; returns the stats."""
+        queue = self._queue
+        while queue and queue[0][0] <= end:
+            due = queue[0][0]
+            self.clock.sleep_until(due)
+            self.controller.begin_cycle(announce=False)
+            while queue and queue[0][0] == due:
+                self._run_one(*heapq.heappop(queue))
+        self.clock.sleep_until(end)
+        return self.stats
+
+    def run_for(self, duration):
+        """Runs 'duration' seconds of clock time from now; returns the stats."""
+        return self.run_until(self.clock.now() + duration)
@@ -1,15 +1,71 @@
+import threading
+from contextlib import contextmanager
+
 class Singleton(type):
     """
     Design Pattern: Singleton (Creational)
     Purpose: Ensures a class has only one instance and provides a global point of access to it.
     Usage: Used for the central SmartCityController to manage the entire system.
+
+    Creation uses double-checked locking with one lock per class, so concurrent
+    first calls build exactly one instance; once it exists, calls take a
+    lock-free dict lookup. reset() and scoped() replace the instance for tests;
+    detached() builds independent instances (e.g. one controller per city, see
+    core.tenancy.host) that never touch the shared one.
     """
     _instances = {}
+    _locks = {}
+    _locks_guard = threading.Lock()
+
+    def _lock(cls):
+        lock = Singleton._locks.get(cls)
+        if lock is None:
+            with Singleton._locks_guard:
+                lock = Singleton._locks.setdefault(cls, threading.RLock())
+        return lock
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+        instance = Singleton._instances.get(cls)
+        if instance is not None:
+            return instance
+        with cls._lock():
+            if cls not in Singleton._instances:
+                Singleton._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
+            return Singleton._instances[cls]
+
+    def reset(cls):
+        """Discards the current instance (calling its close(), if any); the next call builds a new one."""
+        with cls._lock():
+            instance = Singleton._instances.pop(cls, None)
+        close = getattr(instance, "close", None)
+        if close is not None:
+            close()
+
+    def detached(cls, *args, **kwargs):
+        """A new instance that is not the singleton: calling the class still returns the shared one."""
+        return super(Singleton, cls).__call__(*args, **kwargs)
+
+    @contextmanager
+    def scoped(cls, *args, **kwargs):
+        """
+        Makes a fresh instance the singleton for the duration of a with-block, then
+        closes it and reinstates the previous instance. The scope is process-wide.
+        """
+        with cls._lock():
+            previous = Singleton._instances.pop(cls, None)
+            instance = super(Singleton, cls).__call__(*args, **kwargs)
+            Singleton._instances[cls] = instance
+        try:
+            yield instance
+        finally:
+            with cls._lock():
+                if previous is None:
+                    Singleton._instances.pop(cls, None)
+                else:
+                    Singleton._instances[cls] = previous
+            close = getattr(instance, "close", None)
+            if close is not None:
+                close()
 
 # Example of a non-system class that might use Singleton
 class ConfigManager(metaclass=Singleton):
@@ -0,0 +1,181 @@
+from array import array
+from collections import namedtuple
+
+RawPoint = namedtuple("RawPoint", ("timestamp", "value"))
+AggregatePoint = namedtuple("AggregatePoint", ("start", "count", "mean", "min", "max"))
+
+# (name, bucket width in seconds, buckets kept) of the downsampled tiers.
+DEFAULT_TIERS = (("1m", 60, 7 * 24 * 60), ("1h", 3600, 366 * 24))
+DEFAULT_RAW_CAPACITY = 3600
+
+class RingColumns:
+    """
+    Fixed-capacity ring buffer of rows stored as parallel 'd' arrays.
+    Appending to a full buffer overwrites the oldest row; memory never grows.
+    """
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self.columns = [array("d", bytes(8 * capacity)) for _ in range(width)]
+        self.start = 0
+        self.size = 0
+        # True once a row has been overwritten, i.e. history was lost.
+        self.wrapped = False
+
+    def __len__(self):
+        return self.size
+
+    def append(self, *row):
+        if self.size < self.capacity:
+            slot = (self.start + self.size) % self.capacity
+            self.size += 1
+        else:
+            slot = self.start
+            self.start = (self.start + 1) % self.capacity
+            self.wrapped = True
+        for column, value in zip(self.columns, row):
+            column[slot] = value
+
+    def key(self, index):
+        """First column of the index-th oldest row."""
+        return self.columns[0][(self.start + index) % self.capacity]
+
+    def row(self, index):
+        slot = (self.start + index) % self.capacity
+        return tuple(column[slot] for column in self.columns)
+
+    def bisect(self, key):
+        """Index of the first row whose first column is >= 'key' (rows are appended in key order)."""
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            if self.key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def range(self, start, end):
+        """Rows with start <= first column < end, oldest first."""
+        for index in range(self.bisect(start), self.bisect(end)):
+            yield self.row(index)
+
+class _Tier:
+    def __init__(self, width, capacity):
+        self.width = width
+        self.ring = RingColumns(capacity, 5)
+        self.bucket = None
+        self.count = 0
+        self.total = 0.0
+        self.low = self.high = 0.0
+
+    def add(self, timestamp, value):
+        bucket = timestamp // self.width * self.width
+        if bucket != self.bucket:
+            self._close()
+            self.bucket, self.count, self.total, self.low, self.high = bucket, 0, 0.0, value, value
+        self.count += 1
+        self.total += value
+        self.low = min(self.low, value)
+        self.high = max(self.high, value)
+
+    def _close(self):
+        if self.bucket is not None:
+            self.ring.append(self.bucket, self.count, self.total, self.low, self.high)
+
+    def oldest(self):
+        if len(self.ring):
+            return self.ring.key(0)
+        return self.bucket
+
+    def query(self, start, end):
+        # Buckets overlapping [start, end) are included.
+        first = start // self.width * self.width
+        points = [
+            AggregatePoint(bucket, int(count), total / count, low, high)
+            for bucket, count, total, low, high in self.ring.range(first, end)
+        ]
+        if self.bucket is not None and first <= self.bucket < end:
+            points.append(AggregatePoint(self.bucket, self.count, self.total / self.count, self.low, self.high))
+        return points
+
+class Series:
+    """
+    One metric: a raw ring buffer plus downsampled tiers (count/sum/min/max per bucket).
+    Each tier keeps its open bucket in plain attributes and only writes it to its
+    ring when a sample for a later bucket arrives, so appends are O(tiers).
+    Timestamps must not go backwards.
+    """
+    def __init__(self, raw_capacity=DEFAULT_RAW_CAPACITY, tiers=DEFAULT_TIERS):
+        self.raw = RingColumns(raw_capacity, 2)
+        self.tiers = {name: _Tier(width, capacity) for name, width, capacity in tiers}
+        self.last_timestamp = None
+
+    def append(self, timestamp, value):
+        if self.last_timestamp is not None and timestamp < self.last_timestamp:
+            raise ValueError(f"Timestamp {timestamp} is older than the last sample ({self.last_timestamp}).")
+        self.last_timestamp = timestamp
+        self.raw.append(timestamp, value)
+        for tier in self.tiers.values():
+            tier.add(timestamp, value)
+
+    def covers(self, resolution, timestamp):
+        """True if 'resolution' still holds every sample since 'timestamp'."""
+        if resolution == "raw":
+            ring, oldest = self.raw, self.raw.key(0) if len(self.raw) else None
+        else:
+            ring, oldest = self.tiers[resolution].ring, self.tiers[resolution].oldest()
+        return not ring.wrapped or (oldest is not None and oldest <= timestamp)
+
+    def query(self, start, end, resolution="raw"):
+        """
+        Points with start <= timestamp < end: RawPoints for "raw", otherwise
+        AggregatePoints of the named tier (including its still-open bucket).
+        """
+        if resolution == "raw":
+            return [RawPoint(*row) for row in self.raw.range(start, end)]
+        return self.tiers[resolution].query(start, end)
+
+class TelemetryStore:
+    """
+    Embedded, append-only time-series store for subsystem metrics.
+    Series are created on first record() and named "<subsystem>.<metric>".
+    Memory per series is fixed by the raw capacity and the tier sizes.
+    """
+    def __init__(self, raw_capacity=DEFAULT_RAW_CAPACITY, tiers=DEFAULT_TIERS):
+        self.raw_capacity = raw_capacity
+        self.tier_specs = tiers
+        self._series = {}
+
+    def series(self, name):
+        if name not in self._series:
+            self._series[name] = Series(self.raw_capacity, self.tier_specs)
+        return self._series[name]
+
+    def names(self):
+        return list(self._series)
+
+    def record(self, name, timestamp, value):
+        self.series(name).append(timestamp, value)
+
+    def record_many(self, prefix, timestamp, readings):
+        """Records every {metric: value} in 'readings' as series "<prefix>.<metric>"."""
+        for metric, value in readings.items():
+            self.record(f"{prefix}.{metric}", timestamp, value)
+
+    def query(self, name, start, end, resolution=None):
+        """
+        Range query on one series. With resolution=None the finest resolution
+        whose retained history still reaches back to 'start' is used.
+        """
+        if name not in self._series:
+            raise KeyError(f"Unknown telemetry series '{name}'.")
+        series = self._series[name]
+        if resolution is None:
+            resolution = self._pick_resolution(series, start)
+        return series.query(start, end, resolution)
+
+    def _pick_resolution(self, series, start):
+        for resolution in ("raw",) + tuple(name for name, _, _ in self.tier_specs):
+            if series.covers(resolution, start):
+                return resolution
+        return self.tier_specs[-1][0] if self.tier_specs else "raw"
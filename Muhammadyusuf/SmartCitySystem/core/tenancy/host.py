@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+class Tenant:
+    """One named city on a CityHost, with its scheduling weight and resource accounting."""
+    def __init__(self, name, controller, weight=1.0):
+        self.name = name
+        self.controller = controller
+        self.weight = weight
+        self.cycles = 0
+        self.cpu_s = 0.0
+        self.wall_s = 0.0
+        self.wait_s = 0.0
+        # "<ExceptionType>: <message>" if a cycle of the latest run() failed, else None.
+        self.error = None
+
+    @property
+    def virtual_time(self):
+        """CPU time used per unit of weight; the fair scheduler runs the lowest first."""
+        return self.cpu_s / self.weight
+
+    def run_cycle(self, queued_at):
+        """One simulation cycle on the calling worker thread, charged to this tenant."""
+        started, cpu = time.perf_counter(), time.thread_time()
+        self.controller.run_cycles(1)
+        self.cpu_s += time.thread_time() - cpu
+        self.wall_s += time.perf_counter() - started
+        self.wait_s += started - queued_at
+        self.cycles += 1
+
+    def usage(self):
+        return {
+            "weight": self.weight,
+            "cycles": self.cycles,
+            "cpu_s": self.cpu_s,
+            "wall_s": self.wall_s,
+            "wait_s": self.wait_s,
+            "memory_bytes": sum(self.controller.memory_usage().values()),
+            "error": self.error,
+        }
+
+class CityHost:
+    """
+    Hosts many independent cities in one process.
+
+    Every city is a detached SmartCityController (its own subsystems, random
+    streams, change feed and telemetry) registered under a name. All cities
+    share one bounded thread pool of 'workers' threads, which runs their
+    simulation cycles and their concurrent status fan-out.
+
+    run() schedules cycles fairly: a city has at most one cycle in flight,
+    and whenever a worker is free the city with the least CPU time per unit
+    of weight goes next (weighted fair queuing). Cheap cities are not starved
+    by large ones, and a city with weight 2 gets twice the CPU share of a city
+    with weight 1 under contention. usage() reports per-city CPU time (thread
+    CPU time of its cycles on the host's threads), wall and queueing time, and memory (see
+    SmartCityController.memory_usage()).
+
+    A city whose cycle raises stops for the rest of that run() while the other
+    cities carry on; the failure is reported in its usage as 'error'.
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="smartcity-host")
+        self._tenants = {}
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+
+    def create_city(self, name, weight=1.0, seed=None, fleet_sizes=None, subsystems=None):
+        """Builds and registers an isolated city; raises ValueError if 'name' is taken."""
+        from core.controller import SmartCityController
+        with self._lock:
+            if name in self._tenants:
+                raise ValueError(f"City '{name}' already exists.")
+            controller = SmartCityController.detached(seed, fleet_sizes, subsystems, executor=self._pool, announce=False)
+            self._tenants[name] = Tenant(name, controller, weight)
+            return controller
+
+    def remove_city(self, name):
+        with self._lock:
+            tenant = self._tenants.pop(name)
+        tenant.controller.close()
+
+    def city(self, name):
+        """The controller of city 'name' (KeyError if there is none)."""
+        return self._tenants[name].controller
+
+    def names(self):
+        return list(self._tenants)
+
+    def __len__(self):
+        return len(self._tenants)
+
+    def run(self, cycles=1, names=None):
+        """
+        Runs 'cycles' simulation cycles in every city (or in 'names'; 'cycles'
+        may also be a {name: cycles} mapping) on the shared pool, in fair
+        order. Returns usage() of the cities that ran. A city whose cycle
+        raises runs no further cycles; every other city completes its cycles
+        and the failure is reported as the city's 'error' instead of raised.
+        """
+        with self._lock:
+            names = list(self._tenants) if names is None else list(names)
+            tenants = [self._tenants[name] for name in names]
+        remaining = {tenant.name: cycles.get(tenant.name, 0) if isinstance(cycles, dict) else cycles for tenant in tenants}
+        for tenant in tenants:
+            tenant.error = None
+        ready = [(tenant.virtual_time, next(self._order), tenant) for tenant in tenants if remaining[tenant.name] > 0]
+        heapq.heapify(ready)
+        running = {}
+        while ready or running:
+            while ready and len(running) < self.workers:
+                _, _, tenant = heapq.heappop(ready)
+                running[self._pool.submit(tenant.run_cycle, time.perf_counter())] = tenant
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                tenant = running.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    tenant.error = f"{type(exc).__name__}: {exc}"
+                    continue
+                remaining[tenant.name] -= 1
+                if remaining[tenant.name] > 0:
+                    heapq.heappush(ready, (tenant.virtual_time, next(self._order), tenant))
+        return {name: self._tenants[name].usage() for name in names}
+
+    def usage(self):
+        """Per-city resource accounting: {name: {weight, cycles, cpu_s, wall_s, wait_s, memory_bytes, error}}."""
+        with self._lock:
+            tenants = list(self._tenants.values())
+        return {tenant.name: tenant.usage() for tenant in tenants}
+
+    def close(self):
+        """Closes every city and shuts the shared pool down."""
+        with self._lock:
+            tenants, self._tenants = list(self._tenants.values()), {}
+        for tenant in tenants:
+            tenant.controller.close()
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
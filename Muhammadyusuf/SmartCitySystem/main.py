@@ -1,9 +1,30 @@
+"""
+SmartCity System console.
+
+    python3 main.py                                   # interactive menu
+    python3 main.py run --ticks 100 --lights 100000   # batch simulation, one summary line
+    python3 main.py run --ticks 100 --cities 24       # 24 independent cities in this process
+    python3 main.py status --format json [transport]  # status, compact JSON
+    python3 main.py bench --scales 10,1000            # benchmark.py
+    python3 main.py serve [--port 8765 | --socket PATH] [--record commands.log] [--coalesce]
+    python3 main.py sweep --set lighting.light_type=led,halogen --ticks 50 --output results.bin
+
+'serve' answers line protocol commands (see core/service/line_protocol.py) from
+stdin, or from local clients on a TCP port or Unix socket. 'sweep' runs one
+scenario per combination of the --set values on worker processes (see
+core/scenarios/runner.py), optionally replaying a recorded command log.
+"""
+import argparse
+import contextlib
+import io
+import json
 import sys
 import os
+import time
 # Add the project root to the path to allow for relative imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from core.controller import get_controller
+from core.controller import SmartCityController, get_controller
 
 def display_menu():
     print("\n--- SmartCity System Console ---")
@@ -32,7 +53,7 @@ def operate_subsystem_menu(controller):
     except ValueError:
         print("Invalid input. Please enter a number.")
 
-def main():
+def interactive():
     # The controller is a Singleton, so this call ensures we get the single instance.
     controller = get_controller()
 
@@ -64,5 +85,188 @@ def main():
         else:
             print("Invalid choice. Please try again.")
 
+# --- Non-interactive commands ---
+@contextlib.contextmanager
+def city(args):
+    """A fresh controller for one command; its start-up banner is kept off stdout."""
+    fleet_sizes = {name: size for name, size in (("transport", args.traffic), ("lighting", args.lights)) if size is not None}
+    with contextlib.ExitStack() as stack:
+        with contextlib.redirect_stdout(io.StringIO()):
+            controller = stack.enter_context(SmartCityController.scoped(seed=args.seed, fleet_sizes=fleet_sizes))
+        yield controller
+
+def run_cities_command(args, out):
+    """'run --cities N': N independent cities on one CityHost, seeded seed, seed + 1, ..."""
+    from core.tenancy.host import CityHost
+    fleet_sizes = {name: size for name, size in (("transport", args.traffic), ("lighting", args.lights)) if size is not None}
+    with CityHost() as host:
+        for index in range(args.cities):
+            seed = None if args.seed is None else args.seed + index
+            host.create_city(f"city-{index + 1}", seed=seed, fleet_sizes=fleet_sizes)
+        start = time.perf_counter()
+        usage = host.run(args.ticks)
+        elapsed = time.perf_counter() - start
+    cycles = args.cities * args.ticks
+    summary = {"cities": args.cities, "ticks": args.ticks, "elapsed_s": elapsed,
+               "ticks_per_s": cycles / elapsed if elapsed > 0 else None,
+               "cpu_s": sum(city["cpu_s"] for city in usage.values()),
+               "memory_bytes": sum(city["memory_bytes"] for city in usage.values())}
+    failed = {name: city["error"] for name, city in usage.items() if city["error"] is not None}
+    if args.format == "json":
+        out.write(json.dumps(dict(summary, usage=usage), separators=(",", ":")) + "\n")
+    else:
+        out.write(f"Ran {args.ticks} cycles in each of {args.cities} cities in {elapsed:.3f}s "
+                  f"({summary['ticks_per_s'] or 0:.1f} cycles/s); {summary['cpu_s']:.3f}s CPU, "
+                  f"{summary['memory_bytes']} bytes of city data\n")
+        for name, error in failed.items():
+            out.write(f"{name} failed: {error}\n")
+    return 1 if failed else 0
+
+def run_command(args, out):
+    if args.cities > 1:
+        return run_cities_command(args, out)
+    with city(args) as controller:
+        start = time.perf_counter()
+        tick = controller.run_cycles(args.ticks, parallel=args.parallel)
+        elapsed = time.perf_counter() - start
+        summary = dict(controller.summary(), ticks=args.ticks, elapsed_s=elapsed,
+                       ticks_per_s=args.ticks / elapsed if elapsed > 0 else None)
+    if args.format == "json":
+        out.write(json.dumps(summary, separators=(",", ":")) + "\n")
+    else:
+        components = ", ".join(f"{count} {name}" for name, count in summary["components"].items())
+        out.write(f"Ran {args.ticks} cycles in {elapsed:.3f}s ({summary['ticks_per_s'] or 0:.1f}/s); "
+                  f"tick {tick}, status version {summary['version']}; {components}\n")
+    return 0
+
+def status_command(args, out):
+    with city(args) as controller:
+        names = args.subsystems or controller.get_subsystem_names()
+        unknown = [name for name in names if name not in controller.get_subsystem_names()]
+        if unknown:
+            sys.stderr.write(f"Unknown subsystem(s): {', '.join(unknown)}\n")
+            return 2
+        status = {name: controller.get_subsystem_status(name) for name in names}
+    if args.format == "json":
+        out.write(json.dumps(status, separators=(",", ":")) + "\n")
+    else:
+        out.write("".join(f"[{name.capitalize()}]: {stat}\n" for name, stat in status.items()))
+    return 0
+
+def serve_command(args, out):
+    from core.service.line_protocol import CommandProcessor, make_server, serve
+    if args.record and (args.port is not None or args.socket is not None):
+        sys.stderr.write("--record is only supported on stdin.\n")
+        return 2
+    if args.record and args.coalesce:
+        sys.stderr.write("--record cannot be combined with --coalesce.\n")
+        return 2
+    with city(args) as controller, contextlib.ExitStack() as stack:
+        log = stack.enter_context(open(args.record, "a")) if args.record else None
+        pipeline = None
+        if args.coalesce:
+            from core.middleware.pipeline import CacheMiddleware, CoalesceMiddleware
+            pipeline = controller.pipeline(CoalesceMiddleware(controller), CacheMiddleware(controller))
+        if args.port is None and args.socket is None:
+            stdout = out.buffer if hasattr(out, "buffer") else out
+            def write(data):
+                stdout.write(data)
+                stdout.flush()
+            serve(CommandProcessor(controller, log, pipeline), lambda size: os.read(sys.stdin.fileno(), size), write)
+            return 0
+        with make_server(controller, args.port, args.socket, pipeline) as server:
+            sys.stderr.write(f"Serving on {server.server_address}\n")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    return 0
+
+def sweep_command(args, out):
+    from core.scenarios.runner import parameter_grid, parse_value, read_command_log, run_sweep
+    grid = {}
+    for setting in args.set:
+        key, _, values = setting.partition("=")
+        if not values:
+            sys.stderr.write(f"Invalid --set '{setting}'. Expected KEY=VALUE[,VALUE...].\n")
+            return 2
+        grid[key.strip()] = [parse_value(value.strip()) for value in values.split(",")]
+    options = {name: {"fleet_size": size} for name, size in (("transport", args.traffic), ("lighting", args.lights)) if size is not None}
+    commands = read_command_log(args.replay) if args.replay else ()
+    try:
+        scenarios = parameter_grid(grid, args.seed or 0, args.ticks, options, commands)
+    except ValueError as exc:
+        sys.stderr.write(f"{exc}\n")
+        return 2
+    start = time.perf_counter()
+    results = run_sweep(scenarios, args.workers)
+    elapsed = time.perf_counter() - start
+    if args.output:
+        results.save(args.output)
+    cpu = sum(results["cpu_s"])
+    summary = {"scenarios": len(results), "elapsed_s": elapsed, "cpu_s": cpu, "output": args.output}
+    if args.format == "json":
+        out.write(json.dumps(dict(summary, results=results.columns), separators=(",", ":")) + "\n")
+    else:
+        out.write(f"Ran {len(results)} scenarios in {elapsed:.3f}s ({cpu:.3f}s CPU in the scenarios)"
+                  + (f"; results in {args.output}" if args.output else "") + "\n")
+    return 0
+
+def bench_command(args, out, extra):
+    import benchmark
+    return benchmark.main(extra)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="SmartCity System console. Without a command the interactive menu starts.")
+    commands = parser.add_subparsers(dest="command")
+    city_options = argparse.ArgumentParser(add_help=False)
+    city_options.add_argument("--seed", type=int, default=None, help="seed for reproducible runs")
+    city_options.add_argument("--lights", type=int, default=None, help="number of street lights")
+    city_options.add_argument("--traffic", type=int, default=None, help="number of traffic lights")
+
+    run = commands.add_parser("run", parents=[city_options], help="run simulation cycles and print one summary")
+    run.add_argument("--ticks", type=int, default=1, help="number of simulation cycles")
+    run.add_argument("--parallel", action="store_true", help="operate the subsystems concurrently")
+    run.add_argument("--cities", type=int, default=1, help="run this many independent cities on one shared worker pool")
+    run.add_argument("--format", choices=("text", "json"), default="text")
+
+    status = commands.add_parser("status", parents=[city_options], help="print subsystem status")
+    status.add_argument("subsystems", nargs="*", help="subsystems to report (default: all)")
+    status.add_argument("--format", choices=("text", "json"), default="text")
+
+    serve = commands.add_parser("serve", parents=[city_options], help="answer line protocol commands")
+    where = serve.add_mutually_exclusive_group()
+    where.add_argument("--port", type=int, default=None, help="listen on 127.0.0.1:PORT instead of stdin")
+    where.add_argument("--socket", default=None, help="listen on this Unix socket instead of stdin")
+    serve.add_argument("--record", default=None, help="append every state-changing command to this log (stdin only)")
+    serve.add_argument("--coalesce", action="store_true",
+                       help="identical status requests within a tick share one execution (not with --record)")
+
+    sweep = commands.add_parser("sweep", parents=[city_options], help="run a parameter sweep of scenarios")
+    sweep.add_argument("--set", action="append", default=[], metavar="KEY=V1,V2",
+                       help="sweep 'seed', 'ticks' or '<subsystem>.<option>' over these values (repeatable)")
+    sweep.add_argument("--ticks", type=int, default=10, help="simulation cycles per scenario")
+    sweep.add_argument("--replay", default=None, help="replay this command log in every scenario first")
+    sweep.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    sweep.add_argument("--output", default=None, help="write the columnar results file here")
+    sweep.add_argument("--format", choices=("text", "json"), default="text")
+
+    commands.add_parser("bench", help="run benchmark.py; other options are passed through", add_help=False)
+    return parser
+
+def main(argv=None, out=None):
+    out = out if out is not None else sys.stdout
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "bench":
+        return bench_command(args, out, extra)
+    if extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    if args.command is None:
+        interactive()
+        return 0
+    handlers = {"run": run_command, "status": status_command, "serve": serve_command, "sweep": sweep_command}
+    return handlers[args.command](args, out)
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,252 @@
+from array import array
+
+# Categories whose feeders may be shed (dimmed to their floor); everything else is critical.
+SHEDDABLE_CATEGORIES = frozenset({"lighting"})
+
+class PowerGrid:
+    """
+    Feeders and substations over the city's energy meters, as a sparse network.
+
+    Each FleetMeter's fleet is split into feeders of 'feeder_size' consecutive
+    rows and every other meter (e.g. PowerMeter) gets a feeder of its own;
+    consecutive feeders are grouped 'feeders_per_substation' to a substation.
+    Like RoadNetwork, membership is CSR-style typed arrays: feeder f serves
+    rows starts[f]:stops[f] of sources[meter_of[f]] and hangs off substation
+    substation_of[f]. A feeder's capacity is its draw at full output (lights at
+    maximum brightness) and its floor what remains after shedding (lights at
+    minimum brightness; critical loads cannot be shed). A substation is rated
+    for its feeders' floors plus 'diversity' of the sheddable load above them,
+    so it overloads when too many of its lighting feeders run near full.
+
+    Feeder loads are recomputed per source only when its fleet's version has
+    changed, with one C-level sum() per feeder slice, so refresh() on an idle
+    city is O(sources) and a changed million-row fleet costs one pass over its
+    value bytes. what_if() and plan_shedding() work on the cached loads and are
+    O(feeders).
+    """
+    def __init__(self, meters, feeder_size=500, feeders_per_substation=20, diversity=0.8):
+        self.sources = list(meters)
+        self.feeder_size = feeder_size
+        self.feeders_per_substation = feeders_per_substation
+        self.diversity = diversity
+        self.meter_of = array("q")
+        self.starts = array("q")
+        self.stops = array("q")
+        self.substation_of = array("q")
+        self.load_w = array("d")
+        self.capacity_w = array("d")
+        self.floor_w = array("d")
+        self.substation_capacity_w = array("d")
+        self._source_rows = [0] * len(self.sources)
+        self._source_versions = [None] * len(self.sources)
+        self._feeders_of = [[] for _ in self.sources]
+        self.refresh()
+
+    def __len__(self):
+        return len(self.load_w)
+
+    @property
+    def substations(self):
+        return len(self.substation_capacity_w)
+
+    def _rate(self, feeder, capacity, floor):
+        """
+        Sets a feeder's capacity and floor. Its substation is rated for every
+        feeder's floor (critical loads in full) plus 'diversity' of the
+        sheddable part above it.
+        """
+        old = self.floor_w[feeder] + self.diversity * (self.capacity_w[feeder] - self.floor_w[feeder])
+        self.capacity_w[feeder] = capacity
+        self.floor_w[feeder] = floor
+        new = floor + self.diversity * (capacity - floor)
+        self.substation_capacity_w[self.substation_of[feeder]] += new - old
+
+    def _add_feeder(self, source, start, stop, capacity, floor):
+        feeder = len(self.load_w)
+        substation = feeder // self.feeders_per_substation
+        if substation == len(self.substation_capacity_w):
+            self.substation_capacity_w.append(0.0)
+        self.meter_of.append(source)
+        self.starts.append(start)
+        self.stops.append(stop)
+        self.substation_of.append(substation)
+        self.load_w.append(0.0)
+        self.capacity_w.append(0.0)
+        self.floor_w.append(0.0)
+        self._feeders_of[source].append(feeder)
+        self._rate(feeder, capacity, floor)
+
+    def _grow(self, source):
+        """Adds feeders for the rows a fleet gained since the last refresh."""
+        meter = self.sources[source]
+        sheddable = meter.category in SHEDDABLE_CATEGORIES
+        fleet = getattr(meter, "fleet", None)
+        if fleet is None:
+            if not self._feeders_of[source]:
+                watts = meter.power()
+                self._add_feeder(source, 0, 1, watts, 0.0 if sheddable else watts)
+                self._source_rows[source] = 1
+            return
+        view_class = fleet.view_class
+        full = getattr(view_class, "max_brightness", 255 if meter.watts_per_unit else 0)
+        minimum = getattr(view_class, "min_brightness", 0)
+        row_capacity = meter.base_watts + meter.watts_per_unit * full
+        row_floor = meter.base_watts + meter.watts_per_unit * minimum if sheddable else row_capacity
+        covered, count = self._source_rows[source], len(fleet)
+        feeders = self._feeders_of[source]
+        if feeders and covered % self.feeder_size:
+            # Top up the last, partly filled feeder first.
+            last = feeders[-1]
+            stop = self.stops[last] = min(count, self.starts[last] + self.feeder_size)
+            rows = stop - self.starts[last]
+            self._rate(last, rows * row_capacity, rows * row_floor)
+            covered = stop
+        for start in range(covered, count, self.feeder_size):
+            rows = min(self.feeder_size, count - start)
+            self._add_feeder(source, start, start + rows, rows * row_capacity, rows * row_floor)
+        self._source_rows[source] = max(covered, count)
+
+    def refresh(self):
+        """Updates feeder loads from the meters; only sources that changed are re-read."""
+        for source, meter in enumerate(self.sources):
+            fleet = getattr(meter, "fleet", None)
+            if fleet is None:
+                self._grow(source)
+                feeder = self._feeders_of[source][0]
+                watts = self.load_w[feeder] = meter.power()
+                if watts > self.capacity_w[feeder]:
+                    # A single load is rated at the highest draw seen.
+                    sheddable = meter.category in SHEDDABLE_CATEGORIES
+                    self._rate(feeder, watts, self.floor_w[feeder] if sheddable else watts)
+                continue
+            if self._source_versions[source] == fleet.version and self._source_rows[source] == len(fleet):
+                continue
+            if len(fleet) > self._source_rows[source]:
+                self._grow(source)
+            values, base, per_unit = fleet.values, meter.base_watts, meter.watts_per_unit
+            load_w, starts, stops, count = self.load_w, self.starts, self.stops, len(fleet)
+            for feeder in self._feeders_of[source]:
+                # Rows beyond the fleet (after it shrank) draw nothing.
+                start, stop = starts[feeder], min(stops[feeder], count)
+                load_w[feeder] = base * max(0, stop - start) + per_unit * sum(values[start:stop])
+            self._source_versions[source] = fleet.version
+        return self
+
+    def substation_loads(self, feeder_loads=None):
+        """Load per substation (from 'feeder_loads', default: the current loads)."""
+        loads = [0.0] * self.substations
+        for substation, load in zip(self.substation_of, self.load_w if feeder_loads is None else feeder_loads):
+            loads[substation] += load
+        return loads
+
+    def overloaded(self, substation_loads=None):
+        """Substations whose load ('substation_loads', default: the current loads) exceeds their capacity."""
+        substation_loads = self.substation_loads() if substation_loads is None else substation_loads
+        return [s for s, (load, capacity) in enumerate(zip(substation_loads, self.substation_capacity_w)) if load > capacity]
+
+    def what_if(self, shed=(), feeder_loads=None):
+        """
+        Substation loads if the feeders in 'shed' were dimmed to their floor
+        (starting from 'feeder_loads', default: the current loads).
+        """
+        loads = array("d", self.load_w if feeder_loads is None else feeder_loads)
+        for feeder in shed:
+            loads[feeder] = min(loads[feeder], self.floor_w[feeder])
+        substation_loads = self.substation_loads(loads)
+        return {
+            "substation_load_w": substation_loads,
+            "total_w": sum(substation_loads),
+            "overloaded": self.overloaded(substation_loads),
+        }
+
+    def plan_shedding(self, feeder_loads=None, margin=0.0):
+        """
+        The fewest sheddable feeders to dim so that no substation exceeds
+        (1 - margin) of its capacity: on each overloaded substation, the feeders
+        with the most sheddable load go first. Returns what_if() of the plan
+        plus 'shed' (feeder indices) and 'relief_w'.
+        """
+        loads = self.load_w if feeder_loads is None else feeder_loads
+        substation_loads = self.substation_loads(loads)
+        limits = [capacity * (1 - margin) for capacity in self.substation_capacity_w]
+        candidates = {}
+        for feeder, substation in enumerate(self.substation_of):
+            if substation_loads[substation] > limits[substation]:
+                relief = loads[feeder] - self.floor_w[feeder]
+                if relief > 0:
+                    candidates.setdefault(substation, []).append((-relief, feeder))
+        shed, relief_w = [], 0.0
+        for substation, feeders in candidates.items():
+            excess = substation_loads[substation] - limits[substation]
+            for negative_relief, feeder in sorted(feeders):
+                if excess <= 0:
+                    break
+                shed.append(feeder)
+                excess += negative_relief
+                relief_w -= negative_relief
+        plan = self.what_if(shed, loads)
+        plan["shed"] = sorted(shed)
+        plan["relief_w"] = relief_w
+        return plan
+
+    def summary(self):
+        substation_loads = self.substation_loads()
+        return {
+            "substations": self.substations,
+            "feeders": len(self),
+            "load_w": sum(substation_loads),
+            "capacity_w": sum(self.substation_capacity_w),
+            "overloaded": self.overloaded(substation_loads),
+        }
+
+class DemandForecast:
+    """
+    Per-feeder demand forecasting over a series of load observations.
+    Every feeder runs Holt's linear exponential smoothing (level 'alpha', trend
+    'beta') plus a rolling mean over the last 'window' observations; each
+    update is one pass over typed arrays for all feeders together, and memory
+    is fixed at window + 2 doubles per feeder.
+    """
+    def __init__(self, alpha=0.5, beta=0.2, window=24):
+        self.alpha = alpha
+        self.beta = beta
+        self.window = window
+        self.level = array("d")
+        self.trend = array("d")
+        self._history = []
+        self._sums = array("d")
+        self.observations = 0
+
+    def _resize(self, count):
+        missing = count - len(self.level)
+        if missing > 0:
+            zeros = bytes(8 * missing)
+            for column in (self.level, self.trend, self._sums, *self._history):
+                column.frombytes(zeros)
+
+    def observe(self, loads):
+        """Adds one observation (a load per feeder)."""
+        self._resize(len(loads))
+        alpha, beta = self.alpha, self.beta
+        if self.observations == 0:
+            self.level = array("d", loads)
+        else:
+            level = array("d", [alpha * x + (1 - alpha) * (l + t) for x, l, t in zip(loads, self.level, self.trend)])
+            self.trend = array("d", [beta * (new - old) + (1 - beta) * t for new, old, t in zip(level, self.level, self.trend)])
+            self.level = level
+        observation = array("d", loads)
+        if len(self._history) == self.window:
+            oldest = self._history.pop(0)
+            self._sums = array("d", [s + x - o for s, x, o in zip(self._sums, observation, oldest)])
+        else:
+            self._sums = array("d", [s + x for s, x in zip(self._sums, observation)])
+        self._history.append(observation)
+        self.observations += 1
+
+    def forecast(self, steps=1):
+        """Expected load per feeder 'steps' observations ahead (never negative)."""
+        return array("d", [max(0.0, l + steps * t) for l, t in zip(self.level, self.trend)])
+
+    def rolling_mean(self):
+        count = len(self._history)
+        return array("d", [s / count for s in self._sums]) if count else array("d", bytes(8 * len(self.level)))
@@ -1,12 +1,19 @@
 from core.builders.report_builder import ReportBuilder, ReportDirector, SmartCityReport
+from core.simulation.scheduler import WallClock
+from modules.energy.grid import DemandForecast, PowerGrid
+from modules.energy.reporting import ConsumptionLedger, FleetMeter, PowerMeter, StreamingEnergyReportBuilder, FOOTER_RECORD, text_line
 import random
+import threading
 
 # --- Concrete Builder ---
 class EnergyReportBuilder(ReportBuilder):
     """
     A concrete builder for creating an Energy Consumption Report.
+    The numbers come from a ConsumptionLedger; the text report carries the
+    totals per category (see StreamingEnergyReportBuilder for the full report).
     """
-    def __init__(self):
+    def __init__(self, ledger=None):
+        self.ledger = ledger if ledger is not None else ConsumptionLedger()
         self.report = None
         self.reset()
 
@@ -14,19 +21,14 @@ class EnergyReportBuilder(ReportBuilder):
         self.report = SmartCityReport()
 
     def build_header(self):
-        self.report.add_part("--- Energy Consumption Report ---")
-        self.report.add_part(f"Date: {random.choice(['2025-12-01', '2025-12-02'])}")
+        self.report.add_part(text_line(self.ledger.header_record()))
 
     def build_body(self):
-        consumption = random.randint(1000, 5000)
-        self.report.add_part(f"Total Consumption (kWh): {consumption}")
-        self.report.add_part(f"Lighting Usage: {int(consumption * 0.3)} kWh")
-        self.report.add_part(f"Transport Usage: {int(consumption * 0.4)} kWh")
-        self.report.add_part(f"Security Usage: {int(consumption * 0.1)} kWh")
-        self.report.add_part(f"Other Usage: {int(consumption * 0.2)} kWh")
+        for record in self.ledger.body_records(buckets=False, components=False):
+            self.report.add_part(text_line(record))
 
     def build_footer(self):
-        self.report.add_part("--- End of Report ---")
+        self.report.add_part(text_line(FOOTER_RECORD))
 
     def get_result(self) -> SmartCityReport:
         report = self.report
@@ -35,17 +37,159 @@ class EnergyReportBuilder(ReportBuilder):
 
 # --- Subsystem Manager ---
 class EnergyManager:
-    def __init__(self):
-        self.builder = EnergyReportBuilder()
+    """
+    Meters the other subsystems (see add_meter()) into a ConsumptionLedger.
+    Consumption is sampled on 'clock' whenever a report is requested, i.e.
+    once per simulation cycle, and each interval is charged at the draw seen
+    at its sample (an approximation, see FleetMeter). The
+    meters also feed a PowerGrid of feeders and substations ('grid_options'
+    are its keyword arguments) and a per-feeder DemandForecast, which is
+    updated with every report.
+
+    Meters never take another manager's lock, and get_status() and
+    telemetry() read them before taking this manager's lock, so energy never
+    waits on the subsystems it meters (see SmartCityController._locked_subsystems()).
+    """
+    # Actions operate() performs; metrics label any other action "other".
+    ACTIONS = ("report_consumption", "plan_load_shedding")
+
+    def __init__(self, rng=None, clock=None, **grid_options):
+        # Serializes operate(), get_status() and telemetry() (see SmartCityController).
+        self.lock = threading.RLock()
+        self.rng = rng if rng is not None else random
+        self.clock = clock if clock is not None else WallClock()
+        self.ledger = ConsumptionLedger(format_time=getattr(self.clock, "format_time", None))
+        self.builder = EnergyReportBuilder(self.ledger)
         self.director = ReportDirector(self.builder)
         self.status = "Monitoring"
+        self.sources = []
+        self._version = 0
+        self.grid_options = grid_options
+        self.forecast = DemandForecast()
+        self._grid = None
+
+    def set_clock(self, clock):
+        self.clock = clock
+        self.ledger.format_time = getattr(clock, "format_time", None)
+        self.ledger.restart_sampling()
+
+    @property
+    def version(self):
+        """
+        Grows with every report and whenever a metered subsystem's version
+        does (its draw feeds current_consumption and the grid loads).
+        """
+        return self._version + sum(source.version for source in self.sources)
+
+    def add_meter(self, meter):
+        self.ledger.add_meter(meter)
+        self._grid = None
+
+    def add_source(self, manager):
+        """Counts 'manager's version into this one's, for the manager whose components a meter reads."""
+        self.sources.append(manager)
+
+    @property
+    def grid(self):
+        """The PowerGrid over the current meters with up-to-date feeder loads (rebuilt after add_meter())."""
+        with self.lock:
+            if self._grid is None:
+                self._grid = PowerGrid(self.ledger.meters, **self.grid_options)
+                self.forecast = DemandForecast()
+            return self._grid.refresh()
+
+    def observe_load(self):
+        """Adds the current feeder loads to the demand forecast."""
+        with self.lock:
+            self.forecast.observe(self.grid.load_w)
 
-    def operate(self, action=None):
-        if action == "report_consumption":
-            self.director.build_full_report()
-            report = self.builder.get_result()
-            return f"Energy: Generated Consumption Report:\n{report.show()}"
-        return "Energy: No specific action taken."
+    def what_if(self, shed=(), steps=0):
+        """
+        Substation loads if the feeders in 'shed' were dimmed, now (steps=0)
+        or 'steps' observations ahead by the forecast.
+        """
+        with self.lock:
+            grid = self.grid
+            return grid.what_if(shed, self.forecast.forecast(steps) if steps and self.forecast.observations else None)
+
+    def plan_load_shedding(self, steps=1, margin=0.0):
+        """Feeders to dim so no substation is overloaded 'steps' observations ahead (see PowerGrid.plan_shedding())."""
+        with self.lock:
+            grid = self.grid
+            loads = self.forecast.forecast(steps) if steps and self.forecast.observations else None
+            return grid.plan_shedding(loads, margin)
+
+    def sample(self):
+        """Charges the time since the previous sample to the meters' current draw."""
+        self.ledger.sample(self.clock.now())
+
+    def stream_report(self, sink, format="text", components=True):
+        """
+        Writes the full report (totals, time buckets and, optionally, every
+        component) to 'sink' piece by piece; returns the summary dict.
+        """
+        with self.lock:
+            self.sample()
+            builder = StreamingEnergyReportBuilder(self.ledger, sink, format, components)
+            ReportDirector(builder).build_full_report()
+            return builder.get_result()
+
+    def operate(self, action=None, detail=True):
+        with self.lock:
+            if action == "report_consumption":
+                self.sample()
+                self.observe_load()
+                self.director.build_full_report()
+                self._version += 1
+                report = self.builder.get_result()
+                return f"Energy: Generated Consumption Report:\n{report.show()}"
+            if action == "plan_load_shedding":
+                plan = self.plan_load_shedding()
+                return (f"Energy: Load shedding plan dims {len(plan['shed'])} feeders ({plan['relief_w']:.0f} W); "
+                        f"overloaded substations after: {plan['overloaded']}")
+            return "Energy: No specific action taken."
+
+    def read_consumption(self):
+        """Current draw of every metered component in watts."""
+        return sum(meter.power() for meter in self.ledger.meters)
+
+    def telemetry(self):
+        """Current readings for the telemetry store."""
+        watts = self.read_consumption()
+        with self.lock:
+            grid = self.grid
+            return {"current_consumption": watts, "power_w": watts, "overloaded_substations": len(grid.overloaded())}
 
     def get_status(self):
-        return {"manager_status": self.status, "current_consumption": random.randint(1000, 5000)}
+        watts = self.read_consumption()
+        with self.lock:
+            grid = self.grid.summary()
+            grid["forecast_w"] = sum(self.forecast.forecast()) if self.forecast.observations else grid["load_w"]
+            return {"manager_status": self.status, "current_consumption": watts, "grid": grid}
+
+def meters_for(transport=None, lighting=None, security=None):
+    """Energy meters for the transport and lighting fleets and the security system (None skips one)."""
+    meters = []
+    if transport is not None:
+        meters.append(FleetMeter("transport", transport.components, base_watts=transport.components.view_class.rated_watts))
+    if lighting is not None:
+        lights = lighting.lights
+        meters.append(FleetMeter("lighting", lights, watts_per_unit=lights.view_class.rated_watts / 100,
+                                 power_source=lighting.power_watts))
+    if security is not None:
+        meters.append(PowerMeter("security", "patrol", security.power_watts))
+    return meters
+
+def create_manager(context):
+    """
+    Subsystem factory for the controller's registry (see core.registry.subsystems).
+    Builds the metered subsystems first, so energy always reports the whole city.
+    """
+    manager = EnergyManager(context.rng, context.clock, **context.options)
+    metered = [context.optional(name) for name in ("transport", "lighting", "security")]
+    for meter in meters_for(*metered):
+        manager.add_meter(meter)
+    for source in metered:
+        if source is not None:
+            manager.add_source(source)
+    return manager
@@ -0,0 +1,258 @@
+import csv
+import json
+from collections import OrderedDict
+from array import array
+from core.builders.report_builder import ReportBuilder
+
+# --- Meters ---
+class FleetMeter:
+    """
+    Meters every component of a fleet. A component draws
+    base_watts + watts_per_unit * value (e.g. rated watts scaled by brightness).
+    Per-component energy is integrated without a per-component Python loop: the
+    value column is spread into 8-byte lanes of one big integer, and
+    lanes * elapsed_ms is added to a running big-integer sum. The lanes are only
+    rebuilt when the fleet's version changes, so memory stays at 8 bytes per
+    component however long the report window is. 'power_source', if given,
+    is a callable returning the fleet's current draw that the owner keeps up
+    to date (it replaces the O(n) sum in power()).
+
+    Energy is integrated per sampling interval, not per change: accumulate()
+    charges the whole interval at the values the fleet has when the ledger
+    samples, so a component that changed mid-interval is charged its new
+    value for all of it. The error is bounded by the sampling period (one
+    simulation cycle when EnergyManager reports every cycle, as the controller
+    does); sample more often for a finer integral.
+    """
+    def __init__(self, category, fleet, base_watts=0.0, watts_per_unit=0.0, power_source=None):
+        self.category = category
+        self.fleet = fleet
+        self.base_watts = base_watts
+        self.watts_per_unit = watts_per_unit
+        self.power_source = power_source
+        self.elapsed_ms = 0
+        self._value_ms = 0
+        self._lanes = 0
+        self._pending_ms = 0
+        self._lanes_version = None
+
+    def power(self):
+        """Current draw of the whole fleet in watts."""
+        if self.power_source is not None:
+            return self.power_source()
+        return self.base_watts * len(self.fleet) + self.watts_per_unit * sum(self.fleet.values)
+
+    def _flush(self):
+        if self._pending_ms:
+            self._value_ms += self._lanes * self._pending_ms
+            self._pending_ms = 0
+
+    def accumulate(self, elapsed_ms):
+        """Charges 'elapsed_ms' milliseconds at the current values to every component."""
+        if self.fleet.version != self._lanes_version:
+            self._flush()
+            lanes = bytearray(8 * len(self.fleet))
+            lanes[0::8] = self.fleet.values
+            self._lanes = int.from_bytes(lanes, "little")
+            self._lanes_version = self.fleet.version
+        self._pending_ms += elapsed_ms
+        self.elapsed_ms += elapsed_ms
+
+    def component_energy(self):
+        """Yields (component_id, Wh) for every component, one at a time."""
+        self._flush()
+        count = len(self.fleet)
+        sums = array("Q")
+        sums.frombytes(self._value_ms.to_bytes(8 * count, "little"))
+        if sums.itemsize != 8:
+            raise RuntimeError("64-bit lanes are required for per-component energy sums.")
+        base_wh = self.base_watts * self.elapsed_ms / 3_600_000
+        unit_wh = self.watts_per_unit / 3_600_000
+        for component_id, value_ms in zip(self.fleet.ids, sums):
+            yield component_id, base_wh + unit_wh * value_ms
+
+class PowerMeter:
+    """Meters a single component whose draw in watts is returned by 'watts'()."""
+    def __init__(self, category, component_id, watts):
+        self.category = category
+        self.component_id = component_id
+        self.watts = watts
+        self.elapsed_ms = 0
+        self._energy_wh = 0.0
+
+    def power(self):
+        return self.watts()
+
+    def accumulate(self, elapsed_ms):
+        self._energy_wh += self.watts() * elapsed_ms / 3_600_000
+        self.elapsed_ms += elapsed_ms
+
+    def component_energy(self):
+        yield self.component_id, self._energy_wh
+
+# --- Aggregation ---
+class ConsumptionLedger:
+    """
+    Running consumption totals over a time window.
+    Every sample(now) charges the interval since the previous sample to the
+    meters' current draw (the draw at the end of the interval; changes in
+    between are not seen, see FleetMeter): per-category running sums and peaks, per-component
+    integrals (see FleetMeter) and time-bucketed rollups ('bucket_seconds' wide,
+    keyed by the start of the interval; at most 'max_buckets' are kept).
+    Sample times are clock readings; 'format_time' (e.g. the clock's
+    format_time()) turns them into the labels of text reports.
+    """
+    def __init__(self, bucket_seconds=3600, max_buckets=24 * 31, format_time=None):
+        self.bucket_seconds = bucket_seconds
+        self.max_buckets = max_buckets
+        self.format_time = format_time
+        self.meters = []
+        self.start = None
+        self.last_sample = None
+        self.totals_wh = {}
+        self.peaks_w = {}
+        self.buckets = OrderedDict()
+
+    def add_meter(self, meter):
+        self.meters.append(meter)
+        self.totals_wh.setdefault(meter.category, 0.0)
+        self.peaks_w.setdefault(meter.category, 0.0)
+
+    def sample(self, now):
+        if self.last_sample is None:
+            if self.start is None:
+                self.start = now
+            self.last_sample = now
+            return
+        elapsed_ms = round((now - self.last_sample) * 1000)
+        if elapsed_ms <= 0:
+            return
+        bucket_start = self.last_sample // self.bucket_seconds * self.bucket_seconds
+        bucket = self.buckets.get(bucket_start)
+        if bucket is None:
+            bucket = self.buckets[bucket_start] = {}
+            while len(self.buckets) > self.max_buckets:
+                self.buckets.popitem(last=False)
+        for meter in self.meters:
+            watts = meter.power()
+            energy_wh = watts * elapsed_ms / 3_600_000
+            self.totals_wh[meter.category] += energy_wh
+            self.peaks_w[meter.category] = max(self.peaks_w[meter.category], watts)
+            bucket[meter.category] = bucket.get(meter.category, 0.0) + energy_wh
+            meter.accumulate(elapsed_ms)
+        self.last_sample = now
+
+    def restart_sampling(self):
+        """Forgets the previous sample time (e.g. after switching clocks); totals are kept."""
+        self.last_sample = None
+
+    @property
+    def total_wh(self):
+        return sum(self.totals_wh.values())
+
+    def summary(self):
+        """Structured report (without per-component rows) as a dict."""
+        return {
+            "window": {"start": self.start, "end": self.last_sample},
+            "total_kwh": self.total_wh / 1000,
+            "categories": {
+                category: {"kwh": wh / 1000, "peak_w": self.peaks_w[category]}
+                for category, wh in self.totals_wh.items()
+            },
+            "buckets": [
+                {"start": start, "kwh": {category: wh / 1000 for category, wh in bucket.items()}}
+                for start, bucket in self.buckets.items()
+            ],
+        }
+
+    def time_label(self, seconds):
+        if seconds is None:
+            return "no samples"
+        return self.format_time(seconds) if self.format_time is not None else f"{seconds:g}s"
+
+    def header_record(self):
+        window = f"{self.time_label(self.start)} - {self.time_label(self.last_sample)}"
+        return {"section": "header", "start": self.start, "end": self.last_sample, "window": window,
+                "total_kwh": self.total_wh / 1000}
+
+    def body_records(self, buckets=True, components=True):
+        """Yields the report body as flat records: category totals, then buckets, then components."""
+        for category, wh in self.totals_wh.items():
+            yield {"section": "category", "category": category, "kwh": wh / 1000, "peak_w": self.peaks_w[category]}
+        if buckets:
+            for start, bucket in self.buckets.items():
+                for category, wh in bucket.items():
+                    yield {"section": "bucket", "start": start, "time": self.time_label(start), "category": category,
+                           "kwh": wh / 1000}
+        if components:
+            for meter in self.meters:
+                for component_id, wh in meter.component_energy():
+                    yield {"section": "component", "category": meter.category, "component_id": component_id, "kwh": wh / 1000}
+
+FOOTER_RECORD = {"section": "footer"}
+
+# --- Streaming output ---
+CSV_FIELDS = ("section", "category", "component_id", "start", "end", "kwh", "peak_w", "total_kwh")
+
+def text_line(record):
+    section = record["section"]
+    if section == "header":
+        return (f"--- Energy Consumption Report ---\nWindow: {record['window']}\n"
+                f"Total Consumption (kWh): {record['total_kwh']:.3f}")
+    if section == "category":
+        return f"{record['category'].capitalize()} Usage: {record['kwh']:.3f} kWh (peak {record['peak_w']:.0f} W)"
+    if section == "bucket":
+        return f"  [{record['time']}] {record['category']}: {record['kwh']:.3f} kWh"
+    if section == "component":
+        return f"    {record['category']} {record['component_id']}: {record['kwh']:.6f} kWh"
+    return "--- End of Report ---"
+
+class StreamingEnergyReportBuilder(ReportBuilder):
+    """
+    A concrete builder that writes the report to 'sink' (anything with write(),
+    e.g. an open file or socket.makefile("w")) record by record instead of
+    joining it into one string. 'format' is "text", "jsonl" or "csv".
+    get_result() returns the structured summary dict.
+    """
+    FORMATS = ("text", "jsonl", "csv")
+
+    def __init__(self, ledger, sink, format="text", components=True):
+        if format not in self.FORMATS:
+            raise ValueError(f"Unknown report format '{format}'. Must be one of {self.FORMATS}.")
+        self.ledger = ledger
+        self.sink = sink
+        self.format = format
+        self.components = components
+        self.records_written = 0
+        self._csv = None
+
+    def reset(self):
+        self.records_written = 0
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self.sink, CSV_FIELDS, extrasaction="ignore", lineterminator="\n")
+            self._csv.writeheader()
+
+    def _write(self, record):
+        if self.format == "jsonl":
+            self.sink.write(json.dumps(record) + "\n")
+        elif self.format == "csv":
+            self._csv.writerow(record)
+        else:
+            self.sink.write(text_line(record) + "\n")
+        self.records_written += 1
+
+    def build_header(self):
+        self._write(self.ledger.header_record())
+
+    def build_body(self):
+        for record in self.ledger.body_records(components=self.components):
+            self._write(record)
+
+    def build_footer(self):
+        self._write(FOOTER_RECORD)
+        flush = getattr(self.sink, "flush", None)
+        if flush is not None:
+            flush()
+
+    def get_result(self):
+        return self.ledger.summary()
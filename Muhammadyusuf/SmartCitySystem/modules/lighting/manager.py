@@ -1,5 +1,8 @@
 from core.factories.factory_method import SmartCityComponent
+from core.fleet.store import ComponentFleet, FleetView, uniform_bytes
+from modules.lighting.zones import ZonedLightingControl
 import random
+import threading
 
 # --- Abstract Factory (Base) ---
 class StreetLightFactory:
@@ -15,62 +18,241 @@ class StreetLightFactory:
     def create_sensor(self):
         pass
 
+    def create_many(self, count):
+        """Creates 'count' lights; fleet-backed factories override this with a bulk allocation."""
+        return [self.create_light() for _ in range(count)]
+
 # --- Concrete Products ---
-class LEDLight(SmartCityComponent):
+class StreetLight(FleetView, SmartCityComponent):
+    """
+    Base for street lights backed by a row of a LightFleet (brightness in percent).
+    Constructing one directly creates a private single-light fleet.
+    """
+    __slots__ = ()
+    label = "Street Light"
+    # Draw at 100% brightness; the draw scales linearly with brightness.
+    rated_watts = 150
+    default_brightness = 50
+    min_brightness = 30
+    max_brightness = 100
+
     def __init__(self, light_id):
-        self.light_id = light_id
-        self.brightness = 50
+        self._fleet = LightFleet(type(self))
+        self._index = self._fleet.append(light_id)
 
-    def operate(self):
-        self.brightness = random.randint(30, 100)
-        return f"LED Light {self.light_id} adjusted to {self.brightness}%"
+    @property
+    def light_id(self):
+        return self._fleet.ids[self._index]
 
-    def get_status(self):
-        return f"LED Light {self.light_id}: {self.brightness}%"
+    @property
+    def brightness(self):
+        return self._fleet.values[self._index]
 
-class HalogenLight(SmartCityComponent):
-    def __init__(self, light_id):
-        self.light_id = light_id
-        self.brightness = 70
+    @brightness.setter
+    def brightness(self, value):
+        self._fleet.set_value(self._index, value)
+
+    @classmethod
+    def render_status(cls, light_id, brightness):
+        return f"{cls.label} {light_id}: {brightness}%"
 
     def operate(self):
-        self.brightness = random.randint(50, 100)
-        return f"Halogen Light {self.light_id} adjusted to {self.brightness}%"
+        self.brightness = self._fleet.rng.randint(self.min_brightness, self.max_brightness)
+        return f"{self.label} {self.light_id} adjusted to {self.brightness}%"
 
     def get_status(self):
-        return f"Halogen Light {self.light_id}: {self.brightness}%"
+        return self.render_status(self.light_id, self.brightness)
+
+class LEDLight(StreetLight):
+    __slots__ = ()
+    label = "LED Light"
+    rated_watts = 100
+    default_brightness = 50
+    min_brightness = 30
+
+class HalogenLight(StreetLight):
+    __slots__ = ()
+    label = "Halogen Light"
+    rated_watts = 250
+    default_brightness = 70
+    min_brightness = 50
+
+class LightFleet(ComponentFleet):
+    """
+    Columnar store of one family of street lights: IDs plus one brightness byte per light.
+    'rng' (default: the global random module) drives every brightness draw.
+    """
+    def __init__(self, view_class=LEDLight, rng=None):
+        super().__init__(view_class)
+        self.default_value = view_class.default_brightness
+        self.rng = rng if rng is not None else random
+
+    def randomize_all(self, rng=None):
+        """Draws a new brightness for every light with one bulk RNG call."""
+        rng = rng if rng is not None else self.rng
+        self.load_values(uniform_bytes(rng, len(self), self.view_class.min_brightness, self.view_class.max_brightness))
+
+    def describe_changes(self):
+        """Builds the per-light messages StreetLight.operate() would have returned."""
+        label = self.view_class.label
+        return [f"{label} {light_id} adjusted to {value}%" for light_id, value in zip(self.ids, self.values)]
 
 class MotionSensor:
+    """Motion detections arrive as a Poisson process of 'rate_per_hour' events."""
+    def __init__(self, rng=None, rate_per_hour=6.0):
+        self.rng = rng if rng is not None else random
+        self.rate_per_hour = rate_per_hour
+
     def detect(self):
-        return random.choice([True, False])
+        return self.rng.choice([True, False])
+
+    def next_detection(self, now):
+        """Time (seconds) of the first detection after 'now'."""
+        return now + self.rng.expovariate(self.rate_per_hour / 3600)
 
 # --- Concrete Factories ---
 class EnergyEfficientFactory(StreetLightFactory):
-    def __init__(self):
+    # The light family this factory builds.
+    light_class = LEDLight
+
+    def __init__(self, rng=None):
+        self.rng = rng
         self.light_id_counter = 1
+        self.fleet = LightFleet(self.light_class, rng)
 
     def create_light(self):
-        light = LEDLight(self.light_id_counter)
+        index = self.fleet.append(self.light_id_counter)
         self.light_id_counter += 1
-        return light
+        return self.fleet.view(index)
 
-    def create_sensor(self):
-        return MotionSensor()
+    def create_many(self, count, brightness=None):
+        """
+        Allocates 'count' lights with a contiguous ID range in one step.
+        Returns the range of the new IDs (no per-light objects are created).
+        """
+        first_id = self.light_id_counter
+        self.fleet.extend(first_id, count, brightness)
+        self.light_id_counter += count
+        return range(first_id, self.light_id_counter)
+
+    def create_from_spec(self, spec):
+        """Bulk creation from a spec such as {"count": 1000, "brightness": 80}."""
+        return self.create_many(spec["count"], spec.get("brightness"))
+
+    def create_sensor(self, rate_per_hour=6.0):
+        return MotionSensor(self.rng, rate_per_hour)
+
+class HalogenFactory(EnergyEfficientFactory):
+    """Builds the conventional family: halogen lights with the same motion sensors."""
+    light_class = HalogenLight
+
+# Street light families selectable through LightingManager's 'light_type' option.
+LIGHT_FACTORIES = {"led": EnergyEfficientFactory, "halogen": HalogenFactory}
 
 # --- Subsystem Manager ---
 class LightingManager:
-    def __init__(self):
-        self.factory = EnergyEfficientFactory()
-        self.lights = [self.factory.create_light() for _ in range(5)]
-        self.sensor = self.factory.create_sensor()
+    """
+    Runs the street light fleet event-driven: the lights are grouped into zones
+    of 'zone_size' with one motion sensor each, and every adjust_brightness
+    step ('tick_seconds' of simulated time) only rewrites the zones whose
+    sensors fired or whose hold expired, plus the whole fleet when the
+    schedule's baseline changes (see ZonedLightingControl). 'light_type'
+    picks the light family from LIGHT_FACTORIES ("led" or "halogen").
+    """
+    # Actions operate() performs; metrics label any other action "other".
+    ACTIONS = ("adjust_brightness",)
+
+    def __init__(self, rng=None, fleet_size=5, zone_size=50, tick_seconds=60.0, hold_seconds=120.0, motion_per_hour=6.0,
+                 light_type="led"):
+        if light_type not in LIGHT_FACTORIES:
+            raise ValueError(f"Unknown light type '{light_type}'. Must be one of: {', '.join(LIGHT_FACTORIES)}.")
+        # Serializes operate(), get_status() and telemetry() (see SmartCityController).
+        self.lock = threading.RLock()
+        self.factory = LIGHT_FACTORIES[light_type](rng)
+        self.factory.create_many(fleet_size)
+        self.lights = self.factory.fleet
+        self.sensor = self.factory.create_sensor(motion_per_hour)
+        self.zones = ZonedLightingControl(self.lights, self.sensor, zone_size, tick_seconds, hold_seconds)
         self.status = "Operational"
 
-    def operate(self, action=None):
-        if action == "adjust_brightness":
-            results = [c.operate() for c in self.lights]
-            return f"Lighting: Adjusted brightness based on time/motion. Changes: {results}"
-        return "Lighting: No specific action taken."
+    @property
+    def nbytes(self):
+        """Bytes held by the light fleet and its zone columns."""
+        return self.lights.nbytes + self.zones.nbytes
+
+    @property
+    def version(self):
+        """Grows whenever any light changes brightness."""
+        return self.lights.version
+
+    def change_sources(self):
+        """Objects whose 'change_listener' reports component changes (see ChangeFeed)."""
+        return (self.lights,)
+
+    def power_watts(self):
+        """
+        Current draw of the whole fleet, kept up to date by the zone control
+        (O(1)). Takes no lock: energy meters call it while holding the energy
+        manager's lock, and taking lighting's lock there would invert the
+        controller's lock order (see SmartCityController._locked_subsystems()).
+        """
+        return self.zones.power_watts()
+
+    def _describe_zones(self, changes):
+        parts = []
+        for zone, level in changes:
+            if zone is None:
+                parts.append(f"all zones {level}%")
+            else:
+                start, stop = self.zones.zone_range(zone)
+                parts.append(f"zone {zone} (lights {self.lights.ids[start]}-{self.lights.ids[stop - 1]}) {level}%")
+        return parts
+
+    def operate(self, action=None, detail=True):
+        """
+        Performs 'action' on the whole fleet in one batched step.
+        Per-zone change messages are only built when 'detail' is true.
+        """
+        with self.lock:
+            if action == "adjust_brightness":
+                changes = self.zones.tick()
+                if detail:
+                    return f"Lighting: Adjusted brightness based on time/motion. Changes: {self._describe_zones(changes)}"
+                return f"Lighting: Adjusted brightness based on time/motion. Changes: {len(changes)} zones updated"
+            return "Lighting: No specific action taken."
+
+    def checkpoint_state(self):
+        """The fleet, its ID counter and the zone control as (JSON-serializable state, {column: array})."""
+        state = {"light_class": self.lights.view_class.__name__, "next_id": self.factory.light_id_counter,
+                 "zones": self.zones.state()}
+        columns = {"ids": self.lights.ids, "values": self.lights.values}
+        columns.update((f"zones.{name}", column) for name, column in self.zones.columns().items())
+        return state, columns
+
+    def restore_state(self, state, columns):
+        """Restores checkpoint_state() output; the checkpoint must hold the same light class."""
+        if state["light_class"] != self.lights.view_class.__name__:
+            raise ValueError(f"Checkpoint holds {state['light_class']} lights, not {self.lights.view_class.__name__}.")
+        self.lights.load_columns(columns["ids"], columns["values"])
+        if state.get("zones") is not None:
+            self.zones.restore(state["zones"], {name[6:]: column for name, column in columns.items() if name.startswith("zones.")})
+        self.factory.light_id_counter = state["next_id"]
+
+    def telemetry(self):
+        """Current readings for the telemetry store."""
+        with self.lock:
+            power = self.zones.power_watts()
+            mean = self.zones.brightness_total / len(self.lights) if len(self.lights) else 0.0
+            return {"mean_brightness": mean, "sensor_active": int(self.zones.active_zones > 0),
+                    "active_zones": self.zones.active_zones, "power_w": power}
 
     def get_status(self):
-        component_statuses = [c.get_status() for c in self.lights]
-        return {"manager_status": self.status, "components": component_statuses, "sensor_active": self.sensor.detect()}
+        with self.lock:
+            component_statuses = self.lights.statuses()
+            return {"manager_status": self.status, "components": component_statuses,
+                    "sensor_active": self.zones.active_zones > 0, "active_zones": self.zones.active_zones,
+                    "zones": self.zones.zones, "power_w": self.zones.power_watts()}
+
+def create_manager(context):
+    """Subsystem factory for the controller's registry (see core.registry.subsystems)."""
+    return LightingManager(context.rng, **context.options)
@@ -0,0 +1,208 @@
+import heapq
+from array import array
+
+# Baseline brightness by hour of day: (from_hour, percent), clamped to the light's range.
+DEFAULT_SCHEDULE = ((0, 40), (6, 0), (19, 60))
+
+class ZoneSensors:
+    """
+    One motion sensor per zone. Detections are a Poisson process per zone: the
+    time of every zone's next detection (drawn by the MotionSensor model) sits
+    in a heap, so poll() only touches the zones whose sensors fired.
+    """
+    def __init__(self, sensor, zones=0, now=0.0):
+        self.sensor = sensor
+        self.zones = 0
+        self._heap = []
+        self.add_zones(zones, now)
+
+    def add_zones(self, count, now):
+        start = self.zones
+        self._heap.extend((self.sensor.next_detection(now), zone) for zone in range(start, start + count))
+        heapq.heapify(self._heap)
+        self.zones += count
+
+    def poll(self, now):
+        """Zones with at least one detection up to 'now' (each zone once per batch), in firing order."""
+        heap, fired, seen = self._heap, [], set()
+        while heap and heap[0][0] <= now:
+            when, zone = heap[0]
+            heapq.heapreplace(heap, (self.sensor.next_detection(when), zone))
+            if zone not in seen:
+                seen.add(zone)
+                fired.append(zone)
+        return fired
+
+class ZonedLightingControl:
+    """
+    Event-driven brightness control for a LightFleet split into zones of
+    'zone_size' consecutive lights. A zone is set to full brightness when its
+    sensor fires and falls back to the schedule's baseline 'hold_seconds' after
+    its last detection; the whole fleet is only rewritten when the baseline
+    changes (a few times a day). Each tick therefore costs O(active zones).
+
+    The sum of all brightness values is kept up to date as zones change, so
+    power_watts() is O(1). If the fleet is changed from outside (views,
+    randomize_all()), the next tick resynchronizes. state(), columns() and
+    restore() checkpoint the zone control, as TrafficFlow does.
+    """
+    def __init__(self, fleet, sensor, zone_size=50, tick_seconds=60.0, hold_seconds=300.0,
+                 schedule=DEFAULT_SCHEDULE, start_time=0.0):
+        self.fleet = fleet
+        self.zone_size = zone_size
+        self.tick_seconds = tick_seconds
+        self.hold_seconds = hold_seconds
+        self.schedule = sorted(schedule)
+        self.now = start_time
+        self.sensors = ZoneSensors(sensor, now=start_time)
+        self.zone_levels = bytearray()
+        self.active_until = array("d")
+        self.active_zones = 0
+        self.baseline = None
+        self.brightness_total = 0
+        self.last_changes = []
+        self._expiries = []
+        self._version = None
+        self._sync()
+
+    @property
+    def zones(self):
+        return len(self.zone_levels)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the per-zone columns (brightness levels and hold deadlines)."""
+        return len(self.zone_levels) + self.active_until.itemsize * len(self.active_until)
+
+    def zone_range(self, zone):
+        start = zone * self.zone_size
+        return start, min(start + self.zone_size, len(self.fleet))
+
+    def level_at(self, now):
+        """The schedule's baseline brightness at time 'now' (seconds), clamped to the light's range."""
+        hour = now / 3600 % 24
+        level = self.schedule[-1][1]
+        for from_hour, percent in self.schedule:
+            if from_hour <= hour:
+                level = percent
+        light_class = self.fleet.view_class
+        return max(light_class.min_brightness, min(light_class.max_brightness, level))
+
+    def _sync(self):
+        """Re-reads the fleet after changes made outside this controller (lights added or removed)."""
+        zones = -(-len(self.fleet) // self.zone_size)
+        if zones > len(self.active_until):
+            self.active_until.frombytes(bytes(8 * (zones - len(self.active_until))))
+        elif zones < len(self.active_until):
+            self.active_zones -= sum(until > 0 for until in self.active_until[zones:])
+            del self.active_until[zones:]
+        if zones > self.sensors.zones:
+            self.sensors.add_zones(zones - self.sensors.zones, self.now)
+        values = self.fleet.values
+        self.zone_levels[:] = values[0::self.zone_size]
+        self.brightness_total = sum(values)
+        self._version = self.fleet.version
+
+    def _set_zone(self, zone, level):
+        start, stop = self.zone_range(zone)
+        if stop <= start:
+            return False
+        if self.zone_levels[zone] == level and self.fleet.values[start:stop].count(level) == stop - start:
+            return False
+        self.brightness_total += level * (stop - start) - sum(self.fleet.values[start:stop])
+        self.fleet.fill(start, stop, level)
+        self.zone_levels[zone] = level
+        self.last_changes.append((zone, level))
+        return True
+
+    def _apply_baseline(self, level):
+        """Schedule change: every idle zone goes to 'level' in one bulk write, active zones stay lit."""
+        values = bytearray((level,)) * len(self.fleet)
+        full = self.fleet.view_class.max_brightness
+        for zone in range(self.zones):
+            if self.active_until[zone] > self.now:
+                start, stop = self.zone_range(zone)
+                values[start:stop] = bytes((full,)) * (stop - start)
+        self.fleet.load_values(values)
+        self.zone_levels[:] = values[0::self.zone_size]
+        self.brightness_total = sum(values)
+        self.last_changes.append((None, level))
+
+    def tick(self):
+        """Advances 'tick_seconds': applies schedule changes, sensor events and expired holds."""
+        if self._version != self.fleet.version or -(-len(self.fleet) // self.zone_size) != self.zones:
+            self._sync()
+        self.now += self.tick_seconds
+        self.last_changes = []
+        baseline = self.level_at(self.now)
+        if baseline != self.baseline:
+            self.baseline = baseline
+            self._apply_baseline(baseline)
+
+        full = self.fleet.view_class.max_brightness
+        for zone in self.sensors.poll(self.now):
+            if zone >= self.zones:
+                continue
+            if not self.active_until[zone]:
+                self.active_zones += 1
+            self.active_until[zone] = self.now + self.hold_seconds
+            heapq.heappush(self._expiries, (self.now + self.hold_seconds, zone))
+            self._set_zone(zone, full)
+
+        expiries = self._expiries
+        while expiries and expiries[0][0] <= self.now:
+            until, zone = heapq.heappop(expiries)
+            # Skip stale entries: the zone fired again and holds a later expiry (or was removed).
+            if zone < self.zones and self.active_until[zone] == until:
+                self.active_until[zone] = 0.0
+                self.active_zones -= 1
+                self._set_zone(zone, self.baseline)
+        self._version = self.fleet.version
+        return self.last_changes
+
+    def state(self):
+        """JSON-serializable scalars (the zone, sensor and expiry columns go into checkpoint columns, see columns())."""
+        return {"now": self.now, "baseline": self.baseline, "active_zones": self.active_zones}
+
+    def columns(self):
+        """
+        Hold deadlines per zone plus the sensor and expiry heaps as parallel
+        (time, zone) columns, in heap order, so restore() needs no re-heapify.
+        """
+        sensors, expiries = self.sensors._heap, self._expiries
+        return {
+            "active_until": self.active_until,
+            "sensor_times": array("d", [when for when, _ in sensors]),
+            "sensor_zones": array("q", [zone for _, zone in sensors]),
+            "expiry_times": array("d", [until for until, _ in expiries]),
+            "expiry_zones": array("q", [zone for _, zone in expiries]),
+        }
+
+    def restore(self, state, columns):
+        """
+        Restores state() and columns() (any buffers with the same layout) after
+        the fleet itself was restored; levels and the brightness total are
+        re-read from the fleet.
+        """
+        def load(typecode, buffer):
+            column = array(typecode)
+            column.frombytes(buffer)
+            return column
+        self.now, self.baseline, self.active_zones = state["now"], state["baseline"], state["active_zones"]
+        self.active_until = load("d", columns["active_until"])
+        self.sensors._heap = list(zip(load("d", columns["sensor_times"]), load("q", columns["sensor_zones"])))
+        self.sensors.zones = len(self.sensors._heap)
+        self._expiries = list(zip(load("d", columns["expiry_times"]), load("q", columns["expiry_zones"])))
+        self.last_changes = []
+        self._sync()
+
+    def power_watts(self):
+        """
+        Current draw of the fleet. Read-only and safe without the owner's lock:
+        it reads the running brightness total, or sums the fleet (without
+        resyncing) if the fleet was changed behind the zone control's back.
+        """
+        per_unit = self.fleet.view_class.rated_watts / 100
+        if self._version != self.fleet.version:
+            return per_unit * sum(self.fleet.values)
+        return per_unit * self.brightness_total
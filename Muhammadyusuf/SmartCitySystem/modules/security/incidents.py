@@ -0,0 +1,274 @@
+import bisect
+import heapq
+import itertools
+import time
+from collections import deque
+
+# Event kinds reported by cameras and sensors, with the severity each implies (index into SEVERITY_NAMES).
+EVENT_KINDS = ("motion", "camera", "door", "alarm", "gunshot")
+KIND_SEVERITY = (0, 1, 1, 2, 3)
+SEVERITY_NAMES = ("low", "medium", "high", "critical")
+HIGH = SEVERITY_NAMES.index("high")
+# Relative frequency of each event kind in simulated streams.
+DEFAULT_KIND_WEIGHTS = (60, 25, 10, 4, 1)
+
+# Incident states.
+OPEN, QUEUED, DISPATCHED, SHED = range(4)
+
+def event_stream(rng, zones, events_per_second, seconds, start=0.0, kind_weights=DEFAULT_KIND_WEIGHTS):
+    """
+    Simulated sensor feed: (time, zone, kind) tuples with Poisson arrivals over
+    'zones' zones between 'start' and 'start + seconds'. Events are generated
+    lazily, so a burst never sits in memory as a whole.
+    """
+    if events_per_second <= 0:
+        return
+    cum_weights = list(itertools.accumulate(kind_weights))
+    total = cum_weights.pop()
+    expovariate, randrange, uniform = rng.expovariate, rng.randrange, rng.random
+    now, end = start, start + seconds
+    while True:
+        now += expovariate(events_per_second)
+        if now >= end:
+            return
+        yield now, randrange(zones), bisect.bisect(cum_weights, uniform() * total)
+
+class Incident:
+    """The events of one zone correlated within a window, with their merged severity."""
+    __slots__ = ("id", "zone", "severity", "peak", "kinds", "events", "first_seen", "last_seen",
+                 "state", "dispatched_at", "unit")
+
+    def __init__(self, incident_id, zone, now):
+        self.id = incident_id
+        self.zone = zone
+        self.severity = 0
+        self.peak = 0
+        self.kinds = 0
+        self.events = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.state = OPEN
+        self.dispatched_at = None
+        self.unit = None
+
+    def describe(self):
+        return f"Incident {self.id} in zone {self.zone}: {SEVERITY_NAMES[self.severity]}, {self.events} events"
+
+class IncidentPipeline:
+    """
+    Turns camera/sensor events into prioritized incidents and assigns patrols.
+
+    Events of one zone less than 'window_seconds' apart are correlated into one
+    incident (later duplicates only update it). An incident's severity is the
+    worst event's, raised one level when two or more kinds of sensor agree; it
+    is queued once it reaches HIGH or 'min_events' events, so single low events
+    are filtered as noise. The queue is a heap ordered by severity, then age;
+    whenever a patrol unit is free the top incident is dispatched to it, and the
+    unit is busy for 'response_seconds'.
+
+    Memory stays bounded under bursts: events are consumed one at a time,
+    correlation keeps one open incident per zone, and at most 'max_queue'
+    incidents below HIGH wait in the queue; further ones are shed (counted in
+    'shed'). High and critical incidents are never shed.
+    """
+    def __init__(self, zones=100, patrol_units=4, window_seconds=60.0, min_events=3, max_queue=1000,
+                 response_seconds=600.0, latency_samples=1024):
+        self.zones = zones
+        self.window_seconds = window_seconds
+        self.min_events = min_events
+        self.max_queue = max_queue
+        self.response_seconds = response_seconds
+        self.now = None
+        self.start = None
+        self._ids = itertools.count(1)
+        self._open = {}
+        self._queue = []
+        self._queued = 0
+        self._queued_low = 0
+        self._free_units = list(range(patrol_units - 1, -1, -1))
+        self._busy = []
+        self.assigned = {}
+        self.recent = deque(maxlen=20)
+        self.events = 0
+        self.merged = 0
+        self.raised = 0
+        self.dispatched = 0
+        self.shed = [0] * len(SEVERITY_NAMES)
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latencies = deque(maxlen=latency_samples)
+        self.busy_s = 0.0
+
+    def ingest(self, events):
+        """Processes an iterable of (time, zone, kind) events in time order; returns the number processed."""
+        started = time.perf_counter()
+        count = self.events
+        window, open_incidents, busy = self.window_seconds, self._open, self._busy
+        for now, zone, kind in events:
+            self.events += 1
+            incident = open_incidents.get(zone)
+            if incident is None or now - incident.last_seen > window:
+                incident = open_incidents[zone] = Incident(next(self._ids), zone, now)
+            else:
+                self.merged += 1
+            if incident.kinds >> kind & 1 and incident.state != OPEN:
+                # Repeat of a kind already seen on a raised incident: its priority cannot change.
+                incident.events += 1
+                incident.last_seen = self.now = now
+            else:
+                self._update(incident, now, kind)
+            if self._queued and (self._free_units or (busy and busy[0][0] <= now)):
+                self.dispatch(now)
+        self.busy_s += time.perf_counter() - started
+        return self.events - count
+
+    async def aingest(self, source):
+        """Asyncio variant of ingest(): consumes an async iterable of (time, zone, kind) events."""
+        count = 0
+        async for event in source:
+            count += self.ingest((event,))
+        return count
+
+    def _update(self, incident, now, kind):
+        if self.now is None:
+            self.start = now
+        self.now = now if self.now is None else max(self.now, now)
+        incident.events += 1
+        incident.last_seen = now
+        incident.kinds |= 1 << kind
+        incident.peak = max(incident.peak, KIND_SEVERITY[kind])
+        severity = min(len(SEVERITY_NAMES) - 1, incident.peak + (incident.kinds.bit_count() > 1))
+        if severity > incident.severity:
+            old = incident.severity
+            incident.severity = severity
+            if incident.state == QUEUED:
+                # Re-prioritize; the old heap entry goes stale and is skipped when popped.
+                if old < HIGH <= severity:
+                    self._queued_low -= 1
+                heapq.heappush(self._queue, (-severity, incident.first_seen, incident.id, incident))
+            elif incident.state == SHED and severity >= HIGH:
+                self._enqueue(incident)
+        if incident.state == OPEN and (incident.severity >= HIGH or incident.events >= self.min_events):
+            self._enqueue(incident)
+
+    def _enqueue(self, incident):
+        if incident.severity < HIGH:
+            if self._queued_low >= self.max_queue:
+                self.shed[incident.severity] += 1
+                incident.state = SHED
+                return
+            self._queued_low += 1
+        self.raised += 1
+        incident.state = QUEUED
+        self._queued += 1
+        heapq.heappush(self._queue, (-incident.severity, incident.first_seen, incident.id, incident))
+
+    def dispatch(self, now):
+        """Frees the units whose response is over and assigns free units to the top incidents."""
+        busy, free, queue = self._busy, self._free_units, self._queue
+        while busy and busy[0][0] <= now:
+            _, unit = heapq.heappop(busy)
+            del self.assigned[unit]
+            free.append(unit)
+        while free and queue:
+            severity, _, _, incident = heapq.heappop(queue)
+            if incident.state != QUEUED or -severity != incident.severity:
+                continue
+            self._queued -= 1
+            if incident.severity < HIGH:
+                self._queued_low -= 1
+            unit = free.pop()
+            incident.state = DISPATCHED
+            incident.dispatched_at = now
+            incident.unit = unit
+            self.assigned[unit] = incident
+            heapq.heappush(busy, (now + self.response_seconds, unit))
+            latency = now - incident.first_seen
+            self.dispatched += 1
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.latencies.append(latency)
+            self.recent.append(incident)
+
+    def advance(self, now):
+        """Moves the pipeline's time to 'now' without new events (frees units, dispatches waiting incidents)."""
+        self.now = now if self.now is None else max(self.now, now)
+        self.dispatch(self.now)
+
+    def state(self):
+        """
+        JSON-serializable snapshot of the pipeline for checkpoints (see restore()).
+        Incidents are stored once, as lists of their fields, and referenced by
+        id from the open windows, the queue, the units and the recent list.
+        """
+        incidents = {}
+        for incident in itertools.chain(self._open.values(), (entry[3] for entry in self._queue),
+                                        self.assigned.values(), self.recent):
+            incidents[incident.id] = [getattr(incident, name) for name in Incident.__slots__]
+        next_id = next(self._ids)
+        self._ids = itertools.count(next_id)
+        return {
+            "now": self.now, "start": self.start, "next_id": next_id,
+            "incidents": list(incidents.values()),
+            "open": [incident.id for incident in self._open.values()],
+            # Heap order, stale entries included, so dispatching continues exactly as it would have.
+            "queue": [[severity, incident.id] for severity, _, _, incident in self._queue],
+            "queued": self._queued, "queued_low": self._queued_low,
+            "free_units": self._free_units, "busy": self._busy,
+            "assigned": [[unit, incident.id] for unit, incident in self.assigned.items()],
+            "recent": [incident.id for incident in self.recent],
+            "events": self.events, "merged": self.merged, "raised": self.raised, "dispatched": self.dispatched,
+            "shed": self.shed, "latency_sum": self.latency_sum, "latency_max": self.latency_max,
+            "latencies": list(self.latencies), "busy_s": self.busy_s,
+        }
+
+    def restore(self, state):
+        """Restores a state() snapshot (the pipeline's settings are kept)."""
+        incidents = {}
+        for fields in state["incidents"]:
+            incident = Incident.__new__(Incident)
+            for name, value in zip(Incident.__slots__, fields):
+                setattr(incident, name, value)
+            incidents[incident.id] = incident
+        self.now, self.start = state["now"], state["start"]
+        self._ids = itertools.count(state["next_id"])
+        self._open = {incidents[i].zone: incidents[i] for i in state["open"]}
+        self._queue = [(severity, incidents[i].first_seen, i, incidents[i]) for severity, i in state["queue"]]
+        self._queued, self._queued_low = state["queued"], state["queued_low"]
+        self._free_units = list(state["free_units"])
+        self._busy = [tuple(entry) for entry in state["busy"]]
+        self.assigned = {unit: incidents[i] for unit, i in state["assigned"]}
+        self.recent.clear()
+        self.recent.extend(incidents[i] for i in state["recent"])
+        self.events, self.merged, self.raised, self.dispatched = (state[name] for name in ("events", "merged", "raised", "dispatched"))
+        self.shed = list(state["shed"])
+        self.latency_sum, self.latency_max, self.busy_s = state["latency_sum"], state["latency_max"], state["busy_s"]
+        self.latencies.clear()
+        self.latencies.extend(state["latencies"])
+
+    def pending(self):
+        """Incidents waiting for a patrol plus incidents being handled."""
+        return self._queued + len(self.assigned)
+
+    def queue_length(self):
+        return self._queued
+
+    def metrics(self):
+        """Throughput, latency (first event to patrol assignment, in simulated seconds) and load figures."""
+        elapsed_h = (self.now - self.start) / 3600 if self.start is not None and self.now > self.start else 0.0
+        latencies = sorted(self.latencies)
+        return {
+            "events": self.events,
+            "merged_events": self.merged,
+            "incidents": self.raised,
+            "queued": self._queued,
+            "dispatched": self.dispatched,
+            "shed": dict(zip(SEVERITY_NAMES, self.shed)),
+            "units_busy": len(self.assigned),
+            "open_windows": len(self._open),
+            "incidents_per_hour": self.dispatched / elapsed_h if elapsed_h else 0.0,
+            "latency_mean_s": self.latency_sum / self.dispatched if self.dispatched else 0.0,
+            "latency_p95_s": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+            "latency_max_s": self.latency_max,
+            "events_per_s": self.events / self.busy_s if self.busy_s else 0.0,
+        }
@@ -1,22 +1,84 @@
 from core.proxy.proxy import SubsystemInterface
+from core.proxy.access import AccessPolicy, Authorizer
+from modules.security.incidents import IncidentPipeline, event_stream
 import random
+import threading
 
 # --- Real Subject ---
 class RealSecuritySystem(SubsystemInterface):
     """
     The actual security system that performs sensitive operations.
+    Camera and sensor events feed an IncidentPipeline; each patrol request
+    covers 'tick_seconds' of simulated time, pulling that span of the sensor
+    feed ('events_per_second' over 'zones' zones) through the pipeline.
     """
-    def __init__(self):
+    # Power draw in watts while idle and while a patrol is running.
+    IDLE_WATTS = 1500
+    PATROL_WATTS = 5000
+    def __init__(self, rng=None, zones=100, patrol_units=4, events_per_second=0.5, tick_seconds=300.0):
+        self.rng = rng if rng is not None else random
         self.patrol_status = "Idle"
+        self.version = 0
+        self.change_listener = None
+        self.zones = zones
+        self.events_per_second = events_per_second
+        self.tick_seconds = tick_seconds
+        self.now = 0.0
+        self.incidents = IncidentPipeline(zones, patrol_units)
 
     def request(self, user_role: str):
         if user_role == "admin":
+            old_status = self.patrol_status
             self.patrol_status = "Patrol in Progress"
-            return f"Security System: Initiating full city patrol. Status: {self.patrol_status}"
+            if old_status != self.patrol_status:
+                self.version += 1
+                if self.change_listener is not None:
+                    self.change_listener("patrol", old_status, self.patrol_status)
+            dispatched = self.incidents.dispatched
+            events = event_stream(self.rng, self.zones, self.events_per_second, self.tick_seconds, self.now)
+            self.process_events(events, self.now + self.tick_seconds)
+            return (f"Security System: Initiating full city patrol. Status: {self.patrol_status}. "
+                    f"Incidents dispatched: {self.incidents.dispatched - dispatched}, waiting: {self.incidents.queue_length()}")
         return f"Security System: Accessing basic monitoring data for role '{user_role}'."
 
+    def process_events(self, events, until=None):
+        """
+        Runs 'events' through the incident pipeline; simulated time moves to
+        'until' (default: the last event). Bumps 'version' if that changed
+        anything get_status() reports.
+        """
+        incidents = self.incidents
+        before = (self.now, incidents.events, incidents.dispatched, incidents.pending())
+        incidents.ingest(events)
+        if until is None:
+            until = incidents.now if incidents.now is not None else self.now
+        self.now = max(self.now, until)
+        incidents.advance(self.now)
+        if (self.now, incidents.events, incidents.dispatched, incidents.pending()) != before:
+            self.version += 1
+
+    def power_watts(self):
+        return self.PATROL_WATTS if self.patrol_status == "Patrol in Progress" else self.IDLE_WATTS
+
+    def state(self):
+        """JSON-serializable patrol status, simulated time and incident pipeline (see restore())."""
+        return {"patrol_status": self.patrol_status, "version": self.version, "now": self.now,
+                "incidents": self.incidents.state()}
+
+    def restore(self, state):
+        self.patrol_status = state["patrol_status"]
+        if "incidents" in state:
+            self.now = state["now"]
+            self.incidents.restore(state["incidents"])
+        # Never move the version backwards: cached statuses must not match the restored state.
+        self.version = max(self.version, state["version"]) + 1
+
+    def read_incidents(self):
+        """Incidents waiting for a patrol or being handled."""
+        return self.incidents.pending()
+
     def get_status(self):
-        return f"Patrol Status: {self.patrol_status}. Incidents: {random.randint(0, 2)}"
+        return f"Patrol Status: {self.patrol_status}. Incidents: {self.read_incidents()}"
 
 # --- Proxy ---
 class SecuritySystemProxy(SubsystemInterface):
@@ -24,18 +86,22 @@ class SecuritySystemProxy(SubsystemInterface):
     Design Pattern: Proxy (Structural)
     Purpose: Controls access to the RealSecuritySystem.
     Usage: Only 'admin' users can initiate a full city patrol.
+    Access decisions come from a compiled AccessPolicy through an Authorizer.
     """
-    def __init__(self, real_subsystem: RealSecuritySystem):
+    DEFAULT_PERMISSIONS = {"admin": {"run_patrol"}}
+
+    def __init__(self, real_subsystem: RealSecuritySystem, policy: AccessPolicy = None):
         self._real_subsystem = real_subsystem
-        self._admin_roles = ["admin"]
+        self.policy = policy if policy is not None else AccessPolicy(self.DEFAULT_PERMISSIONS)
+        self._authorizer = Authorizer(self.policy)
 
     def request(self, user_role: str):
-        if user_role in self._admin_roles:
+        if self._authorizer.authorize(user_role, "run_patrol"):
             # Admin can perform the sensitive operation
             return self._real_subsystem.request(user_role)
         else:
-            # Other roles get limited access
-            return f"Proxy: Access limited. Only 'admin' can initiate patrol. Current status: {self._real_subsystem.get_status()}"
+            # Other roles get limited access; the patrol status needs no fresh sensor reading
+            return f"Proxy: Access limited. Only 'admin' can initiate patrol. Current status: Patrol Status: {self._real_subsystem.patrol_status}."
 
     def get_status(self):
         # Status check is not a sensitive operation, so it's passed through
@@ -43,20 +109,65 @@ class SecuritySystemProxy(SubsystemInterface):
 
 # --- Subsystem Manager ---
 class SecurityManager:
-    def __init__(self):
-        self._real_system = RealSecuritySystem()
+    # Actions operate() performs; metrics label any other action "other".
+    ACTIONS = ("run_patrol",)
+
+    def __init__(self, rng=None, **options):
+        # Serializes operate(), get_status() and telemetry() (see SmartCityController).
+        self.lock = threading.RLock()
+        self._real_system = RealSecuritySystem(rng, **options)
         # The manager holds the proxy instance
         self.system_proxy = SecuritySystemProxy(self._real_system)
         self.status = "Monitoring"
 
-    def operate(self, action=None):
-        # Simulate a user role for the operation
-        user_role = "manager" # Default role for routine operations
-        if action == "run_patrol":
-            user_role = "admin" # Only admin can run patrol via the proxy
-        
-        result = self.system_proxy.request(user_role)
-        return f"Security: Operation '{action}' attempted with role '{user_role}'. Result: {result}"
+    @property
+    def version(self):
+        """Grows whenever the patrol status or the incident pipeline changes."""
+        return self._real_system.version
+
+    def change_sources(self):
+        """Objects whose 'change_listener' reports component changes (see ChangeFeed)."""
+        return (self._real_system,)
+
+    def operate(self, action=None, detail=True):
+        with self.lock:
+            # Simulate a user role for the operation
+            user_role = "manager" # Default role for routine operations
+            if action == "run_patrol":
+                user_role = "admin" # Only admin can run patrol via the proxy
+
+            result = self.system_proxy.request(user_role)
+            return f"Security: Operation '{action}' attempted with role '{user_role}'. Result: {result}"
+
+    def power_watts(self):
+        """Current draw of the security system; takes no lock (see LightingManager.power_watts())."""
+        return self._real_system.power_watts()
+
+    def checkpoint_state(self):
+        """The patrol status and incident pipeline as (JSON-serializable state, {}): no columns."""
+        return self._real_system.state(), {}
+
+    def restore_state(self, state, columns):
+        self._real_system.restore(state)
+
+    def telemetry(self):
+        """Current readings for the telemetry store."""
+        with self.lock:
+            real = self._real_system
+            metrics = real.incidents.metrics()
+            return {"incidents": real.read_incidents(), "patrolling": int(real.patrol_status == "Patrol in Progress"),
+                    "incidents_dispatched": metrics["dispatched"], "incident_latency_s": metrics["latency_mean_s"]}
+
+    def ingest(self, events, until=None):
+        """Feeds external camera/sensor events, (time, zone, kind) tuples, into the incident pipeline."""
+        with self.lock:
+            self._real_system.process_events(events, until)
 
     def get_status(self):
-        return {"manager_status": self.status, "system_status": self.system_proxy.get_status()}
+        with self.lock:
+            return {"manager_status": self.status, "system_status": self.system_proxy.get_status(),
+                    "incidents": self._real_system.incidents.metrics()}
+
+def create_manager(context):
+    """Subsystem factory for the controller's registry (see core.registry.subsystems)."""
+    return SecurityManager(context.rng, **context.options)
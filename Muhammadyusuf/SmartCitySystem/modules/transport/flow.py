@@ -0,0 +1,169 @@
+import random
+from array import array
+
+# Every lane is a 32-bit field of one big integer; bit 31 is a guard bit for lane-wise comparisons.
+LANE_BITS = 32
+# Per-tick probabilities are stored as bytes, in units of 1/PROBABILITY_SCALE.
+PROBABILITY_SCALE = 256
+
+def spread(column, lane_bytes=LANE_BITS // 8):
+    """Puts each byte of 'column' into the low byte of its own lane; returns the big integer."""
+    lanes = bytearray(lane_bytes * len(column))
+    lanes[0::lane_bytes] = column
+    return int.from_bytes(lanes, "little")
+
+def repeat_lane(value, count):
+    """A big integer with 'value' in each of 'count' lanes."""
+    return int.from_bytes(value.to_bytes(LANE_BITS // 8, "little") * count, "little")
+
+class TrafficFlow:
+    """
+    Vehicle queues behind a traffic light fleet: one approach lane per light.
+    Each tick a vehicle arrives at a lane with its arrival probability, and the
+    vehicle at the head of a queue leaves with its discharge probability if the
+    light is green (so a lane carries at most one vehicle in and one out per
+    tick). Probabilities are kept per lane in units of 1/256 ('arrival' and
+    'discharge' byte columns).
+
+    There is no per-lane Python loop: queues, probabilities, random draws and
+    the green mask are lanes of big integers (as in FleetMeter), so a tick is a
+    handful of big-integer operations and counting departures is a popcount.
+    """
+    def __init__(self, fleet, rng=None, tick_seconds=1.0, green_code=1, arrival_per_hour=360, discharge_per_hour=1800):
+        self.fleet = fleet
+        self.rng = rng if rng is not None else random
+        self.tick_seconds = tick_seconds
+        self._green_table = bytes(int(code == green_code) for code in range(256))
+        self._default_arrival = self.probability(arrival_per_hour)
+        self._default_discharge = self.probability(discharge_per_hour)
+        self.arrival = bytearray()
+        self.discharge = bytearray()
+        self.queues = 0
+        self.ticks = 0
+        self.arrived = 0
+        self.served = 0
+        self.queued = 0
+        self.last_served = 0
+        self.delay_s = 0.0
+        self._rates = None
+        self._green = None
+        self._green_version = None
+        self._resize()
+
+    def probability(self, vehicles_per_hour):
+        """Per-tick probability (in 1/256) of a flow of 'vehicles_per_hour'; capped at one per tick."""
+        return min(PROBABILITY_SCALE - 1, round(vehicles_per_hour / 3600 * self.tick_seconds * PROBABILITY_SCALE))
+
+    def __len__(self):
+        return len(self.arrival)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the rate columns, the queues and the cached lane integers."""
+        lanes = [self.queues, self._green or 0]
+        if self._rates is not None:
+            lanes += [*self._rates, self._ones, self._guards, self._low_bytes]
+        return len(self.arrival) + len(self.discharge) + sum((lane.bit_length() + 7) // 8 for lane in lanes)
+
+    def _resize(self):
+        """Matches the lanes to the fleet: lights added since the last tick get new lanes."""
+        count = len(self.fleet)
+        missing = count - len(self.arrival)
+        if missing > 0:
+            self.arrival.extend(bytes((self._default_arrival,)) * missing)
+            self.discharge.extend(bytes((self._default_discharge,)) * missing)
+        elif missing < 0:
+            del self.arrival[count:], self.discharge[count:]
+            self.queues &= (1 << (LANE_BITS * count)) - 1
+        if missing:
+            self._rates = None
+            self._green_version = None
+
+    def set_rates(self, arrival_per_hour=None, discharge_per_hour=None, lanes=None):
+        """Sets the demand and/or saturation flow of 'lanes' (row indices; default: every lane)."""
+        self._resize()
+        lanes = range(len(self)) if lanes is None else lanes
+        for column, rate in ((self.arrival, arrival_per_hour), (self.discharge, discharge_per_hour)):
+            if rate is None:
+                continue
+            value = self.probability(rate)
+            if isinstance(lanes, range) and lanes.step == 1:
+                column[lanes.start:lanes.stop] = bytes((value,)) * len(lanes)
+            else:
+                for lane in lanes:
+                    column[lane] = value
+        self._rates = None
+
+    def _bernoulli(self, probabilities, randoms):
+        """Lanes holding 1 where the lane's probability exceeds its random byte, else 0."""
+        # probability > random  <=>  (probability | GUARD) - random - 1 keeps its guard bit.
+        trial = (probabilities | self._guards) - randoms - self._ones
+        return (trial & self._guards) >> (LANE_BITS - 1)
+
+    def step(self):
+        """Advances every lane by one tick; returns the number of vehicles that left."""
+        self._resize()
+        count = len(self)
+        if not count:
+            return 0
+        if self._rates is None:
+            self._ones = repeat_lane(1, count)
+            self._guards = self._ones << (LANE_BITS - 1)
+            self._low_bytes = repeat_lane(0xFF, count)
+            self._rates = (spread(self.arrival), spread(self.discharge))
+        if self._green_version != self.fleet.version:
+            self._green = spread(self.fleet.values.translate(self._green_table))
+            self._green_version = self.fleet.version
+        arrival, discharge = self._rates
+
+        # One draw per tick: byte 0 of each lane decides arrivals, byte 1 departures.
+        randoms = self.rng.getrandbits(LANE_BITS * count)
+        arrivals = self._bernoulli(arrival, randoms & self._low_bytes)
+        queues = self.queues + arrivals
+        waiting = (((queues | self._guards) - self._ones) & self._guards) >> (LANE_BITS - 1)
+        departures = waiting & self._green & self._bernoulli(discharge, (randoms >> 8) & self._low_bytes)
+        self.queues = queues - departures
+
+        arrived, served = arrivals.bit_count(), departures.bit_count()
+        self.ticks += 1
+        self.arrived += arrived
+        self.served += served
+        self.last_served = served
+        self.queued += arrived - served
+        self.delay_s += self.queued * self.tick_seconds
+        return served
+
+    def queue_lengths(self):
+        """Per-lane queue lengths as an array of 32-bit integers."""
+        lengths = array("I")
+        if lengths.itemsize != LANE_BITS // 8:
+            lengths = array("L")
+        lengths.frombytes(self.queues.to_bytes(LANE_BITS // 8 * len(self), "little"))
+        return lengths
+
+    def load_queue_lengths(self, column):
+        """Restores queue lengths saved from queue_lengths() (any buffer of 32-bit lanes)."""
+        self._resize()
+        self.queues = int.from_bytes(column, "little")
+        self.queued = sum(self.queue_lengths())
+
+    def metrics(self):
+        """Throughput and delay figures for TransportManager.get_status()."""
+        elapsed_h = self.ticks * self.tick_seconds / 3600
+        return {
+            "lanes": len(self),
+            "vehicles_queued": self.queued,
+            "vehicles_served": self.served,
+            "throughput_per_hour": self.served / elapsed_h if elapsed_h else 0.0,
+            "last_tick_served": self.last_served,
+            "mean_delay_s": self.delay_s / self.arrived if self.arrived else 0.0,
+        }
+
+    def state(self):
+        """JSON-serializable counters (queues themselves go into a checkpoint column)."""
+        return {"ticks": self.ticks, "arrived": self.arrived, "served": self.served,
+                "last_served": self.last_served, "delay_s": self.delay_s}
+
+    def restore(self, state):
+        self.ticks, self.arrived, self.served = state["ticks"], state["arrived"], state["served"]
+        self.last_served, self.delay_s = state["last_served"], state["delay_s"]
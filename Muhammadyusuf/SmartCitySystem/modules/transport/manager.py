@@ -1,11 +1,48 @@
 from core.factories.factory_method import SmartCityComponent, ComponentFactory
+from core.fleet.store import ComponentFleet, FleetView
+from modules.transport.network import green_wave
+from modules.transport.flow import TrafficFlow
 import random
+import threading
+
+# Traffic light states are stored as small integer codes in the fleet store.
+STATE_NAMES = ("Red", "Green", "Yellow")
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+# Translation table advancing every state code one step through Red -> Green -> Yellow -> Red.
+NEXT_STATE_TABLE = bytes((code + 1) % len(STATE_NAMES) if code < len(STATE_NAMES) else code for code in range(256))
 
 # --- Concrete Components ---
-class TrafficLight(SmartCityComponent):
+class TrafficLight(FleetView, SmartCityComponent):
+    """
+    A traffic light backed by a row of a TrafficLightFleet.
+    Constructing one directly creates a private single-light fleet.
+    """
+    __slots__ = ()
+    rated_watts = 15
+
     def __init__(self, light_id):
-        self.light_id = light_id
-        self.state = "Red"
+        self._fleet = TrafficLightFleet()
+        self._index = self._fleet.append(light_id)
+
+    @property
+    def light_id(self):
+        return self._fleet.ids[self._index]
+
+    @property
+    def state(self):
+        return STATE_NAMES[self._fleet.values[self._index]]
+
+    @state.setter
+    def state(self, value):
+        self._fleet.set_value(self._index, STATE_CODES[value])
+
+    @staticmethod
+    def decode_value(code):
+        return STATE_NAMES[code]
+
+    @staticmethod
+    def render_status(light_id, code):
+        return f"Light {light_id}: {STATE_NAMES[code]}"
 
     def operate(self):
         if self.state == "Red":
@@ -17,31 +54,161 @@ class TrafficLight(SmartCityComponent):
         return f"TrafficLight {self.light_id} changed to {self.state}"
 
     def get_status(self):
-        return f"Light {self.light_id}: {self.state}"
+        return self.render_status(self.light_id, self._fleet.values[self._index])
+
+class TrafficLightFleet(ComponentFleet):
+    """Columnar store of traffic lights: IDs plus one state code byte per light."""
+    view_class = TrafficLight
+    default_value = STATE_CODES["Red"]
+
+    def advance_all(self):
+        """Advances every light one step through its cycle in a single vectorized pass."""
+        self.load_values(self.values.translate(NEXT_STATE_TABLE))
+
+    def describe_changes(self):
+        """Builds the per-light messages TrafficLight.operate() would have returned."""
+        return [f"TrafficLight {light_id} changed to {STATE_NAMES[code]}" for light_id, code in zip(self.ids, self.values)]
 
 # --- Concrete Factory ---
 class TrafficLightFactory(ComponentFactory):
     def __init__(self, next_id):
         self.next_id = next_id
+        self.fleet = TrafficLightFleet()
 
     def create_component(self) -> SmartCityComponent:
-        light = TrafficLight(self.next_id)
+        index = self.fleet.append(self.next_id)
         self.next_id += 1
-        return light
+        return self.fleet.view(index)
+
+    def create_many(self, count, state="Red"):
+        """
+        Allocates 'count' traffic lights with a contiguous ID range in one step.
+        Returns the range of the new IDs (no per-light objects are created).
+        """
+        first_id = self.next_id
+        self.fleet.extend(first_id, count, STATE_CODES[state])
+        self.next_id += count
+        return range(first_id, self.next_id)
+
+    def create_from_spec(self, spec):
+        """Bulk creation from a spec such as {"count": 1000, "state": "Green"}."""
+        return self.create_many(spec["count"], spec.get("state", "Red"))
 
 # --- Subsystem Manager ---
 class TransportManager:
-    def __init__(self):
+    """
+    Runs the traffic light fleet. With a RoadNetwork there is one light per
+    intersection (light row i stands at intersection i), which enables
+    neighbourhood queries and green-wave corridors; 'tick_seconds' is how long
+    one optimize_flow step lasts (see DEFAULT_PERIODS). Each optimize_flow step
+    also moves the vehicle queues behind the lights ('flow', a TrafficFlow).
+    """
+    # Actions operate() performs; metrics label any other action "other".
+    ACTIONS = ("optimize_flow", "green_wave")
+
+    def __init__(self, fleet_size=3, network=None, tick_seconds=1.0, rng=None):
+        # Serializes operate(), get_status() and telemetry() (see SmartCityController).
+        self.lock = threading.RLock()
+        self.network = network
+        self.tick_seconds = tick_seconds
+        self.corridors = []
         self.factory = TrafficLightFactory(next_id=1)
-        self.components = [self.factory.create_component() for _ in range(3)]
+        self.factory.create_many(len(network) if network is not None else fleet_size)
+        self.components = self.factory.fleet
+        self.flow = TrafficFlow(self.components, rng, tick_seconds, green_code=STATE_CODES["Green"])
         self.status = "Operational"
 
-    def operate(self, action=None):
-        if action == "optimize_flow":
-            results = [c.operate() for c in self.components]
-            return f"Transport: Optimized traffic flow. Changes: {results}"
-        return "Transport: No specific action taken."
+    def _require_network(self):
+        if self.network is None:
+            raise ValueError("Transport has no road network.")
+        return self.network
+
+    def signals_within(self, x, y, radius):
+        """IDs of the traffic lights within 'radius' metres of (x, y)."""
+        ids = self.components.ids
+        return [ids[node] for node in self._require_network().within(x, y, radius)]
+
+    def add_corridor(self, start, end, speed_kmh=50.0):
+        """
+        Coordinates the lights along the shortest route between intersections
+        'start' and 'end' into a green wave for traffic at 'speed_kmh'. Corridors
+        added later win at shared intersections. Returns the route.
+        """
+        path = self._require_network().shortest_path(start, end)
+        with self.lock:
+            self.corridors.append((path, speed_kmh))
+            self.coordinate_signals()
+        return path
+
+    def coordinate_signals(self):
+        """Re-applies every corridor's green wave in one batched fleet update."""
+        with self.lock:
+            values = bytearray(self.components.values)
+            for path, speed_kmh in self.corridors:
+                phases = green_wave(self.network, path, speed_kmh, self.tick_seconds, STATE_CODES["Green"], len(STATE_NAMES))
+                for node, code in phases.items():
+                    values[node] = code
+            self.components.load_values(values)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the light fleet, the vehicle queues and the road network."""
+        network = self.network.nbytes if self.network is not None else 0
+        return self.components.nbytes + self.flow.nbytes + network
+
+    @property
+    def version(self):
+        """Grows whenever any traffic light changes state."""
+        return self.components.version
+
+    def change_sources(self):
+        """Objects whose 'change_listener' reports component changes (see ChangeFeed)."""
+        return (self.components,)
+
+    def operate(self, action=None, detail=True):
+        """
+        Performs 'action' on the whole fleet in one batched step.
+        Per-component change messages are only built when 'detail' is true.
+        """
+        with self.lock:
+            if action == "optimize_flow":
+                self.components.advance_all()
+                self.flow.step()
+                if detail:
+                    return f"Transport: Optimized traffic flow. Changes: {self.components.describe_changes()}"
+                return f"Transport: Optimized traffic flow. Changes: {len(self.components)} lights updated"
+            if action == "green_wave" and self.corridors:
+                self.coordinate_signals()
+                return f"Transport: Coordinated {len(self.corridors)} green-wave corridors."
+            return "Transport: No specific action taken."
+
+    def checkpoint_state(self):
+        """The fleet, its ID counter and the vehicle queues as (JSON-serializable state, {column: array})."""
+        state = {"next_id": self.factory.next_id, "traffic": self.flow.state()}
+        return state, {"ids": self.components.ids, "values": self.components.values, "queues": self.flow.queue_lengths()}
+
+    def restore_state(self, state, columns):
+        """Restores checkpoint_state() output ('columns' may hold any buffers with the same layout)."""
+        self.components.load_columns(columns["ids"], columns["values"])
+        if "queues" in columns:
+            self.flow.load_queue_lengths(columns["queues"])
+            self.flow.restore(state["traffic"])
+        self.factory.next_id = state["next_id"]
+
+    def telemetry(self):
+        """Current readings for the telemetry store: number of lights in each state."""
+        with self.lock:
+            values = self.components.values
+            readings = {name.lower(): values.count(code) for code, name in enumerate(STATE_NAMES)}
+            readings["vehicles_queued"] = self.flow.queued
+            readings["vehicles_served"] = self.flow.last_served
+            return readings
 
     def get_status(self):
-        component_statuses = [c.get_status() for c in self.components]
-        return {"manager_status": self.status, "components": component_statuses}
+        with self.lock:
+            component_statuses = self.components.statuses()
+            return {"manager_status": self.status, "components": component_statuses, "traffic": self.flow.metrics()}
+
+def create_manager(context):
+    """Subsystem factory for the controller's registry (see core.registry.subsystems)."""
+    return TransportManager(rng=context.rng, **context.options)
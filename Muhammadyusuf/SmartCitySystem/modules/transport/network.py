@@ -0,0 +1,161 @@
+import heapq
+import math
+from array import array
+
+class RoadNetwork:
+    """
+    Intersections as graph nodes with positions in metres ('xs', 'ys') and road
+    segments as directed edges in compressed sparse row (CSR) form: the
+    neighbours of node n are targets[offsets[n]:offsets[n + 1]], with the
+    segment lengths at the same positions in 'lengths'. Every column is a typed
+    array, so a 50k-intersection city takes a few MB and no per-node objects.
+    """
+    def __init__(self, xs, ys, offsets, targets, lengths):
+        self.xs = xs
+        self.ys = ys
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+        self._index = None
+
+    @classmethod
+    def from_edges(cls, xs, ys, edges, bidirectional=True):
+        """Builds the CSR arrays from node positions and (a, b) road segments."""
+        xs, ys = array("d", xs), array("d", ys)
+        edges = list(edges)
+        if bidirectional:
+            edges += [(b, a) for a, b in edges]
+        # Counting sort by source node: degrees, prefix sums, then one placement pass.
+        offsets = array("q", bytes(8 * (len(xs) + 1)))
+        for a, _ in edges:
+            offsets[a + 1] += 1
+        for node in range(len(xs)):
+            offsets[node + 1] += offsets[node]
+        cursor = offsets[:-1]
+        targets = array("q", bytes(8 * len(edges)))
+        lengths = array("d", bytes(8 * len(edges)))
+        for a, b in edges:
+            slot = cursor[a]
+            targets[slot] = b
+            lengths[slot] = math.hypot(xs[b] - xs[a], ys[b] - ys[a])
+            cursor[a] = slot + 1
+        return cls(xs, ys, offsets, targets, lengths)
+
+    @classmethod
+    def grid(cls, rows, cols, spacing=200.0):
+        """A Manhattan street grid of rows x cols intersections, 'spacing' metres apart."""
+        xs = array("d", (c * spacing for _ in range(rows) for c in range(cols)))
+        ys = array("d", (r * spacing for r in range(rows) for _ in range(cols)))
+        edges = [(r * cols + c, r * cols + c + 1) for r in range(rows) for c in range(cols - 1)]
+        edges += [(r * cols + c, (r + 1) * cols + c) for r in range(rows - 1) for c in range(cols)]
+        return cls.from_edges(xs, ys, edges)
+
+    def __len__(self):
+        return len(self.xs)
+
+    @property
+    def nbytes(self):
+        columns = (self.xs, self.ys, self.offsets, self.targets, self.lengths)
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def neighbors(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    @property
+    def index(self):
+        """The SpatialGrid over the intersections, built on first use."""
+        if self._index is None:
+            self._index = SpatialGrid(self.xs, self.ys)
+        return self._index
+
+    def within(self, x, y, radius):
+        """Intersections within 'radius' metres of (x, y)."""
+        return self.index.within(x, y, radius)
+
+    def shortest_path(self, start, end):
+        """
+        Nodes of the shortest route from 'start' to 'end' by road length
+        (Dijkstra over the CSR arrays). Raises ValueError if 'end' is unreachable.
+        """
+        offsets, targets, lengths = self.offsets, self.targets, self.lengths
+        distance = {start: 0.0}
+        previous = {}
+        queue = [(0.0, start)]
+        while queue:
+            dist, node = heapq.heappop(queue)
+            if node == end:
+                break
+            if dist > distance[node]:
+                continue
+            for edge in range(offsets[node], offsets[node + 1]):
+                target, candidate = targets[edge], dist + lengths[edge]
+                if candidate < distance.get(target, math.inf):
+                    distance[target] = candidate
+                    previous[target] = node
+                    heapq.heappush(queue, (candidate, target))
+        if end not in distance:
+            raise ValueError(f"Intersection {end} is not reachable from {start}.")
+        path = [end]
+        while path[-1] != start:
+            path.append(previous[path[-1]])
+        return path[::-1]
+
+    def distances_along(self, path):
+        """Cumulative road distance in metres from the start of 'path' to each of its nodes."""
+        distances = [0.0]
+        for a, b in zip(path, path[1:]):
+            distances.append(distances[-1] + math.hypot(self.xs[b] - self.xs[a], self.ys[b] - self.ys[a]))
+        return distances
+
+class SpatialGrid:
+    """
+    Uniform grid index over points. Point indices are sorted by cell into one
+    'order' array and each occupied cell maps to its (start, end) slice of it, so
+    a radius query only visits the cells overlapping the query's bounding box.
+    'cell_size' (metres) defaults to 250: a 500 m query visits about 5 x 5 cells.
+    """
+    def __init__(self, xs, ys, cell_size=250.0):
+        self.xs = xs
+        self.ys = ys
+        self.cell_size = cell_size
+        cells = [(int(x // cell_size), int(y // cell_size)) for x, y in zip(xs, ys)]
+        self.order = array("q", sorted(range(len(cells)), key=cells.__getitem__))
+        self.cells = {}
+        start = 0
+        for position, point in enumerate(self.order):
+            if cells[point] != cells[self.order[start]]:
+                self.cells[cells[self.order[start]]] = (start, position)
+                start = position
+        if self.order:
+            self.cells[cells[self.order[start]]] = (start, len(self.order))
+
+    def within(self, x, y, radius):
+        """Indices of the points within 'radius' of (x, y), in index order."""
+        size, xs, ys, order, cells = self.cell_size, self.xs, self.ys, self.order, self.cells
+        limit = radius * radius
+        found = []
+        for cx in range(int((x - radius) // size), int((x + radius) // size) + 1):
+            for cy in range(int((y - radius) // size), int((y + radius) // size) + 1):
+                span = cells.get((cx, cy))
+                if span is None:
+                    continue
+                for point in order[span[0]:span[1]]:
+                    dx, dy = xs[point] - x, ys[point] - y
+                    if dx * dx + dy * dy <= limit:
+                        found.append(point)
+        found.sort()
+        return found
+
+def green_wave(network, path, speed_kmh=50.0, tick_seconds=1.0, green_code=1, cycle=3):
+    """
+    Signal phases that give a platoon travelling along 'path' at 'speed_kmh' a
+    green wave. Every light advances one state per tick ('tick_seconds'), so a
+    light whose state code is c now shows (c + t) % cycle after t ticks. The
+    light at distance d turns green when the platoon arrives, d / speed seconds
+    from now. Returns {node: state code}.
+    """
+    speed = speed_kmh / 3.6
+    return {
+        node: (green_code - round(distance / speed / tick_seconds)) % cycle
+        for node, distance in zip(path, network.distances_along(path))
+    }
@@ -1,7 +1,16 @@
 import unittest
+import asyncio
 import sys
 import os
-from io import StringIO
+import time
+import json
+import random
+import tempfile
+import tracemalloc
+import threading
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO, BytesIO
 from unittest.mock import patch
 
 # Add the project root to the path to allow for relative imports
@@ -11,13 +20,46 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from core.singleton.singleton import Singleton, ConfigManager
 from core.controller import SmartCityController, get_controller
 from core.factories.factory_method import SmartCityComponent, ComponentFactory
-from core.builders.report_builder import ReportDirector, EnergyReportBuilder
+from core.builders.report_builder import ReportDirector
 from core.proxy.proxy import SubsystemProxy, RealSubsystem
+from core.proxy.access import AccessPolicy, Authorizer, DecisionCache
+from core.simulation.scheduler import TickScheduler, VirtualClock
+from core.events.feed import ChangeFeed, BLOCK, DROP_NEWEST
+from core.rng.streams import RandomStreams
+from core.telemetry.store import TelemetryStore
+from core.instrumentation.metrics import MetricsRegistry
+from core.registry.subsystems import SubsystemRegistry
+from core.tenancy.host import CityHost, Tenant
+from core.middleware.pipeline import (AuthMiddleware, CacheMiddleware, CoalesceMiddleware, MetricsMiddleware,
+                                     RateLimitMiddleware, Request, Result, LIMITED, OPERATE, STATUS)
+from core.scenarios.runner import Scenario, ScenarioResults, parameter_grid, read_command_log, run_scenario, run_sweep
+from core.service.line_protocol import CommandProcessor, LineProtocol, make_server, serve
+from benchmark import build_city, run_benchmarks, compare, import_time, bench_network, bench_incidents
+from main import main as cli_main
 
 # Import subsystem components for testing
-from modules.transport.manager import TrafficLight, TrafficLightFactory
-from modules.energy.manager import EnergyManager
+from modules.transport.manager import TrafficLight, TrafficLightFactory, TrafficLightFleet, TransportManager, STATE_CODES
+from modules.transport.network import RoadNetwork, green_wave
+from modules.transport.flow import TrafficFlow
+from modules.lighting.manager import LEDLight, HalogenLight, HalogenFactory, LightFleet, LightingManager
+from modules.energy.manager import EnergyManager, EnergyReportBuilder, meters_for
+from modules.energy.reporting import ConsumptionLedger, FleetMeter, PowerMeter
+from modules.energy.grid import PowerGrid, DemandForecast
 from modules.security.manager import SecurityManager
+from modules.security.incidents import IncidentPipeline, event_stream, EVENT_KINDS
+
+def run_concurrently(*loops, seconds=0.3, timeout=10.0):
+    """Runs every callable in a loop on its own thread for 'seconds'; returns True if any thread is still alive after 'timeout'."""
+    deadline = time.monotonic() + seconds
+    def loop(fn):
+        while time.monotonic() < deadline:
+            fn()
+    threads = [threading.Thread(target=loop, args=(fn,), daemon=True) for fn in loops]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout)
+    return any(thread.is_alive() for thread in threads)
 
 class TestDesignPatterns(unittest.TestCase):
 
@@ -92,6 +134,286 @@ class TestDesignPatterns(unittest.TestCase):
             self.assertIn("--- Simulation Cycle Complete ---", fake_out.getvalue())
             self.assertIsInstance(sim_status, dict)
 
+    def test_23_access_control(self):
+        """Test the compiled permission table, decision cache and audit log."""
+        policy = AccessPolicy({"admin": {"run_patrol", "view"}, "manager": {"view"}})
+        self.assertEqual(policy.permissions()["manager"], frozenset({"view"}))
+        authorizer = Authorizer(policy, DecisionCache(maxsize=2, ttl=60))
+        self.assertTrue(authorizer.authorize("admin", "run_patrol"))
+        self.assertTrue(authorizer.authorize("admin", "run_patrol"))
+        self.assertEqual(authorizer.cache.hits, 1)
+        with self.assertLogs("smartcity.security.audit", level="INFO") as logs:
+            self.assertFalse(authorizer.authorize("manager", "run_patrol"))
+        self.assertEqual(logs.records[0].role, "manager")
+        self.assertFalse(logs.records[0].allowed)
+
+        policy.grant("manager", "run_patrol")
+        self.assertEqual(len(authorizer.cache), 0)
+        self.assertTrue(authorizer.authorize("manager", "run_patrol"))
+        authorizer.authorize("guest", "view")
+        authorizer.authorize("admin", "view")
+        self.assertEqual(len(authorizer.cache), 2)
+        # Compiled policies are checked directly: a cache would cost more than the bitmask.
+        direct = Authorizer(policy)
+        self.assertIsNone(direct.cache)
+        self.assertTrue(direct.authorize("manager", "run_patrol"))
+        policy.revoke("manager", "run_patrol")
+        self.assertFalse(direct.authorize("manager", "run_patrol"))
+        self.assertFalse(authorizer.authorize("manager", "run_patrol"))
+
+        proxy = SubsystemProxy(RealSubsystem())
+        with patch('sys.stdout', new=StringIO()) as fake_out:
+            self.assertIn("Must be one of ['admin', 'manager']", proxy.request("guest"))
+        self.assertEqual(fake_out.getvalue(), "")
+
+    def test_24_thread_safe_singleton(self):
+        """Test concurrent Singleton creation, reset/scoped and serialized manager operations."""
+        class SlowService(metaclass=Singleton):
+            created = 0
+            def __init__(self):
+                time.sleep(0.01)
+                SlowService.created += 1
+                self.closed = False
+            def close(self):
+                self.closed = True
+
+        barrier = threading.Barrier(8)
+        def create():
+            barrier.wait()
+            return SlowService()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            instances = list(pool.map(lambda _: create(), range(8)))
+        self.assertEqual(SlowService.created, 1)
+        self.assertTrue(all(instance is instances[0] for instance in instances))
+
+        with SlowService.scoped() as scoped:
+            self.assertIsNot(scoped, instances[0])
+            self.assertIs(SlowService(), scoped)
+        self.assertTrue(scoped.closed)
+        self.assertIs(SlowService(), instances[0])
+        SlowService.reset()
+        self.assertTrue(instances[0].closed)
+        self.assertIsNot(SlowService(), instances[0])
+
+        with patch('sys.stdout', new=StringIO()), SmartCityController.scoped(seed=3) as controller:
+            self.assertIs(get_controller(), controller)
+            before = controller.get_subsystem_status("transport")["components"]
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                for _ in range(30):
+                    pool.submit(controller.operate_subsystem, "transport", "optimize_flow")
+                    pool.submit(controller.get_all_status)
+            # 30 steps through a 3-state cycle brings every light back to where it started.
+            self.assertEqual(controller.get_subsystem_status("transport")["components"], before)
+        self.assertIsNot(get_controller(), controller)
+
+    def test_32_multi_city_host(self):
+        """Test isolated named cities on a shared pool with fair scheduling and accounting."""
+        with CityHost(workers=1) as host:
+            for index in range(4):
+                host.create_city(f"small-{index}", seed=index, fleet_sizes={"lighting": 10})
+            big = host.create_city("big", seed=0, fleet_sizes={"lighting": 200_000})
+            self.assertIsNot(big, get_controller())
+            with self.assertRaises(ValueError):
+                host.create_city("big")
+
+            order = []
+            run_cycle = Tenant.run_cycle
+            def record(tenant, queued_at):
+                order.append(tenant.name)
+                run_cycle(tenant, queued_at)
+            with patch.object(Tenant, "run_cycle", record):
+                usage = host.run(4)
+            # After its first cycle the big city has used the most CPU, so the small ones go first.
+            self.assertEqual(order[-3:], ["big"] * 3)
+            self.assertEqual({name: stats["cycles"] for name, stats in usage.items()}, dict.fromkeys(host.names(), 4))
+            self.assertGreater(usage["big"]["cpu_s"], usage["small-0"]["cpu_s"])
+            self.assertGreater(usage["big"]["memory_bytes"], 200_000)
+            self.assertEqual(host.city("small-1").summary()["tick"], 4)
+
+            host.run({"small-0": 2})
+            self.assertEqual(host.usage()["small-0"]["cycles"], 6)
+            self.assertEqual(host.city("small-1").summary()["tick"], 4)
+            host.remove_city("big")
+            self.assertEqual(len(host), 4)
+
+            # A failing city stops on its own; the others finish and the failure is reported, not raised.
+            def flaky(tenant, queued_at):
+                if tenant.name == "small-2" and tenant.cycles == 5:
+                    raise RuntimeError("sensor bus down")
+                run_cycle(tenant, queued_at)
+            with patch.object(Tenant, "run_cycle", flaky):
+                usage = host.run(3)
+            self.assertEqual(usage["small-2"], dict(usage["small-2"], cycles=5, error="RuntimeError: sensor bus down"))
+            self.assertEqual([usage[name]["cycles"] for name in ("small-0", "small-1", "small-3")], [9, 7, 7])
+            self.assertIsNone(usage["small-0"]["error"])
+
+        with CityHost(workers=2) as host:
+            first, second = host.create_city("a", seed=5), host.create_city("b", seed=5)
+            host.run(3)
+            statuses = first.get_all_status(parallel=True), second.get_all_status()
+            for name in ("transport", "lighting"):
+                self.assertEqual(statuses[0][name], statuses[1][name])
+            self.assertEqual(statuses[0]["security"]["incidents"]["dispatched"], statuses[1]["security"]["incidents"]["dispatched"])
+
+        out = StringIO()
+        self.assertEqual(cli_main(["run", "--cities", "3", "--ticks", "2", "--seed", "1", "--format", "json"], out), 0)
+        summary = json.loads(out.getvalue())
+        self.assertEqual((summary["cities"], sorted(summary["usage"])), (3, ["city-1", "city-2", "city-3"]))
+
+    def test_34_middleware_pipeline(self):
+        """Test the middleware chain around the facade: coalescing, caching, batching, auth and rate limits."""
+        with SmartCityController.scoped(seed=3, announce=False) as controller:
+            energy = controller.get_manager("energy")
+            calls = []
+            operate = energy.operate
+            def slow_operate(action=None, detail=True):
+                calls.append(action)
+                time.sleep(0.02)
+                return operate(action, detail)
+            energy.operate = slow_operate
+            coalesce, metrics = CoalesceMiddleware(controller, actions={"report_consumption"}), MetricsMiddleware(controller)
+            pipeline = controller.pipeline(metrics, coalesce, CacheMiddleware(controller))
+
+            # Concurrent identical requests in one tick share one execution, as do later ones in that tick.
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                results = list(pool.map(lambda _: pipeline.operate("energy", "report_consumption"), range(6)))
+            results.append(pipeline.operate("energy", "report_consumption"))
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(sorted(r.source for r in results), ["coalesced"] * 6 + ["executed"])
+            self.assertEqual(len({id(r.value) for r in results}), 1)
+            self.assertEqual((coalesce.executions, coalesce.coalesced), (1, 6))
+            self.assertTrue(results[0].text.startswith("Energy"))
+            controller.run_cycles(1)
+            self.assertEqual(pipeline.operate("energy", "report_consumption").tick, 1)
+            self.assertEqual(len(calls), 3)
+            # Other operates change state and always run.
+            self.assertEqual([pipeline.operate("energy", "plan_load_shedding").source for _ in range(2)], ["executed"] * 2)
+            self.assertEqual(len(calls), 5)
+
+            # Status: served from cache until the subsystem changes; batches keep request order.
+            first = pipeline.status("lighting")
+            self.assertEqual(pipeline.status("lighting").source, "coalesced")
+            controller.run_cycles(1)
+            cached = pipeline.status("transport")
+            batch = pipeline.batch([Request(STATUS, "lighting"), Request(OPERATE, "transport", "optimize_flow"),
+                                    Request(STATUS, "transport"), Request(STATUS, "parking")])
+            self.assertEqual([r.source for r in batch], ["executed", "executed", "executed", "not_found"])
+            self.assertNotEqual(batch[0].value, first.value)
+            self.assertNotEqual(batch[2].value, cached.value)
+            self.assertEqual(batch[3].as_dict()["error"], "Subsystem 'parking' not found.")
+            self.assertEqual(metrics.snapshot()["sources"]["not_found"], 1)
+            self.assertIn("report_consumption", metrics.snapshot()["operations"]["energy"])
+            # Client-chosen names do not become labels: undeclared actions and unknown subsystems are "other".
+            pipeline.operate("energy", "report_consumption_x1")
+            operations = metrics.snapshot()["operations"]
+            self.assertEqual(set(operations["energy"]), {"report_consumption", "plan_load_shedding", "other"})
+            self.assertEqual(operations["other"], {"get_status": operations["other"]["get_status"]})
+
+            # A service that never advances the tick keeps one status entry per request, not one per version.
+            for _ in range(20):
+                pipeline.operate("transport", "optimize_flow")
+                pipeline.status("transport")
+            self.assertLessEqual(len(coalesce._results), 4)
+
+            policy = AccessPolicy({"operator": ["transport.optimize_flow", "transport.status"]})
+            # Coalescing ahead of the access check never shares results across roles.
+            shared = controller.pipeline(CoalesceMiddleware(controller), AuthMiddleware(Authorizer(policy)))
+            self.assertEqual(shared.status("transport", role="operator").source, "executed")
+            self.assertEqual(shared.status("transport", role="guest").source, "denied")
+            self.assertEqual(shared.status("transport", role="operator").source, "coalesced")
+            # A waiter handed a failed result runs on its own instead.
+            failures = [True]
+            def flaky(request, call_next):
+                if failures and failures.pop():
+                    time.sleep(0.05)
+                    return Result(request, False, error="busy", source=LIMITED)
+                return call_next(request)
+            flaky_pipeline = controller.pipeline(CoalesceMiddleware(controller), flaky)
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                first = pool.submit(flaky_pipeline.status, "lighting")
+                time.sleep(0.01)
+                second = pool.submit(flaky_pipeline.status, "lighting")
+                self.assertEqual(sorted((first.result().source, second.result().source)), ["executed", "limited"])
+            guarded = controller.pipeline(AuthMiddleware(Authorizer(policy)), RateLimitMiddleware(1, burst=2, clock=lambda: 0.0))
+            self.assertEqual(guarded.operate("transport", "optimize_flow").source, "denied")
+            sources = [guarded.operate("transport", "optimize_flow", role="operator").source for _ in range(3)]
+            self.assertEqual(sources, ["executed", "executed", "limited"])
+            self.assertTrue(guarded.status("transport", role="operator").text.startswith("Error: Rate limit"))
+
+            processor = CommandProcessor(controller, pipeline=pipeline)
+            response = processor.execute("status lighting transport")
+            self.assertTrue(response["ok"])
+            self.assertEqual(list(response["result"]), ["lighting", "transport"])
+            self.assertFalse(processor.execute("status parking")["ok"])
+
+            # Only operates that actually ran are logged for replay.
+            log = StringIO()
+            processor = CommandProcessor(controller, log, pipeline)
+            for command in ("operate energy report_consumption", "operate energy report_consumption", "run 1",
+                            "operate energy report_consumption", "operate transport optimize_flow"):
+                self.assertTrue(processor.execute(command)["ok"])
+            self.assertEqual(log.getvalue().splitlines(), ["operate energy report_consumption", "run 1",
+                                                            "operate energy report_consumption", "operate transport optimize_flow"])
+        with patch('sys.stderr', new=StringIO()):
+            self.assertEqual(cli_main(["serve", "--record", "commands.log", "--coalesce"], StringIO()), 2)
+
+    def test_25_lazy_subsystem_registry(self):
+        """Test that subsystems are built on first use and can be added or disabled by config."""
+        with patch('sys.stdout', new=StringIO()), SmartCityController.scoped(seed=1) as controller:
+            self.assertEqual(controller.loaded_subsystems(), [])
+            self.assertEqual(controller.get_subsystem_names(), ["transport", "lighting", "security", "energy"])
+            self.assertEqual(controller.loaded_subsystems(), [])
+            self.assertEqual(len(controller.get_subsystem_status("transport")["components"]), 3)
+            self.assertEqual(controller.loaded_subsystems(), ["transport"])
+            # Energy meters the other subsystems, so building it builds them too.
+            controller.get_manager("energy")
+            self.assertEqual(controller.loaded_subsystems(), ["transport", "lighting", "security", "energy"])
+            self.assertIsNone(controller.get_manager("parking"))
+
+        class ParkingManager:
+            version = 0
+            lock = threading.RLock()
+            def __init__(self, context):
+                self.spaces = context.options.get("spaces", 10)
+            def operate(self, action=None, detail=True):
+                return f"Parking: {action}"
+            def get_status(self):
+                return {"free_spaces": self.spaces}
+
+        ConfigManager().settings["subsystems"] = {"security": None, "parking": ParkingManager}
+        try:
+            with patch('sys.stdout', new=StringIO()), SmartCityController.scoped(seed=1) as controller:
+                self.assertEqual(controller.get_subsystem_names(), ["transport", "lighting", "energy", "parking"])
+                status = controller.run_simulation()
+                self.assertEqual(set(status), {"transport", "lighting", "energy", "parking"})
+                self.assertEqual(status["parking"], {"free_spaces": 10})
+                self.assertIn("not found", controller.operate_subsystem("security", "run_patrol"))
+        finally:
+            del ConfigManager().settings["subsystems"]
+
+        registry = SubsystemRegistry({"spare": "modules.transport.manager:create_manager"}, entry_points=False)
+        self.assertIn("spare", registry)
+        self.assertEqual(len(registry.get("spare").components), 3)
+        self.assertEqual(list(registry.loaded()), ["spare"])
+        with self.assertRaises(KeyError):
+            registry.get("parking")
+        with self.assertRaises(ValueError):
+            SubsystemRegistry({"broken": "no_colon"}, entry_points=False).get("broken")
+        # An unresolvable plugin fails when the registry is built, not on first use.
+        with self.assertRaises(ValueError):
+            SubsystemRegistry({"parking": "no_such_package.manager:create_manager"}, entry_points=False)
+
+        # Checkpoints only cover the subsystems that exist.
+        with tempfile.TemporaryDirectory() as tmp, SmartCityController.scoped(
+                seed=1, announce=False, subsystems={"security": None}) as controller:
+            path = os.path.join(tmp, "city.ckpt")
+            controller.run_cycles(2)
+            controller.save_checkpoint(path)
+            saved = controller.get_subsystem_status("lighting")
+            controller.run_cycles(3)
+            controller.restore_checkpoint(path)
+            self.assertEqual(controller.get_subsystem_status("lighting"), saved)
+
 class TestSubsystems(unittest.TestCase):
     
     def setUp(self):
@@ -122,5 +444,753 @@ class TestSubsystems(unittest.TestCase):
         self.assertIn("Energy: Generated Consumption Report:", result)
         self.assertIn("Total Consumption (kWh):", result)
 
+        # Energy's status follows the fleets it meters, and reading it never blocks a checkpoint.
+        with tempfile.TemporaryDirectory() as tmp, SmartCityController.scoped(seed=1, announce=False) as controller:
+            before = controller.snapshot()["energy"]
+            controller.get_manager("lighting").lights.fill(0, 5, 100)
+            self.assertNotEqual(controller.snapshot()["energy"]["current_consumption"], before["current_consumption"])
+            path = os.path.join(tmp, "city.ckpt")
+            self.assertFalse(run_concurrently(lambda: controller.save_checkpoint(path),
+                                              lambda: controller.get_subsystem_status("energy"),
+                                              lambda: controller.get_manager("energy").telemetry()))
+
+    def test_11_parallel_status(self):
+        """Test concurrent fan-out with per-subsystem timeouts."""
+        controller = get_controller()
+        status = controller.get_all_status(parallel=True)
+        self.assertEqual(list(status), ["transport", "lighting", "security", "energy"])
+
+        with patch.object(controller.get_manager("energy"), "get_status", side_effect=lambda: time.sleep(0.5)):
+            start = time.monotonic()
+            status = controller.get_all_status(timeout={"energy": 0.05})
+            self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(status["energy"], "Error: Subsystem 'energy' timed out.")
+        self.assertEqual(status["transport"]["manager_status"], "Operational")
+        # A subsystem that raises TimeoutError itself failed; it did not miss its timeout.
+        with patch.object(controller.get_manager("energy"), "get_status", side_effect=TimeoutError("meter offline")):
+            status = controller.get_all_status(parallel=True, timeout=5)
+        self.assertEqual(status["energy"], "Error: Subsystem 'energy' failed: meter offline")
+
+        with patch('sys.stdout', new=StringIO()):
+            status = asyncio.run(controller.arun_simulation(timeout=5))
+        self.assertEqual(list(status), ["transport", "lighting", "security", "energy"])
+
+    def test_30_incident_pipeline(self):
+        """Test event correlation, prioritized dispatch and bounded memory under bursts."""
+        kind = EVENT_KINDS.index
+        pipeline = IncidentPipeline(zones=10, patrol_units=1, window_seconds=60, min_events=3, response_seconds=100)
+        pipeline.ingest([(0, 1, kind("motion")), (1, 1, kind("motion")), (2, 2, kind("motion"))])
+        self.assertEqual((pipeline.raised, pipeline.merged), (0, 1))
+        pipeline.ingest([(3, 1, kind("motion")), (4, 3, kind("door")), (5, 3, kind("camera")), (6, 4, kind("gunshot"))])
+        # Zone 1 reached three events and took the only unit; door + camera in zone 3 corroborate to "high".
+        self.assertEqual(pipeline.assigned[0].zone, 1)
+        self.assertEqual(pipeline.latencies[0], 3)
+        pipeline.advance(103)
+        self.assertEqual(pipeline.assigned[0].zone, 4)
+        self.assertEqual(pipeline.assigned[0].describe(), "Incident 4 in zone 4: critical, 1 events")
+        pipeline.ingest([(150, 1, kind("motion"))])
+        pipeline.advance(203)
+        self.assertEqual(pipeline.assigned[0].zone, 3)
+        self.assertEqual(pipeline.metrics()["dispatched"], 3)
+        self.assertEqual(pipeline.pending(), 1)
+
+        burst = IncidentPipeline(zones=1000, patrol_units=2, window_seconds=0.01, max_queue=100)
+        self.assertEqual(burst.ingest(event_stream(random.Random(2), 1000, 50_000, 1.0)), burst.events)
+        metrics = burst.metrics()
+        self.assertAlmostEqual(metrics["events"], 50_000, delta=1000)
+        self.assertGreater(sum(metrics["shed"].values()), 0)
+        self.assertEqual(metrics["shed"]["high"] + metrics["shed"]["critical"], 0)
+        self.assertLessEqual(len(burst._open), 1000)
+        self.assertLessEqual(burst._queued_low, 100)
+        self.assertEqual(bench_incidents(events_per_second=5000, seed=1)["shed_high"], 0)
+
+        security = SecurityManager(random.Random(3), events_per_second=5)
+        for _ in range(12):
+            security.operate("run_patrol")
+        status = security.get_status()
+        self.assertEqual(status["incidents"]["events"], security._real_system.incidents.events)
+        self.assertGreater(status["incidents"]["dispatched"], 0)
+        self.assertIn(f"Incidents: {security._real_system.read_incidents()}", status["system_status"])
+        # The patrol status no longer changes, but the incident figures do: so does the version.
+        version = security.version
+        security.operate("run_patrol")
+        self.assertGreater(security.version, version)
+        version = security.version
+        security.ingest([], until=security._real_system.now)
+        self.assertEqual(security.version, version)
+
+        incidents = security._real_system.incidents
+        copy = IncidentPipeline(patrol_units=4)
+        copy.restore(json.loads(json.dumps(incidents.state())))
+        events = list(event_stream(random.Random(4), 100, 5, 3600, start=incidents.now))
+        incidents.ingest(events)
+        copy.ingest(events)
+        self.assertEqual({**copy.metrics(), "events_per_s": 0}, {**incidents.metrics(), "events_per_s": 0})
+        self.assertEqual([incident.describe() for incident in copy.recent], [incident.describe() for incident in incidents.recent])
+
+        with SmartCityController.scoped(seed=3, announce=False) as controller:
+            before = controller.snapshot()["security"]
+            controller.get_manager("security").ingest([(1.0, 5, EVENT_KINDS.index("gunshot"))])
+            self.assertNotEqual(controller.snapshot()["security"], before)
+
+    def test_31_power_grid(self):
+        """Test feeder loads, load-shedding plans and the demand forecast."""
+        lights = LightFleet(LEDLight)
+        lights.extend(1, 1000, 50)
+        traffic = TrafficLightFleet()
+        traffic.extend(1, 100)
+        meters = [FleetMeter("lighting", lights, watts_per_unit=1.0), FleetMeter("transport", traffic, base_watts=15),
+                  PowerMeter("security", "patrol", lambda: 1500)]
+        grid = PowerGrid(meters, feeder_size=100, feeders_per_substation=4)
+        self.assertEqual((len(grid), grid.substations), (12, 3))
+        self.assertEqual(list(grid.load_w[:2]), [5000.0, 5000.0])
+        self.assertEqual(grid.summary()["load_w"], 1000 * 50 + 100 * 15 + 1500)
+        # Four lighting feeders: floors at 30%, rated 30% + 0.8 * 70% = 86% of full brightness.
+        self.assertAlmostEqual(grid.substation_capacity_w[0], 4 * 8600)
+        self.assertEqual(grid.overloaded(), [])
+
+        lights.fill(0, 400, 100)
+        lights.fill(400, 500, 90)
+        grid.refresh()
+        self.assertEqual(grid.overloaded(), [0])
+        plan = grid.plan_shedding()
+        self.assertEqual((plan["shed"], plan["overloaded"], plan["relief_w"]), ([0], [], 7000.0))
+        self.assertEqual(grid.what_if([0])["substation_load_w"], plan["substation_load_w"])
+        self.assertEqual(grid.what_if([10, 11]), grid.what_if())
+
+        lights.extend(1001, 150, 50)
+        grid.refresh()
+        self.assertEqual((len(grid), list(grid.stops[12:]), grid.substation_of[13]), (14, [1100, 1150], 3))
+
+        forecast = DemandForecast(alpha=0.5, beta=0.5, window=2)
+        for loads in ([100.0, 10.0], [200.0, 10.0], [300.0, 10.0]):
+            forecast.observe(loads)
+        self.assertEqual(list(forecast.rolling_mean()), [250.0, 10.0])
+        self.assertGreater(forecast.forecast(2)[0], 300)
+        self.assertEqual(forecast.forecast(1)[1], 10.0)
+        # A new feeder starts from zero history; every column holds one double per feeder.
+        forecast.observe([300.0, 10.0, 50.0])
+        columns = (forecast.level, forecast.trend, forecast._sums, *forecast._history)
+        self.assertEqual([len(column) for column in columns], [3] * 5)
+        self.assertEqual(list(forecast.rolling_mean()), [300.0, 10.0, 25.0])
+
+        city = build_city(2000, seed=3)
+        energy = city["energy"]
+        energy.operate("report_consumption")
+        self.assertEqual(energy.get_status()["current_consumption"], sum(meter.power() for meter in energy.ledger.meters))
+        city["lighting"].lights.load_values(bytes([100]) * len(city["lighting"].lights))
+        energy.operate("report_consumption")
+        self.assertTrue(energy.what_if()["overloaded"])
+        self.assertIn("overloaded substations after: []", energy.operate("plan_load_shedding"))
+
+class TestFleetStore(unittest.TestCase):
+
+    def test_09_fleet_store_views(self):
+        """Test the columnar fleet store and its component views."""
+        fleet = TrafficLightFleet()
+        fleet.extend(first_id=100, count=1000)
+        self.assertEqual(len(fleet), 1000)
+        self.assertEqual(fleet[-1].light_id, 1099)
+        self.assertFalse(hasattr(fleet[0], "__dict__"))
+        self.assertEqual(fleet[5].operate(), "TrafficLight 105 changed to Green")
+        self.assertEqual(fleet[5], fleet[5])
+        self.assertEqual(fleet[5].get_status(), "Light 105: Green")
+        self.assertEqual(fleet[6].state, "Red")
+
+        lights = LightFleet(HalogenLight)
+        lights.append(7)
+        self.assertEqual(lights[0].get_status(), "Halogen Light 7: 70%")
+        self.assertTrue(50 <= lights[0].brightness <= 100)
+        standalone = LEDLight(3)
+        standalone.operate()
+        self.assertIn("LED Light 3:", standalone.get_status())
+
+    def test_10_batch_operate(self):
+        """Test the vectorized fleet-wide operate path."""
+        fleet = TrafficLightFleet()
+        fleet.extend(first_id=1, count=3)
+        fleet[1].operate()
+        fleet.advance_all()
+        self.assertEqual([light.state for light in fleet], ["Green", "Yellow", "Green"])
+        self.assertEqual(fleet.describe_changes()[1], "TrafficLight 2 changed to Yellow")
+
+        lights = LightFleet(LEDLight)
+        lights.extend(first_id=1, count=10000)
+        lights.randomize_all()
+        self.assertTrue(all(30 <= b <= 100 for b in lights.values))
+        self.assertEqual(len(set(lights.values)), 71)
+
+        controller = get_controller()
+        result = controller.operate_subsystem("transport", "optimize_flow", detail=False)
+        self.assertEqual(result, "Transport: Optimized traffic flow. Changes: 3 lights updated")
+
+    def test_19_bulk_factories(self):
+        """Test bulk fleet construction in the factories and managers."""
+        factory = TrafficLightFactory(next_id=10)
+        factory.create_component()
+        self.assertEqual(factory.create_many(1000), range(11, 1011))
+        self.assertEqual(factory.create_from_spec({"count": 2, "state": "Green"}), range(1011, 1013))
+        self.assertEqual(factory.create_component().light_id, 1013)
+        self.assertEqual(factory.fleet[-2].get_status(), "Light 1012: Green")
+        self.assertEqual(len(factory.fleet), 1004)
+
+        lighting = LightingManager(fleet_size=500_000)
+        self.assertEqual(len(lighting.lights), 500_000)
+        self.assertEqual(lighting.lights[-1].get_status(), "LED Light 500000: 50%")
+        self.assertEqual(lighting.factory.create_from_spec({"count": 1, "brightness": 80}), range(500_001, 500_002))
+        self.assertEqual(len(TransportManager(fleet_size=0).components), 0)
+
+    def test_27_road_network(self):
+        """Test the CSR road graph, spatial queries and green-wave corridors."""
+        network = RoadNetwork.grid(rows=20, cols=30, spacing=100.0)
+        self.assertEqual(len(network), 600)
+        self.assertEqual(sorted(network.neighbors(31)), [1, 30, 32, 61])
+        self.assertEqual(sorted(network.neighbors(0)), [1, 30])
+        for x, y, radius in ((0.0, 0.0, 150.0), (1234.5, 987.0, 500.0), (-900.0, 0.0, 100.0)):
+            expected = [node for node in range(len(network))
+                        if (network.xs[node] - x) ** 2 + (network.ys[node] - y) ** 2 <= radius ** 2]
+            self.assertEqual(network.within(x, y, radius), expected)
+        path = network.shortest_path(0, 62)
+        self.assertEqual((path[0], path[-1], len(path)), (0, 62, 5))
+        with self.assertRaises(ValueError):
+            RoadNetwork.from_edges([0, 1], [0, 0], []).shortest_path(0, 1)
+
+        transport = TransportManager(network=network, tick_seconds=5.0)
+        self.assertEqual(len(transport.components), 600)
+        self.assertEqual(transport.signals_within(0.0, 0.0, 100.0), [1, 2, 31])
+        corridor = transport.add_corridor(0, 29, speed_kmh=36.0)
+        self.assertEqual(corridor, list(range(30)))
+        # At 10 m/s and 5 s per step the platoon reaches intersection k after 2k steps:
+        # every light along the corridor must be green exactly then.
+        arrivals = {node: round(distance / 10.0 / 5.0) for node, distance in zip(corridor, network.distances_along(corridor))}
+        for step in range(max(arrivals.values()) + 1):
+            for node, arrival in arrivals.items():
+                if arrival == step:
+                    self.assertEqual(transport.components[node].state, "Green")
+            transport.operate("optimize_flow", detail=False)
+        self.assertEqual(green_wave(network, [0, 1], 36.0, 5.0), {0: STATE_CODES["Green"], 1: STATE_CODES["Yellow"]})
+        self.assertIn("1 green-wave corridors", transport.operate("green_wave"))
+        with self.assertRaises(ValueError):
+            TransportManager().signals_within(0, 0, 100)
+
+        metrics = bench_network(intersections=400, queries=10)
+        self.assertEqual(metrics["intersections"], 400)
+        self.assertLess(metrics["query_s"], 0.01)
+
+    def test_28_vehicle_flow(self):
+        """Test the bulk vehicle queue simulation behind the traffic lights."""
+        fleet = TrafficLightFactory(next_id=1)
+        fleet.create_many(1000)
+        flow = TrafficFlow(fleet.fleet, random.Random(5), arrival_per_hour=1800, discharge_per_hour=3600)
+        # All lights are red: vehicles only queue up.
+        for _ in range(10):
+            self.assertEqual(flow.step(), 0)
+        lengths = flow.queue_lengths()
+        self.assertEqual(sum(lengths), flow.queued)
+        self.assertEqual(flow.queued, flow.arrived)
+        self.assertAlmostEqual(flow.arrived / 10_000, 0.5, delta=0.05)
+
+        fleet.fleet.load_values(bytes([STATE_CODES["Green"]]) * 1000)
+        flow.set_rates(arrival_per_hour=0)
+        served = sum(flow.step() for _ in range(200))
+        self.assertEqual(served, flow.arrived)
+        self.assertEqual(flow.queued, 0)
+        self.assertEqual(max(flow.queue_lengths()), 0)
+        self.assertGreater(flow.metrics()["mean_delay_s"], 5)
+
+        fleet.create_many(5)
+        flow.set_rates(arrival_per_hour=3600 * 255 / 256, lanes=[1002])
+        flow.step()
+        self.assertEqual(len(flow), 1005)
+        self.assertEqual(flow.queue_lengths()[1002] + flow.served, 1 + served)
+
+        with patch('sys.stdout', new=StringIO()), SmartCityController.scoped(seed=4) as controller:
+            for _ in range(30):
+                controller.operate_subsystem("transport", "optimize_flow")
+            traffic = controller.get_subsystem_status("transport")["traffic"]
+            self.assertEqual(traffic["lanes"], 3)
+            self.assertEqual(traffic["vehicles_served"], controller.get_manager("transport").flow.served)
+            flow = controller.get_manager("transport").flow
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "city.ckpt")
+                controller.save_checkpoint(path)
+                saved = (list(flow.queue_lengths()), flow.metrics())
+                for _ in range(5):
+                    controller.operate_subsystem("transport", "optimize_flow")
+                controller.restore_checkpoint(path)
+                self.assertEqual((list(flow.queue_lengths()), flow.metrics()), saved)
+
+    def test_29_event_driven_lighting(self):
+        """Test motion zones, schedule changes and the lighting power feedback."""
+        lighting = LightingManager(random.Random(3), fleet_size=10_000, zone_size=50)
+        lights, zones = lighting.lights, lighting.zones
+        self.assertEqual(zones.zones, 200)
+        lighting.operate("adjust_brightness")
+        self.assertIn((None, 40), zones.last_changes)
+
+        changed = []
+        lights.change_listener = lambda light_id, old, new: changed.append(light_id)
+        for _ in range(30):
+            del changed[:]
+            version = lights.version
+            changes = zones.tick()
+            touched = {zone for zone, _ in changes}
+            self.assertTrue({(light_id - 1) // 50 for light_id in changed} <= touched)
+            self.assertEqual(lights.version - version, len(changes))
+            for zone in range(zones.zones):
+                active = zones.active_until[zone] > zones.now
+                self.assertEqual(lights.values[zone * 50], 100 if active else 40)
+            self.assertEqual(zones.active_zones, sum(until > zones.now for until in zones.active_until))
+        lights.change_listener = None
+        self.assertLess(zones.active_zones, 100)
+        self.assertEqual(lighting.power_watts(), sum(lights.values) * LEDLight.rated_watts / 100)
+
+        # 06:00: the baseline drops to the LEDs' minimum; lit zones stay lit.
+        zones.now = 6 * 3600 - 60
+        self.assertIn("all zones 30%", lighting.operate("adjust_brightness"))
+        self.assertEqual(zones.baseline, 30)
+        self.assertLessEqual(set(lights.values), {30, 100})
+        lights.randomize_all()
+        lights.fill(0, 3, 77)
+        self.assertEqual(lights.values[:4], bytearray([77, 77, 77, lights.values[3]]))
+        self.assertEqual(lighting.power_watts(), sum(lights.values) * LEDLight.rated_watts / 100)
+        meter = meters_for(lighting=lighting)[0]
+        self.assertEqual(meter.power(), lighting.power_watts())
+        self.assertEqual(lighting.telemetry()["active_zones"], zones.active_zones)
+
+        lighting.factory.create_many(25)
+        lighting.operate("adjust_brightness")
+        self.assertEqual(zones.zones, 201)
+        self.assertEqual(lighting.get_status()["zones"], 201)
+        self.assertEqual(len(zones.active_until), zones.zones)
+        self.assertEqual(zones.nbytes, 201 * 9)
+
+        # Energy reads lighting's power under its own lock; that must not invert the checkpoint lock order.
+        with tempfile.TemporaryDirectory() as tmp, SmartCityController.scoped(seed=1, announce=False) as controller:
+            path = os.path.join(tmp, "city.ckpt")
+            self.assertFalse(run_concurrently(lambda: controller.save_checkpoint(path),
+                                              lambda: controller.operate_subsystem("energy", "report_consumption")))
+
+    def test_13_dirty_tracking(self):
+        """Test incremental status rendering and the controller snapshot cache."""
+        fleet = TrafficLightFleet()
+        fleet.extend(first_id=1, count=4)
+        self.assertEqual(fleet.statuses()[2], "Light 3: Red")
+        version = fleet.version
+        fleet[2].operate()
+        self.assertGreater(fleet.version, version)
+        self.assertEqual(fleet._dirty, {2})
+        statuses = fleet.statuses()
+        self.assertEqual(statuses, ("Light 1: Red", "Light 2: Red", "Light 3: Green", "Light 4: Red"))
+        # Unchanged fleets hand out the same immutable tuple; no copy per poll.
+        self.assertIs(fleet.statuses(), statuses)
+        with self.assertRaises(TypeError):
+            statuses[0] = "mutated"
+        fleet.extend(first_id=5, count=1)
+        self.assertEqual(fleet.statuses()[4], "Light 5: Red")
+
+        controller = get_controller()
+        snapshot = controller.snapshot()
+        version = controller.status_version()
+        self.assertIs(controller.snapshot()["transport"]["components"], snapshot["transport"]["components"])
+        # Snapshots are copies at the boundary: mutating one leaves the cache intact.
+        snapshot["transport"]["traffic"]["lanes"] = -1
+        snapshot["transport"]["manager_status"] = "mutated"
+        self.assertEqual(controller.snapshot()["transport"], controller.get_subsystem_status("transport"))
+        controller.operate_subsystem("transport", "optimize_flow", detail=False)
+        self.assertGreater(controller.status_version(), version)
+        self.assertEqual(controller.snapshot()["transport"], controller.get_subsystem_status("transport"))
+
+    def test_14_change_feed(self):
+        """Test the push-based change feed and its backpressure policies."""
+        controller = get_controller()
+        transport = controller.get_manager("transport").components
+        before = [light.state for light in transport]
+        with controller.subscribe() as subscription:
+            with patch('sys.stdout', new=StringIO()):
+                controller.run_simulation()
+            events = subscription.drain()
+        tick = events[0].tick
+        transport_events = [e for e in events if e.subsystem == "transport"]
+        self.assertEqual([(e.component_id, e.old) for e in transport_events], list(zip([1, 2, 3], before)))
+        self.assertTrue(all(e.tick == tick for e in events))
+        self.assertIsNone(transport.change_listener)
+
+        feed = ChangeFeed()
+        fleet = TrafficLightFleet()
+        fleet.extend(first_id=1, count=5)
+        feed.connect("transport", fleet)
+        subscription = feed.subscribe(maxsize=2, policy=DROP_NEWEST)
+        fleet[0].operate()
+        fleet.advance_all()
+        self.assertEqual(subscription.dropped, 4)
+        self.assertEqual(list(subscription.stream(timeout=0)), [("transport", 1, "Red", "Green", 0), ("transport", 1, "Green", "Yellow", 0)])
+        subscription.close()
+        self.assertEqual(list(subscription), [])
+
+        async def consume():
+            with feed.subscribe(maxsize=10) as sub:
+                fleet[4].operate()
+                return await sub.__anext__()
+        self.assertEqual(asyncio.run(consume()), ("transport", 5, "Green", "Yellow", 0))
+
+        # Publishers hold their subsystem's lock, so blocking them needs a bound.
+        with self.assertRaises(ValueError):
+            feed.subscribe(maxsize=1, policy=BLOCK)
+        with feed.subscribe(maxsize=1, policy=BLOCK, block_timeout=0.01) as sub:
+            fleet.advance_all()
+            self.assertEqual((len(sub), sub.dropped), (1, 4))
+
+        # Cancelling an async consumer leaves no worker thread blocked in get(): the loop can shut down.
+        sub = feed.subscribe()
+        async def cancelled():
+            task = asyncio.ensure_future(sub.__anext__())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        thread = threading.Thread(target=asyncio.run, args=(cancelled(),), daemon=True)
+        thread.start()
+        thread.join(2.0)
+        try:
+            self.assertFalse(thread.is_alive())
+        finally:
+            sub.close()
+
+    def test_18_tick_scheduler(self):
+        """Test per-subsystem rates on a virtual clock and missed-deadline accounting."""
+        controller = get_controller()
+        scheduler = controller.scheduler()
+        stats = scheduler.run_for(3600)
+        self.assertEqual(scheduler.clock.now(), 3600)
+        self.assertEqual({name: s["runs"] for name, s in stats.items()}, {"transport": 3601, "lighting": 61, "security": 13, "energy": 5})
+        self.assertEqual(sum(s["missed"] for s in stats.values()), 0)
+
+        clock = VirtualClock()
+        scheduler = TickScheduler(controller, {"transport": 1.0}, clock)
+        with patch.object(controller, "operate_subsystem", side_effect=lambda *args, **kwargs: clock.advance(2.5)):
+            stats = scheduler.run_until(10)
+        self.assertEqual(stats["transport"]["runs"], 4)
+        self.assertEqual(stats["transport"]["missed"], 8)
+        self.assertEqual(stats["transport"]["late"], 0)
+
+        clock = VirtualClock()
+        scheduler = TickScheduler(controller, {"transport": 1.0}, clock, catch_up=True)
+        with patch.object(controller, "operate_subsystem", side_effect=lambda *args, **kwargs: clock.advance(2.5)):
+            stats = scheduler.run_until(10)
+        self.assertEqual((stats["transport"]["runs"], stats["transport"]["late"], stats["transport"]["missed"]), (11, 10, 0))
+
+    def test_20_energy_report_engine(self):
+        """Test metered consumption, rollups and the streaming report formats."""
+        lights = LightFleet(LEDLight)
+        lights.extend(first_id=1, count=100_000)
+        ledger = ConsumptionLedger(bucket_seconds=3600)
+        ledger.add_meter(FleetMeter("lighting", lights, watts_per_unit=1.0))
+        ledger.add_meter(PowerMeter("security", "patrol", lambda: 1000))
+        ledger.sample(0)
+        ledger.sample(1800)
+        lights[0].brightness = 100
+        ledger.sample(5400)
+        summary = ledger.summary()
+        self.assertAlmostEqual(summary["categories"]["security"]["kwh"], 1.5)
+        self.assertAlmostEqual(summary["categories"]["lighting"]["kwh"], 100_000 * 50 * 1.5 / 1000 + 0.05)
+        # Both intervals start within the first hour, so they roll up into one bucket.
+        self.assertEqual([(b["start"], b["kwh"]["security"]) for b in summary["buckets"]], [(0, 1.5)])
+        components = dict(ledger.meters[0].component_energy())
+        self.assertAlmostEqual(components[1], 50 * 0.5 + 100 * 1.0)
+        self.assertAlmostEqual(components[2], 50 * 1.5)
+
+        energy = EnergyManager(clock=VirtualClock())
+        energy.add_meter(PowerMeter("security", "patrol", lambda: 2000))
+        energy.sample()
+        energy.clock.advance(3600)
+        out = StringIO()
+        energy.stream_report(out, format="jsonl")
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r["section"] for r in records], ["header", "category", "bucket", "component", "footer"])
+        self.assertAlmostEqual(records[0]["total_kwh"], 2.0)
+        out = StringIO()
+        energy.stream_report(out, format="csv", components=False)
+        self.assertTrue(out.getvalue().startswith("section,category,component_id"))
+        self.assertIn("Security Usage: 2.000 kWh", energy.operate("report_consumption"))
+        # Report windows read as simulated time under a VirtualClock and as local timestamps under a WallClock.
+        self.assertIn("Window: T+0:00:00 - T+1:00:00\n", energy.operate("report_consumption"))
+        self.assertEqual(ledger.header_record()["window"], "0s - 5400s")
+        live = EnergyManager()
+        live.sample()
+        window = live.operate("report_consumption").splitlines()[2]
+        self.assertRegex(window, r"^Window: \d{4}-\d\d-\d\d \d\d:\d\d:\d\d - \d{4}-\d\d-\d\d \d\d:\d\d:\d\d$")
+
+    def test_21_telemetry_store(self):
+        """Test ring-buffer retention, downsampling tiers and controller telemetry."""
+        store = TelemetryStore(raw_capacity=100)
+        for second in range(7200):
+            store.record("x.value", second, second % 10)
+        self.assertEqual(store.query("x.value", 7195, 7197), [(7195, 5), (7196, 6)])
+        self.assertEqual(store.query("x.value", 0, 120)[1], (60, 60, 4.5, 0, 9))
+        self.assertEqual([p.count for p in store.query("x.value", 0, 7200, "1h")], [3600, 3600])
+        with self.assertRaises(ValueError):
+            store.record("x.value", 10, 1)
+
+        controller = get_controller()
+        stats = controller.scheduler(periods={"transport": 1.0}, telemetry_period=60).run_for(600)
+        self.assertEqual(stats["telemetry"]["runs"], 11)
+        self.assertIn("energy.current_consumption", controller.telemetry_names())
+        now = controller.record_telemetry()
+        points = controller.query_telemetry("transport.green", now - 600, now + 1)
+        self.assertEqual(len(points), 12)
+        self.assertEqual(sum(controller.query_telemetry("transport." + state, now, now + 1)[0].value for state in ("red", "green", "yellow")), 3)
+
+    def test_22_checkpoint_restore(self):
+        """Test full and incremental checkpoints and restoring them."""
+        controller = get_controller()
+        lighting = controller.get_manager("lighting")
+        lights = lighting.lights
+        original = (bytes(lights.ids), bytes(lights.values), lighting.factory.light_id_counter)
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "city.ckpt")
+                lighting.factory.create_many(100_000)
+                self.assertFalse(controller.save_checkpoint(path)["incremental"])
+                lights[5].brightness = 100 if lights[5].brightness != 100 else 30
+                stats = controller.save_checkpoint(path)
+                self.assertTrue(stats["incremental"])
+                self.assertIn(stats["pages_written"], (1, 2))
+                expected_draw = lights.rng.random()
+                saved = lights.statuses()
+
+                controller.operate_subsystem("lighting", "adjust_brightness")
+                lighting.factory.create_many(10)
+                controller.restore_checkpoint(path)
+                self.assertEqual(lights.rng.random(), expected_draw)
+                self.assertEqual(lights.statuses(), saved)
+                self.assertEqual(lighting.factory.create_many(1), range(original[2] + 100_000, original[2] + 100_001))
+        finally:
+            lights.load_columns(original[0], original[1])
+            lighting.factory.light_id_counter = original[2]
+
+        # A restored city carries on exactly as the saved one did: zone holds, sensors, the schedule and incidents included.
+        with tempfile.TemporaryDirectory() as tmp, SmartCityController.scoped(
+                seed=5, announce=False, options={"lighting": {"fleet_size": 2000, "motion_per_hour": 60.0}}) as controller:
+            path = os.path.join(tmp, "city.ckpt")
+            controller.run_cycles(30)
+            controller.save_checkpoint(path)
+            zones = controller.get_manager("lighting").zones
+
+            def city_status():
+                status = [controller.get_subsystem_status(name) for name in ("transport", "lighting", "security")]
+                del status[2]["incidents"]["events_per_s"]  # wall-clock throughput
+                return status
+            expected, active = [], []
+            for _ in range(20):
+                controller.run_cycles(1)
+                expected.append(city_status())
+                active.append(zones.active_zones)
+            self.assertTrue(any(active))
+            controller.restore_checkpoint(path)
+            for statuses, count in zip(expected, active):
+                controller.run_cycles(1)
+                self.assertEqual(city_status(), statuses)
+                self.assertEqual(zones.active_zones, count)
+
+class TestCommandLine(unittest.TestCase):
+
+    def test_26_batch_cli_and_service(self):
+        """Test the non-interactive CLI commands and the line protocol service."""
+        out = StringIO()
+        self.assertEqual(cli_main(["run", "--ticks", "4", "--lights", "20", "--seed", "1", "--format", "json"], out), 0)
+        summary = json.loads(out.getvalue())
+        self.assertEqual((summary["tick"], summary["ticks"]), (4, 4))
+        self.assertEqual(summary["components"], {"transport": 3, "lighting": 20})
+
+        out = StringIO()
+        self.assertEqual(cli_main(["status", "transport", "--format", "json"], out), 0)
+        self.assertEqual(json.loads(out.getvalue())["transport"]["components"], ["Light 1: Red", "Light 2: Red", "Light 3: Red"])
+        with patch('sys.stderr', new=StringIO()):
+            self.assertEqual(cli_main(["status", "parking"], StringIO()), 2)
+
+        with patch('sys.stdout', new=StringIO()), SmartCityController.scoped(seed=1) as controller:
+            protocol = LineProtocol(CommandProcessor(controller))
+            # Requests may be split anywhere; every chunk is answered with one write.
+            self.assertEqual(protocol.feed(b"pi"), b"")
+            output = protocol.feed(b"ng\nrun 2; version\noperate transport optimize_flow\nstatus parking\nsta")
+            responses = [json.loads(line) for line in output.decode().splitlines()]
+            self.assertEqual(responses[0], {"ok": True, "result": "pong"})
+            self.assertEqual(responses[1][0], {"ok": True, "result": {"tick": 2}})
+            self.assertTrue(responses[2]["ok"])
+            self.assertEqual(responses[3], {"ok": False, "error": "Subsystem 'parking' not found."})
+            self.assertEqual(protocol.feed(b"tus transport"), b"")
+            self.assertIn(b'"Light 1: ', protocol.finish())
+
+            written = []
+            serve(CommandProcessor(controller), BytesIO(b"summary\nquit\nping\n").read1, written.append)
+            self.assertEqual([json.loads(line)["result"] for line in b"".join(written).decode().splitlines()],
+                             [controller.summary(), "bye"])
+
+            with make_server(controller, port=0) as server:
+                threading.Thread(target=server.serve_forever, daemon=True).start()
+                with socket.create_connection(server.server_address) as client:
+                    client.sendall(b"ping; names\nquit\n")
+                    reply = client.makefile("rb").read().decode().splitlines()
+                server.shutdown()
+            self.assertEqual(json.loads(reply[0])[1]["result"], ["transport", "lighting", "security", "energy"])
+            self.assertEqual(json.loads(reply[1])["result"], "bye")
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_17_controller_metrics(self):
+        """Test controller metrics, their exports and the profiling hook."""
+        controller = get_controller()
+        controller.reset_metrics()
+        controller.operate_subsystem("transport", "optimize_flow")
+        self.assertEqual(controller.metrics()["operations"], {})
+
+        controller.enable_metrics(allocations=True)
+        try:
+            for _ in range(3):
+                controller.operate_subsystem("transport", "optimize_flow")
+            controller.get_subsystem_status("lighting")
+        finally:
+            controller.disable_metrics()
+        metrics = controller.metrics()
+        flow = metrics["operations"]["transport"]["optimize_flow"]
+        self.assertEqual(flow["count"], 3)
+        self.assertLessEqual(flow["p50_s"], flow["p99_s"])
+        self.assertEqual(metrics["operations"]["lighting"]["get_status"]["count"], 1)
+        self.assertEqual(metrics["components"]["transport"], 3)
+
+        text = controller.export_metrics()
+        self.assertIn('smartcity_operation_seconds_count{subsystem="transport",action="optimize_flow"} 3', text)
+        registry = MetricsRegistry()
+        registry.observe('pa"rk\\ing', "line\nbreak", 0.001)
+        self.assertIn('_count{subsystem="pa\\"rk\\\\ing",action="line\\nbreak"} 1', registry.to_prometheus())
+        self.assertIn('smartcity_components{subsystem="lighting"} 5', text)
+        self.assertEqual(json.loads(controller.export_metrics("json"))["operations"]["transport"]["optimize_flow"]["count"], 3)
+
+        # A tracemalloc session the caller started survives enable/disable.
+        tracemalloc.start()
+        try:
+            controller.enable_metrics(allocations=True)
+            controller.disable_metrics()
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+        with patch('sys.stdout', new=StringIO()):
+            report = controller.profile_cycle(limit=5)
+        self.assertIn("transport", report.result)
+        self.assertIn("function calls", report.stats)
+        controller.reset_metrics()
+
+class TestReproducibility(unittest.TestCase):
+
+    def test_15_seeded_streams(self):
+        """Test that seeded per-subsystem streams make runs reproducible."""
+        streams = RandomStreams(seed=42)
+        first = [streams.stream("lighting").random() for _ in range(3)]
+        streams.stream("energy").random()
+        streams.reseed(42)
+        self.assertEqual([streams.stream("lighting").random() for _ in range(3)], first)
+
+        city_a, city_b = build_city(100, seed=7), build_city(100, seed=7)
+        for city in (city_a, city_b):
+            city["lighting"].operate("adjust_brightness")
+        self.assertEqual(city_a["lighting"].get_status(), city_b["lighting"].get_status())
+        self.assertEqual(city_a["energy"].operate("report_consumption"), city_b["energy"].operate("report_consumption"))
+        self.assertEqual(len(city_a["transport"].components) + len(city_a["lighting"].lights), 100)
+
+    def test_16_benchmark_harness(self):
+        """Test the benchmark result document and regression check."""
+        results = run_benchmarks(scales=(10,), repeat=1, seed=1, network=False, incidents=False)
+        metrics = results["results"]["10"]
+        self.assertEqual(metrics["components"], 10)
+        self.assertEqual(compare(results, results), [])
+        faster = {"results": {"10": dict(metrics, tick_s=metrics["tick_s"] / 10 - 1, fleet_bytes=1)}}
+        regressions = compare(results, faster)
+        self.assertEqual(len(regressions), 2)
+        self.assertIn("fleet_bytes", regressions[1])
+
+        startup = results["startup"]
+        self.assertGreater(startup["import_s"], 0)
+        self.assertGreaterEqual(startup["first_status_s"], startup["import_s"])
+        slimmer = dict(results, startup=dict(startup, modules_loaded=1))
+        self.assertEqual(compare(results, slimmer), [f"startup: modules_loaded {startup['modules_loaded']} > 1.5 (baseline 1)"])
+        self.assertEqual(import_time("import time: 12 | 3456 | core.controller"), 0.003456)
+
+        # Timings are compared relative to the calibration run: a machine twice as slow is no regression.
+        calibration = results["calibration"]
+        self.assertGreater(calibration["reference_s"], 0)
+        steady = dict(calibration, spread=0.0)
+        slower = {"calibration": dict(steady, reference_s=steady["reference_s"] * 2),
+                  "results": {"10": dict(metrics, tick_s=metrics["tick_s"] * 2 + 0.01)}}
+        baseline = {"calibration": steady, "results": {"10": dict(metrics, tick_s=metrics["tick_s"] + 0.005)}}
+        self.assertEqual(compare(slower, baseline), [])
+        self.assertEqual(len(compare(dict(slower, calibration=steady), baseline)), 1)
+
+    def test_33_scenario_sweep(self):
+        """Test parameter sweeps, command log replay and the columnar results file."""
+        halogen = LightingManager(random.Random(1), fleet_size=10, light_type="halogen")
+        self.assertIsInstance(halogen.factory, HalogenFactory)
+        self.assertIsInstance(halogen.lights[0], HalogenLight)
+        with self.assertRaises(ValueError):
+            LightingManager(light_type="neon")
+
+        scenarios = parameter_grid({"lighting.light_type": ["led", "halogen"], "seed": [1, 2]}, ticks=3,
+                                   options={"lighting": {"fleet_size": 200}})
+        self.assertEqual([s.parameters() for s in scenarios][1],
+                         {"seed": 2, "ticks": 3, "lighting.fleet_size": 200, "lighting.light_type": "led"})
+        with self.assertRaises(ValueError):
+            parameter_grid({"fleet_size": [1]})
+
+        serial, parallel = run_sweep(scenarios, workers=1), run_sweep(scenarios, workers=2)
+        timing = ("cpu_s", "elapsed_s")
+        strip = lambda results: [{k: v for k, v in row.items() if k not in timing} for row in results.rows()]
+        self.assertEqual(strip(serial), strip(parallel))
+        self.assertEqual(serial["scenario"], ["scenario-1", "scenario-2", "scenario-3", "scenario-4"])
+        self.assertEqual(serial["tick"], [3] * 4)
+        # Same seed, same motion: halogen lights draw at least 2.5x the power of LEDs (higher rating and floor).
+        power = serial["lighting.power_w"]
+        self.assertGreaterEqual(power[2], 2.5 * power[0])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "results.bin")
+            serial.save(path)
+            loaded = ScenarioResults.load(path)
+            self.assertEqual(loaded.rows(), serial.rows())
+            self.assertEqual(len(loaded), 4)
+            # Integer columns stay integers with missing rows, and never round through a double.
+            mixed = ScenarioResults({"queued": [3, None, 2 ** 53 + 1], "huge": [2 ** 64, 1, None],
+                                     "power": [1.5, None, 2], "empty": [None, None, None]})
+            mixed.save(path)
+            loaded = ScenarioResults.load(path)
+            self.assertEqual(loaded.columns, {"queued": [3, None, 2 ** 53 + 1], "huge": [2 ** 64, 1, None],
+                                              "power": [1.5, None, 2.0], "empty": [None, None, None]})
+            self.assertIsInstance(loaded["queued"][0], int)
+            with self.assertRaises(ValueError):
+                ScenarioResults.load(self._checkpoint(tmp))
+
+            # A command log recorded by the service replays to the same state.
+            log_path = os.path.join(tmp, "commands.log")
+            with open(log_path, "w") as log, SmartCityController.scoped(seed=5, announce=False) as controller:
+                processor = CommandProcessor(controller, log)
+                for command in ("operate lighting adjust_brightness", "status", "run 2", "bogus"):
+                    processor.execute(command)
+                recorded = controller.get_manager("lighting").get_status()
+            self.assertEqual(read_command_log(log_path), ["operate lighting adjust_brightness", "run 2"])
+            row = run_scenario(Scenario("replay", seed=5, ticks=0, commands=read_command_log(log_path)))
+            self.assertEqual((row["tick"], row["commands"], row["failed_commands"]), (2, 2, 0))
+            self.assertEqual(row["lighting.power_w"], recorded["power_w"])
+
+            out = StringIO()
+            self.assertEqual(cli_main(["sweep", "--set", "lighting.fleet_size=10,20", "--replay", log_path,
+                                       "--ticks", "1", "--workers", "1", "--format", "json"], out), 0)
+            self.assertEqual(json.loads(out.getvalue())["results"]["tick"], [3, 3])
+
+    def _checkpoint(self, directory):
+        path = os.path.join(directory, "city.ckpt")
+        with SmartCityController.scoped(seed=1, announce=False) as controller:
+            controller.save_checkpoint(path)
+        return path
+
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False)